@@ -1,15 +1,24 @@
 # -*- coding: utf-8 -*-
-from typing import Union, Tuple, List, Dict, Callable
+from typing import Union, Tuple, List, Dict, Callable, Set
 
 from utils import logger
 import utils
 import logging
 import math
 from datetime import datetime
-from time import time
+from time import monotonic, time
 from abc import ABC, abstractmethod
 import sys
 
+POLL_TIER_FAST: str = "fast"
+"""
+Data read every poll, e.g. voltage, current and SoC
+"""
+POLL_TIER_MEDIUM: str = "medium"
+"""
+Data read every `POLL_INTERVAL_MEDIUM`, e.g. single cell voltages and temperatures, which the charge control does not need every poll
+"""
+
 
 class Protection(object):
     """
@@ -281,6 +290,17 @@ class Battery(ABC):
     use the individual implementations as type Battery and work with it.
     """
 
+    @classmethod
+    def is_own_can_frame(cls, frame_id: int) -> bool:
+        """
+        Check if a received CAN frame ID is sent by or to a BMS of this type, so the BMS type is recognized
+        on the bus before it's tested, see `utils_detection.match_can_frames()`.
+
+        :param frame_id: Arbitration ID of the received frame
+        :return: True if the frame belongs to this BMS type with any address
+        """
+        return False
+
     def __init__(self, port: str, baud: int, address: str):
         self.port: str = port
         self.baud_rate: int = baud
@@ -289,6 +309,33 @@ class Battery(ABC):
         self.role: str = "battery"
         self.type: str = "Generic"
         self.poll_interval: int = 1000
+        self.link_timing: object = None
+        """
+        Timing model of the connection (utils.LinkTiming), if the driver uses one. The learned values are published on the dbus
+        """
+        self.poll_timing: utils.PollTiming = utils.PollTiming(self.poll_interval)
+        """
+        Adaptive poll interval, set up with `poll_interval` when the polling starts. The values are published on the dbus
+        """
+        self.cycle_timing: utils.CycleTiming = utils.CycleTiming(
+            self.port[self.port.rfind("/") + 1 :] + ("__" + self.address.hex() if isinstance(self.address, (bytes, bytearray)) else ""),
+            utils.TIMING_TRACE_CYCLES,
+        )
+        """
+        Duration of the phases of each poll. The values are published on the dbus
+        """
+        self.poll_tier_intervals: Dict[str, float] = {
+            POLL_TIER_FAST: 0,
+            POLL_TIER_MEDIUM: utils.POLL_INTERVAL_MEDIUM,
+        }
+        """
+        Interval in milliseconds of each poll tier, see `get_due_poll_tiers()`
+        """
+        self.poll_tier_refreshed: Dict[str, float] = {}
+        """
+        Monotonic time of the last successful refresh of each poll tier
+        """
+        self._poll_tiers_checked: float = 0.0
         self.dbus_external_objects: dict = None
         self.online: bool = True
         self.connection_info: str = "Initializing..."
@@ -522,6 +569,38 @@ class Battery(ABC):
         """
         return False
 
+    def get_due_poll_tiers(self) -> Set[str]:
+        """
+        Get the poll tiers, whose data has to be read in this refresh.
+
+        Drivers, which support poll tiers, call it at the start of `refresh_data()`, only send the requests of
+        the due tiers and call `set_poll_tiers_refreshed()` at the end. The fast tier is always due, the medium
+        tier after its interval or if they were not read successfully since.
+
+        :return: Set of `POLL_TIER_FAST` and `POLL_TIER_MEDIUM`
+        """
+        self._poll_tiers_checked = now = monotonic()
+        due = set()
+        for tier, interval in self.poll_tier_intervals.items():
+            refreshed = self.poll_tier_refreshed.get(tier)
+            # allow half a poll interval of jitter, else a tier is often read one poll too late
+            if refreshed is None or (now - refreshed) * 1000 >= interval - self.poll_interval / 2:
+                due.add(tier)
+
+        return due
+
+    def set_poll_tiers_refreshed(self, tiers: Set[str], result: bool) -> None:
+        """
+        Mark the poll tiers as refreshed, if all their data was read successfully.
+
+        :param tiers: Poll tiers returned by `get_due_poll_tiers()`
+        :param result: Result of the refresh, if False the tiers are read again with the next refresh
+        :return: None
+        """
+        if result:
+            for tier in tiers:
+                self.poll_tier_refreshed[tier] = self._poll_tiers_checked
+
     def to_temperature(self, sensor: int, value: float) -> None:
         """
         Keep the temp value between -20 and 100 to handle sensor issues or no data.
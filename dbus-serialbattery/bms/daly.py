@@ -3,18 +3,21 @@
 # Notes
 # Updated by https://github.com/transistorgit
 
-from battery import Battery, Cell
+from battery import Battery, Cell, POLL_TIER_MEDIUM
 from utils import (
     bytearray_to_string,
-    open_serial_port,
+    serial_port_manager,
     logger,
+    FrameParser,
+    FRAME_FORMAT_DALY,
+    get_link_timing,
     AUTO_RESET_SOC,
     BATTERY_CAPACITY,
     INVERT_CURRENT_MEASUREMENT,
     MIN_CELL_VOLTAGE,
 )
 from struct import unpack_from, pack_into
-from time import sleep, time
+from time import time
 from datetime import datetime
 from re import sub
 import sys
@@ -40,6 +43,9 @@ class Daly(Battery):
         self.trigger_force_disable_charge = None
         self.cells_volts_data_lastreadbad = False
         self.last_charge_mode = self.charge_mode
+        self.frame_parser = FrameParser(FRAME_FORMAT_DALY)
+        # the Daly needs a short pause between two commands, the delay is learned starting from the former fixed 20 ms
+        self.link_timing = get_link_timing(port, "Daly", 0.020, delay_min=0.002)
         # list of available callbacks, in order to display the buttons in the GUI
         self.available_callbacks = [
             "force_charging_off_callback",
@@ -81,7 +87,7 @@ class Daly(Battery):
         """
         result = False
         try:
-            with open_serial_port(self.port, self.baud_rate) as ser:
+            with serial_port_manager.connection(self.port, self.baud_rate) as ser:
                 result = self.read_status_data(ser)
                 # get first data to show in startup log, only if result is true
                 result = result and self.read_soc_data(ser)
@@ -114,10 +120,13 @@ class Daly(Battery):
 
     def refresh_data(self):
         result = False
+        # the FET, cell voltage range and alarm data is needed by the charge control every poll,
+        # the temperatures, balancing state and single cell voltages not
+        poll_tiers = self.get_due_poll_tiers()
 
         # Open serial port to be used for all data reads instead of opening multiple times
         try:
-            with open_serial_port(self.port, self.baud_rate) as ser:
+            with serial_port_manager.connection(self.port, self.baud_rate) as ser:
                 result = self.read_soc_data(ser)
                 self.reset_soc = self.soc if self.soc else 0
                 if self.runtime > 0.200:  # TROUBLESHOOTING for no reply errors
@@ -142,20 +151,23 @@ class Daly(Battery):
                 if self.runtime > 0.200:  # TROUBLESHOOTING for no reply errors
                     logger.debug("  |- refresh_data: read_alarm_data - result: " + str(result) + " - runtime: " + str(f"{self.runtime:.1f}") + "s")
 
-                # result placed last to ensure all data is read anyway
-                result = self.read_temperature_range_data(ser) and result
-                if self.runtime > 0.200:  # TROUBLESHOOTING for no reply errors
-                    logger.debug("  |- refresh_data: read_temperature_range_data - result: " + str(result) + " - runtime: " + str(f"{self.runtime:.1f}") + "s")
+                if POLL_TIER_MEDIUM in poll_tiers:
+                    # result placed last to ensure all data is read anyway
+                    result = self.read_temperature_range_data(ser) and result
+                    if self.runtime > 0.200:  # TROUBLESHOOTING for no reply errors
+                        logger.debug(
+                            "  |- refresh_data: read_temperature_range_data - result: " + str(result) + " - runtime: " + str(f"{self.runtime:.1f}") + "s"
+                        )
 
-                # result placed last to ensure all data is read anyway
-                result = self.read_balance_state(ser) and result
-                if self.runtime > 0.200:  # TROUBLESHOOTING for no reply errors
-                    logger.debug("  |- refresh_data: read_balance_state - result: " + str(result) + " - runtime: " + str(f"{self.runtime:.1f}") + "s")
+                    # result placed last to ensure all data is read anyway
+                    result = self.read_balance_state(ser) and result
+                    if self.runtime > 0.200:  # TROUBLESHOOTING for no reply errors
+                        logger.debug("  |- refresh_data: read_balance_state - result: " + str(result) + " - runtime: " + str(f"{self.runtime:.1f}") + "s")
 
-                # result placed last to ensure all data is read anyway
-                result = self.read_cells_volts(ser) and result
-                if self.runtime > 0.200:  # TROUBLESHOOTING for no reply errors
-                    logger.debug("  |- refresh_data: read_cells_volts - result: " + str(result) + " - runtime: " + str(f"{self.runtime:.1f}") + "s")
+                    # result placed last to ensure all data is read anyway
+                    result = self.read_cells_volts(ser) and result
+                    if self.runtime > 0.200:  # TROUBLESHOOTING for no reply errors
+                        logger.debug("  |- refresh_data: read_cells_volts - result: " + str(result) + " - runtime: " + str(f"{self.runtime:.1f}") + "s")
 
                 self.write_charge_discharge_mos(ser)
 
@@ -165,6 +177,8 @@ class Daly(Battery):
         except OSError:
             logger.warning("Couldn't open serial port")
 
+        self.set_poll_tiers_refreshed(poll_tiers, result)
+
         if not result:  # TROUBLESHOOTING for no reply errors
             logger.info(f"refresh_data: result: {result}." + " If you don't see this warning very often, you can ignore it.")
 
@@ -575,8 +589,7 @@ class Daly(Battery):
             return False
 
         # wait shortly, else the Daly is not ready and throws a lot of no reply errors
-        # if you see a lot of errors, try to increase in steps of 0.005
-        sleep(0.020)
+        self.link_timing.wait()
 
         cmd = bytearray(13)
         now = datetime.now()
@@ -604,9 +617,12 @@ class Daly(Battery):
 
         ser.flushOutput()
         ser.flushInput()
+        self.frame_parser.reset()
+        time_start = time()
         ser.write(cmd)
 
         reply = self.read_sentence(ser, self.command_set_soc)
+        self.link_timing.record(None if reply is False else time() - time_start)
         if reply is False or reply[0] != 1:
             logger.error("write soc failed")
         return True
@@ -640,16 +656,11 @@ class Daly(Battery):
         return False
 
     def write_charge_discharge_mos(self, ser):
-        # wait shortly, else the Daly is not ready and throws a lot of no reply errors
-        # if you see a lot of errors, try to increase in steps of 0.005
-        sleep(0.020)
-
         if self.trigger_force_disable_charge is None and self.trigger_force_disable_discharge is None:
             return False
 
         # wait shortly, else the Daly is not ready and throws a lot of no reply errors
-        # if you see a lot of errors, try to increase in steps of 0.005
-        sleep(0.020)
+        self.link_timing.wait()
 
         cmd = bytearray(self.command_base)
 
@@ -661,9 +672,12 @@ class Daly(Battery):
             self.trigger_force_disable_charge = None
             ser.flushOutput()
             ser.flushInput()
+            self.frame_parser.reset()
+            time_start = time()
             ser.write(cmd)
 
             reply = self.read_sentence(ser, self.command_disable_charge_mos)
+            self.link_timing.record(None if reply is False else time() - time_start)
             if reply is False or reply[0] != cmd[4]:
                 logger.error("write force disable charge/discharge failed")
                 return False
@@ -674,11 +688,16 @@ class Daly(Battery):
             cmd[12] = sum(cmd[:12]) & 0xFF
             logger.info(f"write force disable discharging: {'true' if self.trigger_force_disable_discharge else 'false'}")
             self.trigger_force_disable_discharge = None
+            # the charge MOS command may have been sent just before
+            self.link_timing.wait()
             ser.flushOutput()
             ser.flushInput()
+            self.frame_parser.reset()
+            time_start = time()
             ser.write(cmd)
 
             reply = self.read_sentence(ser, self.command_disable_discharge_mos)
+            self.link_timing.record(None if reply is False else time() - time_start)
             if reply is False or reply[0] != cmd[4]:
                 logger.error("write force disable charge/discharge failed")
                 return False
@@ -693,63 +712,52 @@ class Daly(Battery):
 
     def request_data(self, ser, command, sentences_to_receive=1):
         # wait shortly, else the Daly is not ready and throws a lot of no reply errors
-        # if you see a lot of errors, try to increase in steps of 0.005
-        sleep(0.020)
+        self.link_timing.wait()
 
         self.runtime = 0
         time_start = time()
         ser.flushOutput()
         ser.flushInput()
+        self.frame_parser.reset()
         ser.write(self.generate_command(command))
 
         reply = bytearray()
+        latency = None
         for i in range(sentences_to_receive):
-            next = self.read_sentence(ser, command)
+            # the first sentence gets a timeout based on the learned latency, the following are sent right after it
+            next = self.read_sentence(ser, command, self.link_timing.reply_timeout(0.5) if i == 0 else 0.5)
             if not next:
                 logger.debug(f"request_data: bad reply no. {i}")
+                self.link_timing.record(None)
                 return False
+            if i == 0:
+                latency = time() - time_start
             reply += next
+        self.link_timing.record(latency)
         self.runtime = time() - time_start
         return reply
 
     def read_sentence(self, ser, expected_reply, timeout=0.5):
         """read one 13 byte sentence from daly smart bms.
-        return false if less than 13 bytes received in timeout secs, or frame errors occured
+        return false if no valid sentence for the expected command was received in timeout secs
         return received datasection as bytearray else
         """
         time_start = time()
 
-        reply = ser.read_until(b"\xa5")
-        if not reply or b"\xa5" not in reply:
-            logger.debug(f"read_sentence {bytearray_to_string(expected_reply)}: no sentence start received")
-            return False
-
-        idx = reply.index(b"\xa5")
-        reply = reply[idx:]
-        toread = ser.inWaiting()
-        while toread < 12:
-            sleep((12 - toread) * 0.001)
-            toread = ser.inWaiting()
-            time_run = time() - time_start
-            if time_run > timeout:
+        # frames with a wrong checksum are skipped by the frame parser,
+        # frames with a wrong header (e.g. a late reply to a previous command) are skipped here
+        while True:
+            reply = self.frame_parser.read_frame(ser, timeout - (time() - time_start))
+            if reply is False:
                 logger.debug(f"read_sentence {bytearray_to_string(expected_reply)}: timeout")
                 return False
 
-        reply += ser.read(12)
-        try:
-            _, id, cmd, length = unpack_from(">BBBB", reply)
-        except Exception:
-            return False
-
-        # logger.info(f"reply: {bytearray_to_string(reply)}")  # debug
+            # logger.info(f"reply: {bytearray_to_string(reply)}")  # debug
 
-        if (63 + id) != self.address[0] or length != 8 or cmd != expected_reply[0]:
-            logger.debug(f"read_sentence {bytearray_to_string(expected_reply)}: wrong header")
-            return False
+            _, id, cmd, length = unpack_from(">BBBB", reply)
 
-        chk = unpack_from(">B", reply, 12)[0]
-        if sum(reply[:12]) & 0xFF != chk:
-            logger.debug(f"read_sentence {bytearray_to_string(expected_reply)}: wrong checksum")
-            return False
+            if (63 + id) != self.address[0] or length != 8 or cmd != expected_reply[0]:
+                logger.debug(f"read_sentence {bytearray_to_string(expected_reply)}: wrong header")
+                continue
 
-        return reply[4:12]
+            return reply[4:12]
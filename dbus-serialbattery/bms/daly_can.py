@@ -99,6 +99,11 @@ class Daly_Can(Battery):
         RESPONSE_SETTINGS: [0x18504001],
     }
 
+    @classmethod
+    def is_own_can_frame(cls, frame_id: int) -> bool:
+        # the BMS ID and the uplink ID are in the lower two bytes
+        return any(frame_id & 0xFFFF0000 == frame_ids[0] & 0xFFFF0000 for frame_ids in cls.CAN_FRAMES.values())
+
     BATTERYTYPE = "Daly CAN"
     LENGTH_CHECK = 4
     LENGTH_POS = 3
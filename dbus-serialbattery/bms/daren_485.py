@@ -8,13 +8,47 @@
 
 # avoid importing wildcards, remove unused imports
 from battery import Battery, Cell
-from utils import open_serial_port, logger
-from time import sleep
-from struct import unpack
+from utils import serial_port_manager, logger, get_link_timing, FrameParser, FRAME_FORMAT_ASCII_HEX
+from utils_checksum import length_checksum, sum16_complement
+from utils_layout import FrameLayout, LayoutField, hex_to_bytes
+from time import monotonic
 from re import findall
 import sys
 
 
+# payloads after the conversion from ASCII hex to binary, the values are big endian
+REALTIME_DATA_LAYOUT = FrameLayout(
+    [
+        LayoutField("soc", 1, "H", 100),
+        LayoutField("voltage", 3, "H", 100),
+        LayoutField("cell_voltages", 6, "H", 1000, count=16),
+        LayoutField("temperature_mos", 42, "h", 10),
+        LayoutField("temperatures", 45, "h", 10, count=4),
+        LayoutField("current", 53, "h", 100),
+        LayoutField("capacity", 60, "H", 100),
+        LayoutField("capacity_remain", 62, "H", 100),
+        LayoutField("charge_cycles", 64, "H"),
+        LayoutField("voltage_status", 66, "H"),
+        LayoutField("current_status", 68, "H"),
+        LayoutField("temperature_status", 70, "H"),
+        LayoutField("warning_status", 72, "H"),
+        LayoutField("fet_status", 74, "H"),
+    ],
+    byteorder=">",
+)
+
+CAP_PARAMS_LAYOUT = FrameLayout(
+    [
+        LayoutField("capacity_remain", 0, "H"),
+        LayoutField("capacity", 2, "H"),
+        LayoutField("total_ah_drawn", 10, "I"),
+        LayoutField("charged_energy", 14, "H"),
+        LayoutField("discharged_energy", 16, "H"),
+    ],
+    byteorder=">",
+)
+
+
 class Daren485(Battery):
     def __init__(self, port, baud, address):
         super(Daren485, self).__init__(port, baud, address)
@@ -24,6 +58,9 @@ class Daren485(Battery):
         # to address reflecting the position of the DIP-switches on the unit(s), starting at '01'.
         self.address = address
         self.serial_number = ""
+        self.frame_parser = FrameParser(FRAME_FORMAT_ASCII_HEX)
+        # pause between the reply and the next command, learned at runtime
+        self.link_timing = get_link_timing(port, "Daren485", 0.05)
         self.history.exclude_values_to_calculate = ["charge_cycles", "total_ah_drawn", "charged_energy", "discharged_energy"]
 
     BATTERYTYPE = "Daren485"
@@ -71,7 +108,7 @@ class Daren485(Battery):
         """
         result = False
         try:
-            with open_serial_port(self.port, self.baud_rate) as ser:
+            with serial_port_manager.connection(self.port, self.baud_rate) as ser:
                 if ser:
                     if ser.is_open:
                         result = self.get_serial(ser)
@@ -111,7 +148,7 @@ class Daren485(Battery):
         """
         result = False
         try:
-            with open_serial_port(self.port, self.baud_rate) as ser:
+            with serial_port_manager.connection(self.port, self.baud_rate) as ser:
                 if ser:
                     if ser.is_open:
                         result = self.get_realtime_data(ser)
@@ -144,13 +181,12 @@ class Daren485(Battery):
 
         req = self.create_command_get_mfg_params()
 
+        self.link_timing.wait()
         ser.flushOutput()
         ser.flushInput()
         ser.write(req.encode())
         logger.debug("get_mfg_params request sent: {}".format(req))
 
-        sleep(0.4)  # Allow the BMS some time to send a full response
-
         response = self.read_response(ser)
 
         if response:
@@ -178,27 +214,27 @@ class Daren485(Battery):
 
         req = self.create_command_get_cap_params()
 
+        self.link_timing.wait()
         ser.flushOutput()
         ser.flushInput()
         ser.write(req.encode())
         logger.debug("get_cap_params request sent: {}".format(req))
 
-        sleep(0.4)  # Allow the BMS some time to send a full response
-
         response = self.read_response(ser)
 
         if response:
             # Payload starts at offset 13(packet header) + 12 (command_info)
             payload = response[(13 + 12) : len(response) - 5]
             if len(payload) >= 36:  # 9*4 bytes in full request.
-                self.capacity_remain = int(int(payload[0:4], base=16) / 100)
-                self.capacity = int(int(payload[4:8], base=16) / 100)
+                cap_params = CAP_PARAMS_LAYOUT.decode(hex_to_bytes(payload[:36]))
+                self.capacity_remain = int(cap_params["capacity_remain"] / 100)
+                self.capacity = int(cap_params["capacity"] / 100)
                 # design_capacity = int(payload[8:12], base=16) / 100 #Not used, for future use.
                 # total_charge_capacity = int(payload[12:20], base=16) / 100 #Not used, for future use.
                 # total_discharge_capacity
-                self.history.total_ah_drawn = int(payload[20:28], base=16)
-                self.history.charged_energy = int(int(payload[28:32], base=16) / 10)
-                self.history.discharged_energy = int(int(payload[32:36], base=16) / 10)
+                self.history.total_ah_drawn = cap_params["total_ah_drawn"]
+                self.history.charged_energy = int(cap_params["charged_energy"] / 10)
+                self.history.discharged_energy = int(cap_params["discharged_energy"] / 10)
 
                 result = True
             else:
@@ -218,40 +254,35 @@ class Daren485(Battery):
 
         req = self.create_command_get_realtime_data()
 
+        self.link_timing.wait()
         ser.flushOutput()
         ser.flushInput()
         ser.write(req.encode())
         logger.debug("get_realtime_data request sent: {}".format(req))
 
-        sleep(0.5)  # Allow the BMS some time to send a full response
-
         response = self.read_response(ser)
 
         if response:
             payload = response[13 : len(response) - 5]
-            if len(payload) >= 118:
-                self.soc = int(payload[2:6], base=16) / 100
-                self.voltage = int(payload[6:10], base=16) / 100
-                self.current = unpack(">h", bytes.fromhex(payload[106:110]))[0] / 100
-                temperature_mos = unpack(">h", bytes.fromhex(payload[84:88]))[0] / 10
-                self.to_temperature(0, temperature_mos)
-                temperature_1 = unpack(">h", bytes.fromhex(payload[90:94]))[0] / 10
-                self.to_temperature(1, temperature_1)
-                temperature_2 = unpack(">h", bytes.fromhex(payload[94:98]))[0] / 10
-                self.to_temperature(2, temperature_2)
-                temperature_3 = unpack(">h", bytes.fromhex(payload[98:102]))[0] / 10
-                self.to_temperature(3, temperature_3)
-                temperature_4 = unpack(">h", bytes.fromhex(payload[102:106]))[0] / 10
-                self.to_temperature(4, temperature_4)
-                self.capacity = int(payload[120:124], base=16) / 100
-                self.capacity_remain = int(payload[124:128], base=16) / 100
-                self.history.charge_cycles = int(payload[128:132], base=16)
-                fetstatus = int(payload[148:152], base=16)
-
-                voltagestatus = int(payload[132:136], base=16)
-                currentstatus = int(payload[136:140], base=16)
-                temperaturestatus = int(payload[140:144], base=16)
-                warningstatus = int(payload[144:148], base=16)
+            # all values up to the FET status are needed
+            if len(payload) >= REALTIME_DATA_LAYOUT.size * 2:
+                # convert the whole payload once instead of each value
+                realtime_data = REALTIME_DATA_LAYOUT.decode(hex_to_bytes(payload[: REALTIME_DATA_LAYOUT.size * 2]))
+                self.soc = realtime_data["soc"]
+                self.voltage = realtime_data["voltage"]
+                self.current = realtime_data["current"]
+                self.to_temperature(0, realtime_data["temperature_mos"])
+                for i, temperature in enumerate(realtime_data["temperatures"]):
+                    self.to_temperature(i + 1, temperature)
+                self.capacity = realtime_data["capacity"]
+                self.capacity_remain = realtime_data["capacity_remain"]
+                self.history.charge_cycles = realtime_data["charge_cycles"]
+                fetstatus = realtime_data["fet_status"]
+
+                voltagestatus = realtime_data["voltage_status"]
+                currentstatus = realtime_data["current_status"]
+                temperaturestatus = realtime_data["temperature_status"]
+                warningstatus = realtime_data["warning_status"]
 
                 # check bit 2 for TOT_OVV_PROT and bit 0 for cell_OVV_PROT
                 if voltagestatus & (1 << 2) or voltagestatus & (1 << 0):
@@ -388,9 +419,8 @@ class Daren485(Battery):
                     self.discharge_fet = False
                     self.max_battery_discharge_current = 0
 
-                for i in range(1, 17):
-                    cell_voltage = int(payload[(i - 1) * 4 + 12 : i * 4 + 12], base=16) / 1000
-                    self.cells[i - 1].voltage = cell_voltage
+                for cell, cell_voltage in zip(self.cells, realtime_data["cell_voltages"]):
+                    cell.voltage = cell_voltage
 
                 result = True
             else:
@@ -409,13 +439,12 @@ class Daren485(Battery):
 
         req = self.create_command_get_manufacturer_info()
 
+        self.link_timing.wait()
         ser.flushOutput()
         ser.flushInput()
         ser.write(req.encode())
         logger.debug("get_manufacturer_info request sent: {}".format(req))
 
-        sleep(0.4)  # Allow the BMS some time to send a full response
-
         response = self.read_response(ser)
 
         if response:
@@ -456,13 +485,12 @@ class Daren485(Battery):
 
         req = self.create_command_get_cells_params()
 
+        self.link_timing.wait()
         ser.flushOutput()
         ser.flushInput()
         ser.write(req.encode())
         logger.debug("get_cells_params request sent: {}".format(req))
 
-        sleep(0.4)  # Allow the BMS some time to send a full response
-
         response = self.read_response(ser)
 
         if response:
@@ -503,22 +531,28 @@ class Daren485(Battery):
 
         return result
 
-    def read_response(self, ser):
+    def read_response(self, ser, timeout=1.0):
         """
-        After sending the command to the device, this service processes
-        the receive buffer and performs basic parsing and validation of received data.
+        After sending the command to the device, this service waits for the complete reply
+        and performs basic parsing and validation of received data.
+        Returns as soon as the reply is complete, instead of waiting a fixed time after the request.
         """
-        buff = ""
-
-        while ser.inWaiting() > 0:
-            try:
-                chr = ser.read()
-                buff += chr.decode()
-                if chr == b"\r":
-                    break
-            except Exception as e:
-                logger.error("Exception during inWaiting(): {}".format(e))
-                pass
+        time_start = monotonic()
+        self.frame_parser.reset()
+        frame = self.frame_parser.read_frame(ser, self.link_timing.reply_timeout(timeout))
+
+        if frame is False:
+            self.link_timing.record(None)
+            logger.debug("read_response timeout!")
+            return False
+
+        self.link_timing.record(monotonic() - time_start)
+
+        try:
+            buff = frame.decode()
+        except Exception as e:
+            logger.error("Exception during decoding: {}".format(e))
+            return False
 
         try:
             CID2 = buff[7:9]
@@ -640,21 +674,11 @@ class Daren485(Battery):
         return command
 
     def calculate_checksum(self, str):
-        checksum = 0
-        for value in str:
-            checksum = checksum + ord(value)
-        checksum = checksum ^ 0xFFFF
-        return checksum + 1
+        return sum16_complement(str.encode("latin1"))
 
     # creates length + checksum from length val in two byte integer
     def length_checksum(self, value):
-        value = value & 0x0FFF
-        n1 = value & 0xF
-        n2 = (value >> 4) & 0xF
-        n3 = (value >> 8) & 0xF
-        chksum = ((n1 + n2 + n3) & 0xF) ^ 0xF
-        chksum = chksum + 1
-        return value + (chksum << 12)
+        return length_checksum(value)
 
     def CID2_decode(self, CID2):
         if CID2 == "00":
@@ -8,14 +8,57 @@ from utils import (
     LIPRO_END_ADDRESS,
     LIPRO_START_ADDRESS,
 )
+from utils_modbus import ModbusField, ModbusTransport, decode_int, decode_long
 import ext.minimalmodbus as minimalmodbus
+import serial
 import sys
+from typing import Dict
+
+
+def decode_int_signed(registers):
+    return decode_int(registers, True)
+
+
+def decode_long_little_swap(registers):
+    return decode_long(registers, False, minimalmodbus.BYTEORDER_LITTLE_SWAP)
+
+
+def decode_long_little_swap_signed(registers):
+    return decode_long(registers, True, minimalmodbus.BYTEORDER_LITTLE_SWAP)
+
+
+# register maps of the Greenmeter, the measurements are read with one request
+GREENMETER_STATUS_FIELDS = [
+    ModbusField("production", 2, 2, decoder=decode_long_little_swap),
+    ModbusField("max_discharge_current", 30, decoder=decode_int_signed),
+    ModbusField("max_charge_current", 31, decoder=decode_int_signed),
+    ModbusField("capacity", 46, 2, decoder=decode_long_little_swap),
+]
+
+GREENMETER_SOC_FIELDS = [
+    ModbusField("temperature_1", 102, decoder=decode_int_signed),
+    ModbusField("temperature_2", 103, decoder=decode_int_signed),
+    ModbusField("voltage", 108, 2, decoder=decode_long_little_swap_signed),
+    ModbusField("current", 114, 2, decoder=decode_long_little_swap_signed),
+    ModbusField("soc", 128, 2, decoder=decode_long_little_swap_signed),
+    ModbusField("over_voltage", 130, decoder=decode_int_signed),
+    ModbusField("under_voltage", 131, decoder=decode_int_signed),
+]
+
+# register map of a LiPro cell module
+LIPRO_CELL_FIELDS = [
+    ModbusField("voltage", 100),
+    ModbusField("temperature", 101, decoder=decode_int_signed),
+    ModbusField("balance", 102),
+]
 
 
 class Ecs(Battery):
     def __init__(self, port, baud, address):
         super(Ecs, self).__init__(port, baud, address)
         self.type = self.BATTERYTYPE
+        self.transports: Dict[int, ModbusTransport] = {}
+        self.transport = self.get_transport(GREENMETER_ADDRESS)
 
     BATTERYTYPE = "ECS LiPro"
     GREENMETER_ID_500A = 500
@@ -41,9 +84,8 @@ class Ecs(Battery):
         # Trying to find Green Meter ID
         result = False
         try:
-            mbdev = minimalmodbus.Instrument(self.port, GREENMETER_ADDRESS)
-            mbdev.serial.parity = minimalmodbus.serial.PARITY_EVEN
-            tmpId = mbdev.read_register(0, 0)
+            with self.transport.transaction() as instrument:
+                tmpId = instrument.read_register(0, 0)
             if tmpId in range(self.GREENMETER_ID_500A, self.GREENMETER_ID_125A + 1):
                 if tmpId == self.GREENMETER_ID_500A:
                     self.METER_SIZE = "500A"
@@ -85,10 +127,10 @@ class Ecs(Battery):
         # test for LiPro cell devices
         for cell_address in range(LIPRO_START_ADDRESS, LIPRO_END_ADDRESS + 1):
             try:
-                mbdev = minimalmodbus.Instrument(self.port, cell_address)
-                mbdev.serial.parity = minimalmodbus.serial.PARITY_EVEN
+                transport = self.get_transport(cell_address)
 
-                tmpId = mbdev.read_register(0, 0)
+                with transport.transaction() as instrument:
+                    tmpId = instrument.read_register(0, 0)
                 if tmpId in range(self.LIPRO1X_ID_V1, self.LIPRO1X_ID_V3 + 1):
                     self.LiProCells.append(cell_address)
                     logger.info("Found LiPro at " + str(cell_address))
@@ -119,15 +161,25 @@ class Ecs(Battery):
 
         return result
 
+    def get_transport(self, address: int) -> ModbusTransport:
+        """
+        Get the transport for a device on the bus. All devices share the open port.
+
+        :param address: Modbus address of the Greenmeter or LiPro cell
+        :return: Transport
+        """
+        if address not in self.transports:
+            self.transports[address] = ModbusTransport(self.port, address, self.baud_rate, parity=serial.PARITY_EVEN, timeout=0.1, gap_max=16)
+        return self.transports[address]
+
     def read_status_data(self):
         try:
-            mbdev = minimalmodbus.Instrument(self.port, GREENMETER_ADDRESS)
-            mbdev.serial.parity = minimalmodbus.serial.PARITY_EVEN
+            values = self.transport.read(GREENMETER_STATUS_FIELDS)
 
-            self.max_battery_discharge_current = abs(mbdev.read_register(30, 0, 3, True))
-            self.max_battery_charge_current = mbdev.read_register(31, 0, 3, True)
-            self.capacity = mbdev.read_long(46, 3, False, minimalmodbus.BYTEORDER_LITTLE_SWAP) / 1000
-            self.production = mbdev.read_long(2, 3, False, minimalmodbus.BYTEORDER_LITTLE_SWAP)
+            self.max_battery_discharge_current = abs(values["max_discharge_current"])
+            self.max_battery_charge_current = values["max_charge_current"]
+            self.capacity = values["capacity"] / 1000
+            self.production = values["production"]
 
             self.hardware_version = "Greenmeter-" + self.METER_SIZE + " " + str(self.cell_count) + "S"
             logger.info(self.hardware_version)
@@ -138,21 +190,20 @@ class Ecs(Battery):
 
     def read_soc_data(self):
         try:
-            mbdev = minimalmodbus.Instrument(self.port, GREENMETER_ADDRESS)
-            mbdev.serial.parity = minimalmodbus.serial.PARITY_EVEN
+            values = self.transport.read(GREENMETER_SOC_FIELDS)
 
-            self.voltage = mbdev.read_long(108, 3, True, minimalmodbus.BYTEORDER_LITTLE_SWAP) / 1000
-            self.current = mbdev.read_long(114, 3, True, minimalmodbus.BYTEORDER_LITTLE_SWAP) / 1000
+            self.voltage = values["voltage"] / 1000
+            self.current = values["current"] / 1000
             # if (mbdev.read_register(129, 0, 3, False) != 65535):
-            temp_soc = mbdev.read_long(128, 3, True, minimalmodbus.BYTEORDER_LITTLE_SWAP)
+            temp_soc = values["soc"]
             # Fix for Greenmeter that seems to not correctly define/set the high bytes
             # if the SOC value is less than 65535 (65.535%). So 50% comes through as #C350 FFFF instead of #C350 0000
             self.soc = (temp_soc if temp_soc < 4294901760 else temp_soc - 4294901760) / 1000
 
             self.protection = Protection()
 
-            over_voltage = mbdev.read_register(130, 0, 3, True)
-            under_voltage = mbdev.read_register(131, 0, 3, True)
+            over_voltage = values["over_voltage"]
+            under_voltage = values["under_voltage"]
             self.charge_fet = True if over_voltage == 0 else False
             self.discharge_fet = True if under_voltage == 0 else False
             self.protection.high_voltage = 2 if over_voltage == 1 else 0
@@ -164,8 +215,8 @@ class Ecs(Battery):
             self.protection.high_charge_current = 1 if over_voltage == 2 else 0
             self.protection.high_discharge_current = 1 if under_voltage == 2 else 0
 
-            self.temperature_1 = mbdev.read_register(102, 0, 3, True) / 100
-            self.temperature_2 = mbdev.read_register(103, 0, 3, True) / 100
+            self.temperature_1 = values["temperature_1"] / 100
+            self.temperature_2 = values["temperature_2"] / 100
 
             return True
         except IOError:
@@ -174,12 +225,11 @@ class Ecs(Battery):
     def read_cell_data(self):
         for cell in range(len(self.LiProCells)):
             try:
-                mbdev = minimalmodbus.Instrument(self.port, self.LiProCells[cell])
-                mbdev.serial.parity = minimalmodbus.serial.PARITY_EVEN
+                values = self.get_transport(self.LiProCells[cell]).read(LIPRO_CELL_FIELDS)
 
-                self.cells[cell].voltage = mbdev.read_register(100, 0, 3, False) / 1000
-                self.cells[cell].balance = True if mbdev.read_register(102, 0, 3, False) > 50 else False
-                self.cells[cell].temperature = mbdev.read_register(101, 0, 3, True) / 100
+                self.cells[cell].voltage = values["voltage"] / 1000
+                self.cells[cell].balance = True if values["balance"] > 50 else False
+                self.cells[cell].temperature = values["temperature"] / 100
 
                 return True
             except IOError:
@@ -42,6 +42,7 @@ class EG4_LL(Battery):
         self.charger_connected = None
         self.load_connected = None
         self.address = address
+        self.serial_number = None
         self.cell_min_voltage = None
         self.cell_max_voltage = None
         self.cell_min_no = None
@@ -4,9 +4,9 @@
 # Updated by https://github.com/peterohman
 
 from battery import Battery, Cell
-from utils import logger
+from utils import logger, get_link_timing, serial_port_manager, wait_for_serial_data
 import serial
-from time import sleep
+from time import monotonic, sleep
 import sys
 
 
@@ -14,6 +14,8 @@ class HLPdataBMS4S(Battery):
     def __init__(self, port, baud, address):
         super(HLPdataBMS4S, self).__init__(port, baud, address)
         self.type = self.BATTERYTYPE
+        # the replies have no length information, a reply is complete when the line is idle for the learned delay
+        self.link_timing = get_link_timing(port, self.BATTERYTYPE, 0.1, delay_min=0.05, delay_max=0.3)
 
     BATTERYTYPE = "HLPdataBMS4S"
 
@@ -212,14 +214,14 @@ class HLPdataBMS4S(Battery):
         self.control_voltage = self.max_battery_voltage
 
     def read_serial_data_HLPdataBMS4S(self, command, time, min_len):
-        data = read_serial_data(command, self.port, self.baud_rate, time, min_len)
+        data = read_serial_data(command, self.port, self.baud_rate, time, min_len, self.link_timing)
         return data
 
 
-def read_serial_data(command, port, baud, time, min_len):
+def read_serial_data(command, port, baud, time, min_len, link_timing):
     try:
-        with serial.Serial(port, baudrate=baud, timeout=2.5) as ser:
-            ret = read_serialport_data(ser, command, time, min_len)
+        with serial_port_manager.connection(port, baud, 2.5) as ser:
+            ret = read_serialport_data(ser, command, time, min_len, link_timing)
         return ret
 
     except serial.SerialException as e:
@@ -230,9 +232,19 @@ def read_serial_data(command, port, baud, time, min_len):
         return False
 
 
-def read_serialport_data(ser, command, time, min_len):
+def read_serialport_data(ser, command, time, min_len, link_timing):
+    """
+    Send the command and read the reply.
+    Instead of waiting the whole time, the reply is complete as soon as min_len bytes are received
+    and the line is idle for the learned delay of the link timing.
+
+    :param time: Maximum time in seconds to wait for the reply
+    :param min_len: Minimum length of a valid reply
+    :param link_timing: Timing model of the connection
+    """
     try:
         if min_len == 12:
+            # wake up the BMS, only done once while testing the connection
             ser.write(b"\n")
             sleep(0.2)
         cnt = 0
@@ -241,11 +253,25 @@ def read_serialport_data(ser, command, time, min_len):
             ser.flushOutput()
             ser.flushInput()
             ser.write(command)
-            sleep(time)
-            toread = ser.inWaiting()
-            res = ser.read(toread)
+
+            time_start = monotonic()
+            deadline = time_start + time
+            res = bytearray()
+            while True:
+                remaining = deadline - monotonic()
+                if remaining <= 0:
+                    break
+                waiting = wait_for_serial_data(ser, remaining if len(res) < min_len else min(remaining, link_timing.delay))
+                if waiting == 0:
+                    if len(res) >= min_len:
+                        break
+                    continue
+                res += ser.read(waiting)
+
             if len(res) >= min_len:
-                return res
+                link_timing.record(monotonic() - time_start)
+                return bytes(res)
+            link_timing.record(None)
         return False
 
     except serial.SerialException as e:
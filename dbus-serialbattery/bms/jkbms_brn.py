@@ -5,7 +5,9 @@
 # https://github.com/Louisvdw/dbus-serialbattery/pull/372
 # Updated by https://github.com/mr-manuel
 
-from struct import unpack_from, calcsize
+from struct import unpack_from
+from utils_checksum import sum8
+from utils_layout import FrameLayout, LayoutField
 from bleak import BleakScanner, BleakClient, exc
 from time import sleep, time
 import asyncio
@@ -48,79 +50,89 @@ protocol_version = PROTOCOL_VERSION_JK02
 MIN_RESPONSE_SIZE = 300
 MAX_RESPONSE_SIZE = 320
 
-TRANSLATE_DEVICE_INFO = [
-    [["device_info", "hw_rev"], 22, "8s"],
-    [["device_info", "sw_rev"], 30, "8s"],
-    [["device_info", "uptime"], 38, "<L"],
-    [["device_info", "vendor_id"], 6, "16s"],
-    [["device_info", "manufacturing_date"], 78, "8s"],
-    [["device_info", "serial_number"], 86, "10s"],
-    [["device_info", "production"], 102, "8s"],
+# frame layouts, all values are little endian
+LAYOUT_DEVICE_INFO = FrameLayout(
+    [
+        LayoutField("hw_rev", 22, "8s"),
+        LayoutField("sw_rev", 30, "8s"),
+        LayoutField("uptime", 38, "L"),
+        LayoutField("vendor_id", 6, "16s"),
+        LayoutField("manufacturing_date", 78, "8s"),
+        LayoutField("serial_number", 86, "10s"),
+        LayoutField("production", 102, "8s"),
+    ]
+)
+
+LAYOUT_SETTINGS = FrameLayout(
+    [
+        LayoutField("cell_uvp", 10, "L", 1000),
+        LayoutField("cell_uvpr", 14, "L", 1000),
+        LayoutField("cell_ovp", 18, "L", 1000),
+        LayoutField("cell_ovpr", 22, "L", 1000),
+        LayoutField("balance_trigger_voltage", 26, "L", 1000),
+        LayoutField("power_off_voltage", 46, "L", 1000),
+        LayoutField("max_charge_current", 50, "L", 1000),
+        LayoutField("max_discharge_current", 62, "L", 1000),
+        LayoutField("max_balance_current", 50, "L", 1000),
+        LayoutField("cell_count", 114, "L"),
+        # the switches are 4 bytes long, only the first byte is used
+        LayoutField("charging_switch", 118, "?"),
+        LayoutField("discharging_switch", 122, "?"),
+        LayoutField("balancing_switch", 126, "?"),
+    ]
+)
+
+# offsets of the 24s frame, see get_cell_info_layout() for the 32s frame
+# the number of cell voltages is set to the cell count of the BMS
+FIELDS_CELL_INFO = [
+    LayoutField("voltages", 6, "H", 1000, count=32),
+    LayoutField("average_cell_voltage", 58, "H", 1000),
+    LayoutField("delta_cell_voltage", 60, "H", 1000),
+    LayoutField("max_voltage_cell", 62, "B"),
+    LayoutField("min_voltage_cell", 63, "B"),
+    LayoutField("resistances", 64, "H", 1000, count=32),
+    LayoutField("total_voltage", 118, "H", 1000),
+    LayoutField("current", 126, "l", 1000),
+    LayoutField("temperature_sensor_1", 130, "H", 10),
+    LayoutField("temperature_sensor_2", 132, "H", 10),
+    LayoutField("temperature_mos", 134, "H", 10),
+    LayoutField("balancing_current", 138, "H", 1000),
+    LayoutField("balancing_action", 140, "B", 1000),
+    LayoutField("battery_soc", 141, "B"),
+    LayoutField("capacity_remain", 142, "L", 1000),
+    LayoutField("capacity_nominal", 146, "L", 1000),
+    LayoutField("cycle_count", 150, "L"),
+    LayoutField("cycle_capacity", 154, "L", 1000),
+    LayoutField("charging_switch_enabled", 166, "?"),
+    LayoutField("discharging_switch_enabled", 167, "?"),
+    LayoutField("balancing_active", 191, "?"),
 ]
 
-TRANSLATE_SETTINGS = [
-    [["settings", "cell_uvp"], 10, "<L", 0.001],
-    [["settings", "cell_uvpr"], 14, "<L", 0.001],
-    [["settings", "cell_ovp"], 18, "<L", 0.001],
-    [["settings", "cell_ovpr"], 22, "<L", 0.001],
-    [["settings", "balance_trigger_voltage"], 26, "<L", 0.001],
-    [["settings", "power_off_voltage"], 46, "<L", 0.001],
-    [["settings", "max_charge_current"], 50, "<L", 0.001],
-    [["settings", "max_discharge_current"], 62, "<L", 0.001],
-    [["settings", "max_balance_current"], 50, "<L", 0.001],
-    [["settings", "cell_count"], 114, "<L"],
-    [["settings", "charging_switch"], 118, "4?"],
-    [["settings", "discharging_switch"], 122, "4?"],
-    [["settings", "balancing_switch"], 126, "4?"],
-]
-
-TRANSLATE_CELL_INFO_24S = [
-    [["cell_info", "voltages", 32], 6, "<H", 0.001],
-    [["cell_info", "average_cell_voltage"], 58, "<H", 0.001],
-    [["cell_info", "delta_cell_voltage"], 60, "<H", 0.001],
-    [["cell_info", "max_voltage_cell"], 62, "<B"],
-    [["cell_info", "min_voltage_cell"], 63, "<B"],
-    [["cell_info", "resistances", 32], 64, "<H", 0.001],
-    [["cell_info", "total_voltage"], 118, "<H", 0.001],
-    [["cell_info", "current"], 126, "<l", 0.001],
-    [["cell_info", "temperature_sensor_1"], 130, "<H", 0.1],
-    [["cell_info", "temperature_sensor_2"], 132, "<H", 0.1],
-    [["cell_info", "temperature_mos"], 134, "<H", 0.1],
-    [["cell_info", "balancing_current"], 138, "<H", 0.001],
-    [["cell_info", "balancing_action"], 140, "<B", 0.001],
-    [["cell_info", "battery_soc"], 141, "B"],
-    [["cell_info", "capacity_remain"], 142, "<L", 0.001],
-    [["cell_info", "capacity_nominal"], 146, "<L", 0.001],
-    [["cell_info", "cycle_count"], 150, "<L"],
-    [["cell_info", "cycle_capacity"], 154, "<L", 0.001],
-    [["cell_info", "charging_switch_enabled"], 166, "1?"],
-    [["cell_info", "discharging_switch_enabled"], 167, "1?"],
-    [["cell_info", "balancing_active"], 191, "1?"],
-]
 
-TRANSLATE_CELL_INFO_32S = [
-    [["cell_info", "voltages", 32], 6, "<H", 0.001],
-    [["cell_info", "average_cell_voltage"], 58, "<H", 0.001],
-    [["cell_info", "delta_cell_voltage"], 60, "<H", 0.001],
-    [["cell_info", "max_voltage_cell"], 62, "<B"],
-    [["cell_info", "min_voltage_cell"], 63, "<B"],
-    [["cell_info", "resistances", 32], 64, "<H", 0.001],
-    [["cell_info", "total_voltage"], 118, "<H", 0.001],
-    [["cell_info", "current"], 126, "<l", 0.001],
-    [["cell_info", "temperature_sensor_1"], 130, "<H", 0.1],
-    [["cell_info", "temperature_sensor_2"], 132, "<H", 0.1],
-    [["cell_info", "temperature_mos"], 112, "<H", 0.1],
-    [["cell_info", "balancing_current"], 138, "<H", 0.001],
-    [["cell_info", "balancing_action"], 140, "<B", 0.001],
-    [["cell_info", "battery_soc"], 141, "B"],
-    [["cell_info", "capacity_remain"], 142, "<L", 0.001],
-    [["cell_info", "capacity_nominal"], 146, "<L", 0.001],
-    [["cell_info", "cycle_count"], 150, "<L"],
-    [["cell_info", "cycle_capacity"], 154, "<L", 0.001],
-    [["cell_info", "charging_switch_enabled"], 166, "1?"],
-    [["cell_info", "discharging_switch_enabled"], 167, "1?"],
-    [["cell_info", "balancing_active"], 191, "1?"],
-]
+def get_cell_info_layout(bms_max_cell_count: int, cell_count: int) -> FrameLayout:
+    """
+    Compile the layout of the cell info frame.
+
+    The 32s frame has 8 more cell voltages and resistances, so the values after them are shifted
+    by 16 and 32 bytes. The MOSFET temperature is at a different position.
+
+    :param bms_max_cell_count: 24 or 32
+    :param cell_count: Number of cell voltages to decode
+    :return: Compiled layout
+    """
+    fields = []
+    for field in FIELDS_CELL_INFO:
+        offset = field.offset
+        if bms_max_cell_count == 32:
+            if field.name == "temperature_mos":
+                offset = 112
+            if offset >= 112:
+                offset += 32
+            elif offset >= 54:
+                offset += 16
+        count = cell_count if field.name == "voltages" else field.count
+        fields.append(LayoutField(field.name, offset, field.fmt, field.divisor, count))
+    return FrameLayout(fields)
 
 
 class Jkbms_Brn:
@@ -145,8 +157,11 @@ class Jkbms_Brn:
     # will be set by get_bms_max_cell_count()
     bms_max_cell_count = None
 
-    # translate info placeholder, since it depends on the bms_max_cell_count
-    translate_cell_info = []
+    # cell count from the settings frame, which sets the number of decoded cell voltages
+    cell_count = 32
+
+    # compiled cell info layouts by bms_max_cell_count and cell_count
+    cell_info_layouts = {}
 
     def __init__(self, addr, reset_bt_callback=None):
         self.address = addr
@@ -186,54 +201,27 @@ class Jkbms_Brn:
         # if BMS has a max of 32s the data at fb[287] is not empty
         if fb[287] > 0:
             self.bms_max_cell_count = 32
-            self.translate_cell_info = TRANSLATE_CELL_INFO_32S
         # if BMS has a max of 24s the data ends at fb[219]
         else:
             self.bms_max_cell_count = 24
-            self.translate_cell_info = TRANSLATE_CELL_INFO_24S
 
         logger.debug(f"bms_max_cell_count recognized: {self.bms_max_cell_count}")
 
-    # iterative implementation maybe later due to referencing
-    def translate(self, fb, translation, o, f32s=False, i=0):
-        if i == len(translation[0]) - 1:
-            # keep things universal by using an n=1 list
-            keys = range(0, translation[0][i]) if isinstance(translation[0][i], int) else [translation[0][i]]
-            offset = 0
-            if f32s:
-                if translation[1] >= 112:
-                    offset = 32
-                elif translation[1] >= 54:
-                    offset = 16
-            i = 0
-            for j in keys:
-                if isinstance(translation[2], int):
-                    # handle raw bytes without unpack_from;
-                    # 3. param gives no format but number of bytes
-                    val = bytearray(fb[translation[1] + i + offset : translation[1] + i + translation[2] + offset])
-                    i += translation[2]
-                else:
-                    val = unpack_from(translation[2], bytearray(fb), translation[1] + i + offset)[0]
-                    # calculate stepping in case of array
-                    i = i + calcsize(translation[2])
-
-                if isinstance(val, bytes):
-                    try:
-                        val = val.decode("utf-8").rstrip(" \t\n\r\0")
-                    except UnicodeDecodeError:
-                        val = ""
+    def translate(self, fb, layout, o):
+        """
+        Decode a frame with a compiled layout into the status dict.
 
-                elif isinstance(val, int) and len(translation) == 4:
-                    val = val * translation[3]
-                o[j] = val
-        else:
-            if translation[0][i] not in o:
-                if len(translation[0]) == i + 2 and isinstance(translation[0][i + 1], int):
-                    o[translation[0][i]] = [None] * translation[0][i + 1]
-                else:
-                    o[translation[0][i]] = {}
-
-            self.translate(fb, translation, o[translation[0][i]], f32s=f32s, i=i + 1)
+        :param fb: Frame buffer
+        :param layout: Layout of the frame
+        :param o: Dict to update
+        """
+        for name, val in layout.decode(fb).items():
+            if isinstance(val, bytes):
+                try:
+                    val = val.decode("utf-8").rstrip(" \t\n\r\0")
+                except UnicodeDecodeError:
+                    val = ""
+            o[name] = val
 
     def decode_warnings(self, fb):
         val = unpack_from("<H", bytearray(fb), 136)[0]
@@ -256,24 +244,22 @@ class Jkbms_Brn:
         # verified until here, rest is guesswork
 
     def decode_device_info_jk02(self):
-        fb = self.frame_buffer
-        for t in TRANSLATE_DEVICE_INFO:
-            self.translate(fb, t, self.bms_status)
+        self.translate(self.frame_buffer, LAYOUT_DEVICE_INFO, self.bms_status.setdefault("device_info", {}))
 
     def decode_cellinfo_jk02(self):
         fb = self.frame_buffer
-        has32s = self.bms_max_cell_count == 32
-        for t in self.translate_cell_info:
-            self.translate(fb, t, self.bms_status, f32s=has32s)
+        key = (self.bms_max_cell_count, self.cell_count)
+        layout = self.cell_info_layouts.get(key)
+        if layout is None:
+            layout = self.cell_info_layouts[key] = get_cell_info_layout(*key)
+        self.translate(fb, layout, self.bms_status.setdefault("cell_info", {}))
         self.decode_warnings(fb)
         logger.debug("decode_cellinfo_jk02(): self.frame_buffer")
         logger.debug(self.frame_buffer)
         logger.debug(self.bms_status)
 
     def decode_settings_jk02(self):
-        fb = self.frame_buffer
-        for t in TRANSLATE_SETTINGS:
-            self.translate(fb, t, self.bms_status)
+        self.translate(self.frame_buffer, LAYOUT_SETTINGS, self.bms_status.setdefault("settings", {}))
         logger.debug(self.bms_status)
 
     def decode(self):
@@ -284,11 +270,8 @@ class Jkbms_Brn:
             logger.info("Processing frame with settings info")
             if protocol_version == PROTOCOL_VERSION_JK02:
                 self.decode_settings_jk02()
-                # adapt translation table for cell array lengths
-                ccount = self.bms_status["settings"]["cell_count"]
-                for i, t in enumerate(self.translate_cell_info):
-                    if t[0][-2] == "voltages" or t[0][-2] == "voltages":
-                        self.translate_cell_info[i][0][-1] = ccount
+                # adapt the cell info layout for the cell array length
+                self.cell_count = self.bms_status["settings"]["cell_count"]
                 self.bms_status["last_update"] = time()
 
         elif info_type == 0x02:
@@ -351,10 +334,7 @@ class Jkbms_Brn:
         self.assemble_frame(data)
 
     def crc(self, arr: bytearray, length: int) -> int:
-        crc = 0
-        for a in arr[:length]:
-            crc = crc + a
-        return crc.to_bytes(2, "little")[0]
+        return sum8(arr[:length])
 
     async def write_register(
         self,
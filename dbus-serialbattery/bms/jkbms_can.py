@@ -70,6 +70,11 @@ class Jkbms_Can(Battery):
         BMS_CHG_INFO: [0x1806E5F4],
     }
 
+    @classmethod
+    def is_own_can_frame(cls, frame_id: int) -> bool:
+        # the address set with the dip switches (0 to 15) is subtracted from the frame IDs
+        return any(frame_id + address in frame_ids for frame_ids in cls.CAN_FRAMES.values() for address in range(16))
+
     def connection_name(self) -> str:
         return f"CAN socketcan:{self.port}" + (f"__{self.device_address}" if self.device_address != 0 else "")
 
@@ -5,10 +5,71 @@
 
 from battery import Battery, Cell
 from utils import bytearray_to_string, read_serial_data, logger, USE_PORT_AS_UNIQUE_ID
-from struct import unpack_from
+from utils_checksum import crc16_modbus_bytes, crc16_modbus_frame
+from utils_layout import FrameLayout, LayoutField
 import sys
 
 
+# settings frame (0x10 0x16 0x1e), the values are little endian
+SETTINGS_LAYOUT = FrameLayout(
+    [
+        LayoutField("VolSmartSleep", 6, "i", 1000),
+        LayoutField("VolCellUV", 10, "i", 1000),
+        LayoutField("VolCellUVPR", 14, "i", 1000),
+        LayoutField("VolCellOV", 18, "i", 1000),
+        LayoutField("VolCellOVPR", 22, "i", 1000),
+        LayoutField("VolBalanTrig", 26, "i", 1000),
+        LayoutField("VolSOC_full", 30, "i", 1000),
+        LayoutField("VolSOC_empty", 34, "i", 1000),
+        LayoutField("VolSysPwrOff", 46, "i", 1000),
+        LayoutField("CurBatCOC", 50, "i", 1000),
+        LayoutField("TIMBatCOCPDly", 54, "i"),
+        LayoutField("TIMBatCOCPRDly", 58, "i"),
+        LayoutField("CurBatDcOC", 62, "i", 1000),
+        LayoutField("TIMBatDcOCPDly", 66, "i"),
+        LayoutField("TIMBatDcOCPRDly", 70, "i"),
+        LayoutField("TIMBatSCPRDly", 74, "i"),
+        LayoutField("CurBalanMax", 78, "i", 1000),
+        LayoutField("TMPBatCOT", 82, "I", 10),
+        LayoutField("TMPBatCOTPR", 96, "I", 10),
+        LayoutField("TMPBatDcOT", 90, "I", 10),
+        LayoutField("TMPBatDcOTPR", 94, "I", 10),
+        LayoutField("TMPBatCUT", 98, "I", 10),
+        LayoutField("TMPBatCUTPR", 102, "I", 10),
+        LayoutField("TMPMosOT", 106, "I", 10),
+        LayoutField("TMPMosOTPR", 110, "I", 10),
+        LayoutField("CellCount", 114, "i"),
+        LayoutField("BatChargeEN", 118, "i"),
+        LayoutField("BatDisChargeEN", 122, "i"),
+        LayoutField("BalanEN", 126, "i"),
+        LayoutField("CapBatCell", 130, "i", 1000),
+        LayoutField("SCPDelay", 134, "i"),
+    ]
+)
+
+# status frame (0x10 0x16 0x20)
+STATUS_LAYOUT = FrameLayout(
+    [
+        LayoutField("cell_voltages", 6, "H", 1000, count=32),
+        LayoutField("temperature_mos", 144, "h", 10),
+        LayoutField("voltage", 150, "I", 1000),
+        LayoutField("current", 158, "i", 1000),
+        LayoutField("temperature_1", 162, "h", 10),
+        LayoutField("temperature_2", 164, "h", 10),
+        LayoutField("protection", 166, "I"),
+        LayoutField("balancing", 172, "B"),
+        LayoutField("soc", 173, "B"),
+        LayoutField("capacity_remain", 174, "i", 1000),
+        LayoutField("charge_cycles", 182, "i"),
+        LayoutField("charge", 198, "B"),
+        LayoutField("discharge", 199, "B"),
+        LayoutField("temperature_sensors", 214, "B"),
+        LayoutField("temperature_3", 256, "h", 10),
+        LayoutField("temperature_4", 258, "h", 10),
+    ]
+)
+
+
 class Jkbms_pb(Battery):
     def __init__(self, port, baud, address):
         super(Jkbms_pb, self).__init__(port, baud, address)
@@ -60,82 +121,22 @@ class Jkbms_pb(Battery):
         if status_data is False:
             return False
 
-        VolSmartSleep = unpack_from("<i", status_data, 6)[0] / 1000
-        VolCellUV = unpack_from("<i", status_data, 10)[0] / 1000
-        VolCellUVPR = unpack_from("<i", status_data, 14)[0] / 1000
-        VolCellOV = unpack_from("<i", status_data, 18)[0] / 1000
-        VolCellOVPR = unpack_from("<i", status_data, 22)[0] / 1000
-        VolBalanTrig = unpack_from("<i", status_data, 26)[0] / 1000
-        VolSOC_full = unpack_from("<i", status_data, 30)[0] / 1000
-        VolSOC_empty = unpack_from("<i", status_data, 34)[0] / 1000
-        VolSysPwrOff = unpack_from("<i", status_data, 46)[0] / 1000
-        CurBatCOC = unpack_from("<i", status_data, 50)[0] / 1000
-        TIMBatCOCPDly = unpack_from("<i", status_data, 54)[0]
-        TIMBatCOCPRDly = unpack_from("<i", status_data, 58)[0]
-        CurBatDcOC = unpack_from("<i", status_data, 62)[0] / 1000
-        TIMBatDcOCPDly = unpack_from("<i", status_data, 66)[0]
-        TIMBatDcOCPRDly = unpack_from("<i", status_data, 70)[0]
-        TIMBatSCPRDly = unpack_from("<i", status_data, 74)[0]
-        CurBalanMax = unpack_from("<i", status_data, 78)[0] / 1000
-        TMPBatCOT = unpack_from("<I", status_data, 82)[0] / 10
-        TMPBatCOTPR = unpack_from("<I", status_data, 96)[0] / 10
-        TMPBatDcOT = unpack_from("<I", status_data, 90)[0] / 10
-        TMPBatDcOTPR = unpack_from("<I", status_data, 94)[0] / 10
-        TMPBatCUT = unpack_from("<I", status_data, 98)[0] / 10
-        TMPBatCUTPR = unpack_from("<I", status_data, 102)[0] / 10
-        TMPMosOT = unpack_from("<I", status_data, 106)[0] / 10
-        TMPMosOTPR = unpack_from("<I", status_data, 110)[0] / 10
-        CellCount = unpack_from("<i", status_data, 114)[0]
-        BatChargeEN = unpack_from("<i", status_data, 118)[0]
-        BatDisChargeEN = unpack_from("<i", status_data, 122)[0]
-        BalanEN = unpack_from("<i", status_data, 126)[0]
-        CapBatCell = unpack_from("<i", status_data, 130)[0] / 1000
-        SCPDelay = unpack_from("<i", status_data, 134)[0]
+        settings = SETTINGS_LAYOUT.decode(status_data)
 
         # count of all cells in pack
-        self.cell_count = CellCount
+        self.cell_count = settings["CellCount"]
 
         # total Capaity in Ah
-        self.capacity = CapBatCell
+        self.capacity = settings["CapBatCell"]
 
         # Continued discharge current
-        self.max_battery_discharge_current = CurBatDcOC
+        self.max_battery_discharge_current = settings["CurBatDcOC"]
 
         # Continued charge current
-        self.max_battery_charge_current = CurBatCOC
-
-        logger.debug("VolSmartSleep: " + str(VolSmartSleep))
-        logger.debug("VolCellUV: " + str(VolCellUV))
-        logger.debug("VolCellUVPR: " + str(VolCellUVPR))
-        logger.debug("VolCellOV: " + str(VolCellOV))
-        logger.debug("VolCellOVPR: " + str(VolCellOVPR))
-        logger.debug("VolBalanTrig: " + str(VolBalanTrig))
-        logger.debug("VolBalanTrig: " + str(VolBalanTrig))
-        logger.debug("VolSOC_full: " + str(VolSOC_full))
-        logger.debug("VolSOC_empty: " + str(VolSOC_empty))
-        logger.debug("VolSysPwrOff: " + str(VolSysPwrOff))
-        logger.debug("CurBatCOC: " + str(CurBatCOC))
-        logger.debug("TIMBatCOCPDly: " + str(TIMBatCOCPDly))
-        logger.debug("TIMBatCOCPRDly: " + str(TIMBatCOCPRDly))
-        logger.debug("CurBatDcOC: " + str(CurBatDcOC))
-        logger.debug("TIMBatDcOCPDly: " + str(TIMBatDcOCPDly))
-        logger.debug("TIMBatDcOCPRDly: " + str(TIMBatDcOCPRDly))
-        logger.debug("TIMBatSCPRDly: " + str(TIMBatSCPRDly))
-        logger.debug("CurBalanMax: " + str(CurBalanMax))
-        logger.debug("TMPBatCOT: " + str(TMPBatCOT))
-        logger.debug("TMPBatCOTPR: " + str(TMPBatCOTPR))
-        logger.debug("TMPBatDcOT: " + str(TMPBatDcOT))
-        logger.debug("TMPBatDcOTPR: " + str(TMPBatDcOTPR))
-        logger.debug("TMPBatCUT: " + str(TMPBatCUT))
-        logger.debug("TMPBatCUTPR: " + str(TMPBatCUTPR))
-        logger.debug("TMPMosOT: " + str(TMPMosOT))
-        logger.debug("TMPMosOTPR: " + str(TMPMosOTPR))
-        logger.debug("CellCount: " + str(CellCount))
-        logger.debug("BatChargeEN: " + str(BatChargeEN))
-        logger.debug("BatDisChargeEN: " + str(BatDisChargeEN))
-        logger.debug("BalanEN: " + str(BalanEN))
-        logger.debug("CapBatCell: " + str(CapBatCell))
-        logger.debug("SCPDelay: " + str(SCPDelay))
+        self.max_battery_charge_current = settings["CurBatCOC"]
+
+        for name, value in settings.items():
+            logger.debug(f"{name}: {value}")
 
         status_data = self.read_serial_data_jkbms_pb(self.command_about, 300)
         serial_nr = status_data[86:96].decode("utf-8")
@@ -174,55 +175,55 @@ class Jkbms_pb(Battery):
         #        be = ''.join(format(x, ' 02X') for x in status_data)
         #        logger.error(be)
 
+        status = STATUS_LAYOUT.decode(status_data)
+
         # cell voltages
-        for c in range(self.cell_count):
-            if (unpack_from("<H", status_data, c * 2 + 6)[0] / 1000) != 0:
-                self.cells[c].voltage = unpack_from("<H", status_data, c * 2 + 6)[0] / 1000
+        for c, voltage in enumerate(status["cell_voltages"][: self.cell_count]):
+            if voltage != 0:
+                self.cells[c].voltage = voltage
 
         # MOSFET temperature
-        temperature_mos = unpack_from("<h", status_data, 144)[0] / 10
+        temperature_mos = status["temperature_mos"]
         self.to_temperature(0, temperature_mos if temperature_mos < 99 else (100 - temperature_mos))
 
         # Temperature sensors
-        temperature_1 = unpack_from("<h", status_data, 162)[0] / 10
-        temperature_2 = unpack_from("<h", status_data, 164)[0] / 10
-        temperature_3 = unpack_from("<h", status_data, 256)[0] / 10
-        temperature_4 = unpack_from("<h", status_data, 258)[0] / 10
+        temperature_1 = status["temperature_1"]
+        temperature_2 = status["temperature_2"]
+        temperature_3 = status["temperature_3"]
+        temperature_4 = status["temperature_4"]
+        sensors = status["temperature_sensors"]
 
-        if unpack_from("<B", status_data, 214)[0] & 0x02:
+        if sensors & 0x02:
             self.to_temperature(1, temperature_1 if temperature_1 < 99 else (100 - temperature_1))
-        if unpack_from("<B", status_data, 214)[0] & 0x04:
+        if sensors & 0x04:
             self.to_temperature(2, temperature_2 if temperature_2 < 99 else (100 - temperature_2))
-        if unpack_from("<B", status_data, 214)[0] & 0x10:
+        if sensors & 0x10:
             self.to_temperature(3, temperature_3 if temperature_3 < 99 else (100 - temperature_3))
-        if unpack_from("<B", status_data, 214)[0] & 0x20:
+        if sensors & 0x20:
             self.to_temperature(4, temperature_4 if temperature_4 < 99 else (100 - temperature_4))
 
         # Battery voltage
-        self.voltage = unpack_from("<I", status_data, 150)[0] / 1000
+        self.voltage = status["voltage"]
 
         # Battery ampere
-        self.current = unpack_from("<i", status_data, 158)[0] / 1000
+        self.current = status["current"]
 
         # SOC
-        self.soc = unpack_from("<B", status_data, 173)[0]
+        self.soc = status["soc"]
 
         # cycles
-        self.history.charge_cycles = unpack_from("<i", status_data, 182)[0]
+        self.history.charge_cycles = status["charge_cycles"]
 
         # capacity
-        self.capacity_remain = unpack_from("<i", status_data, 174)[0] / 1000
+        self.capacity_remain = status["capacity_remain"]
 
         # fuses
-        self.to_protection_bits(unpack_from("<I", status_data, 166)[0])
+        self.to_protection_bits(status["protection"])
 
         # bits
-        bal = unpack_from("<B", status_data, 172)[0]
-        charge = unpack_from("<B", status_data, 198)[0]
-        discharge = unpack_from("<B", status_data, 199)[0]
-        self.charge_fet = 1 if charge != 0 else 0
-        self.discharge_fet = 1 if discharge != 0 else 0
-        self.balancing = 1 if bal != 0 else 0
+        self.charge_fet = 1 if status["charge"] != 0 else 0
+        self.discharge_fet = 1 if status["discharge"] != 0 else 0
+        self.balancing = 1 if status["balancing"] != 0 else 0
 
         # show wich cells are balancing
         if self.get_min_cell() is not None and self.get_max_cell() is not None:
@@ -334,9 +335,8 @@ class Jkbms_pb(Battery):
         :param command: the command to be sent to the bms
         :return: True if everything is fine, else False
         """
-        modbus_msg = self.address
-        modbus_msg += command
-        modbus_msg += self.modbusCrc(modbus_msg)
+        # the commands are static, so the CRC is calculated only once per command
+        modbus_msg = crc16_modbus_frame(bytes(self.address) + command)
 
         data = read_serial_data(
             modbus_msg,
@@ -364,16 +364,6 @@ class Jkbms_pb(Battery):
 
     def modbusCrc(self, msg: str):
         """
-        copied from https://stackoverflow.com/a/75328573
         to calculate the needed checksum
         """
-        crc = 0xFFFF
-        for n in range(len(msg)):
-            crc ^= msg[n]
-            for i in range(8):
-                if crc & 1:
-                    crc >>= 1
-                    crc ^= 0xA001
-                else:
-                    crc >>= 1
-        return crc.to_bytes(2, "little")
+        return crc16_modbus_bytes(msg)
@@ -3,7 +3,7 @@
 # Notes
 # Updated by https://github.com/idstein
 
-from battery import Protection, Battery, Cell
+from battery import Protection, Battery, Cell, POLL_TIER_MEDIUM
 from utils import (
     bytearray_to_string,
     is_bit_set,
@@ -14,6 +14,7 @@ from utils import (
     SOC_LOW_ALARM,
     SOC_LOW_WARNING,
 )
+from utils_checksum import sum16_complement
 from struct import unpack_from, pack
 import struct
 import sys
@@ -179,7 +180,7 @@ FUNC_BUZZER_EN = 0x0200  # bit 9
 
 
 def checksum(payload):
-    return (0x10000 - sum(payload)) % 0x10000
+    return sum16_complement(payload)
 
 
 def cmd(op, reg, data):
@@ -460,7 +461,15 @@ class LltJbd(Battery):
     def refresh_data(self):
         self.write_charge_discharge_mos()
         self.write_balancer()
-        return self.read_gen_data() and self.read_cell_data()
+
+        # the cell voltages are not needed every poll
+        poll_tiers = self.get_due_poll_tiers()
+        result = self.read_gen_data()
+        if result and POLL_TIER_MEDIUM in poll_tiers:
+            result = self.read_cell_data()
+
+        self.set_poll_tiers_refreshed(poll_tiers, result)
+        return result
 
     def to_protection_bits(self, byte_data):
         tmp = bin(byte_data)[2:].rjust(13, ZERO_CHAR)
@@ -5,9 +5,29 @@
 
 from battery import Battery, Cell
 from utils import read_serial_data, logger
+from utils_checksum import sum16_complement
+from utils_layout import FrameLayout, LayoutField, hex_to_bytes
 import sys
 
 
+# status frame after the conversion from ASCII hex to binary without SOI, the values are big endian
+STATUS_LAYOUT = FrameLayout(
+    [
+        LayoutField("cell_count", 8, "B"),
+        LayoutField("cell_voltages", 9, "H", 1000, count=16),
+        LayoutField("temperature_sensor_count", 41, "B"),
+        # cell 1 to 4, MOSFET and environment in 0.1 K
+        LayoutField("temperatures", 42, "H", count=6),
+        LayoutField("current", 54, "h", 100),
+        LayoutField("voltage", 56, "H", 1000),
+        LayoutField("capacity_remain", 58, "H", 100),
+        LayoutField("capacity", 61, "H", 100),
+        LayoutField("cycles", 63, "H"),
+    ],
+    byteorder=">",
+)
+
+
 class Pace(Battery):
     def __init__(self, port, baud, address):
         super(Pace, self).__init__(port, baud, address)
@@ -70,15 +90,16 @@ class Pace(Battery):
         if status_data is False:
             return False
 
-        self.cell_count = int(status_data[17:19], 16)
+        status = self.decode_status_data(status_data)
+        self.cell_count = status["cell_count"]
         for i in range(0, self.cell_count):
             self.cells.append(Cell(False))
 
         # cycles
-        self.cycles = int(status_data[127:131], 16)
+        self.cycles = status["cycles"]
 
         # capacity
-        self.capacity_remain = int(status_data[117:121], 16) / 100
+        self.capacity_remain = status["capacity_remain"]
 
         # ######################### SOFTWARE VERSION #############################
         logger.debug("requesting software version")
@@ -343,11 +364,11 @@ class Pace(Battery):
         #        be = ''.join(format(x, ' 02X') for x in status_data)
         #        logger.error(be)
 
-        self.cell_count = int(status_data[17:19], 16)
+        status = self.decode_status_data(status_data)
+        self.cell_count = status["cell_count"]
         logger.debug("Cellcount: " + str(self.cell_count))
 
-        for i in range(0, self.cell_count):
-            n_v = int(status_data[19 + i * 4 : 19 + i * 4 + 4], 16) / 1000
+        for i, n_v in enumerate(status["cell_voltages"][: self.cell_count]):
             if self.cells[i].voltage is None or self.cells[i].voltage == 0:
                 self.cells[i].voltage = n_v
                 logger.debug("NOT low passing " + str(self.cells[i].voltage))
@@ -357,10 +378,10 @@ class Pace(Battery):
                 logger.debug("low passing " + str(n_v) + " to " + str(self.cells[i].voltage))
             logger.debug("Cell Voltage [" + str(i) + "]: " + str(self.cells[i].voltage))
 
-        temperature_sensor_count = int(status_data[83:85], 16)
+        temperature_sensor_count = status["temperature_sensor_count"]
         logger.debug("Temp sensor count: " + str(temperature_sensor_count))
-        for i in range(0, temperature_sensor_count):
-            v = round((int(status_data[85 + i * 4 : 85 + i * 4 + 4], 16) / 10) - 273, 1)
+        for i, temperature in enumerate(status["temperatures"][:temperature_sensor_count]):
+            v = round((temperature / 10) - 273, 1)
             logger.debug("Temperature [" + str(i) + "]: " + str(v))
             if i < 4:  # 0,1,2,3 are internal temps
                 self.to_temperature(i + 1, v)
@@ -368,20 +389,17 @@ class Pace(Battery):
                 self.to_temperature(0, v)
 
         # Battery voltage
-        self.voltage = int(status_data[113:117], 16) / 1000
+        self.voltage = status["voltage"]
 
         # Battery ampere
-        if status_data[109] & 0b1000000:
-            self.current = (int(status_data[109:113], 16) - 65535) / 100
-        else:
-            self.current = int(status_data[109:113], 16) / 100
+        self.current = status["current"]
 
         # cycles
-        self.cycles = int(status_data[127:131], 16)
+        self.cycles = status["cycles"]
 
         # capacity
-        self.capacity_remain = int(status_data[117:121], 16) / 100
-        self.capacity = int(status_data[123:127], 16) / 100
+        self.capacity_remain = status["capacity_remain"]
+        self.capacity = status["capacity"]
         logger.debug("Capacity: " + str(self.capacity))
         logger.debug("Remaing capacity: " + str(self.capacity_remain))
 
@@ -402,6 +420,16 @@ class Pace(Battery):
         logger.debug("SOC: " + str(self.soc) + "%")
         return True
 
+    @staticmethod
+    def decode_status_data(status_data: bytes) -> dict:
+        """
+        Convert the ASCII hex status frame to binary once and decode all values.
+
+        :param status_data: Status frame with SOI, checksum and EOI
+        :return: Values of `STATUS_LAYOUT`
+        """
+        return STATUS_LAYOUT.decode(hex_to_bytes(memoryview(status_data)[1:-5]))
+
     def unique_identifier(self) -> str:
         """
         Used to identify a BMS when multiple BMS are connected
@@ -451,10 +479,7 @@ class Pace(Battery):
             payload_length = int(data[10:13], 16)
             if len(data) >= (13 + payload_length + 5):
                 # CRC check
-                cal_chk = 0
-                for i in range(1, len(data) - 5):
-                    cal_chk += data[i]
-                cal_chk = 0xFFFF - cal_chk % 65536 + 1
+                cal_chk = sum16_complement(memoryview(data)[1:-5])
                 # CRC check
                 if cal_chk == int(data[-5:-1], 16):
                     logger.debug("CRC correct, return data")
@@ -2,6 +2,7 @@
 
 from battery import Battery, Cell
 from utils import bytearray_to_string, read_serial_data, unpack_from, logger
+from utils_checksum import crc16_modbus_bytes, crc16_modbus_frame
 from struct import unpack
 import struct
 import sys
@@ -213,24 +214,11 @@ class Renogy(Battery):
         return True
 
     def calc_crc(self, data):
-        crc = 0xFFFF
-        for pos in data:
-            crc ^= pos
-            for i in range(8):
-                if (crc & 1) != 0:
-                    crc >>= 1
-                    crc ^= 0xA001
-                else:
-                    crc >>= 1
-        return struct.pack("<H", crc)
+        return crc16_modbus_bytes(data)
 
     def generate_command(self, command):
-        buffer = bytearray(self.address)
-        buffer += self.command_read
-        buffer += command
-        buffer += self.calc_crc(buffer)
-
-        return buffer
+        # the commands are static, so the CRC is calculated only once per command
+        return crc16_modbus_frame(bytes(self.address) + self.command_read + command)
 
     def read_serial_data_renogy(self, command):
         # use the read_serial_data() function to read the data and then do BMS spesific checks (crc, start bytes, etc)
@@ -5,11 +5,30 @@
 # https://github.com/Louisvdw/dbus-serialbattery/pull/530
 
 from battery import Protection, Battery, Cell
-from utils import logger
-import serial
+from utils import logger, serial_port_manager, FrameParser, FRAME_FORMAT_ASCII_HEX
+from utils_checksum import length_checksum, sum16_complement
+from utils_layout import FrameLayout, LayoutField, hex_to_bytes
 import sys
 
 
+# status info (0x42) after the conversion from ASCII hex to binary, the values are big endian
+STATUS_LAYOUT = FrameLayout(
+    [
+        LayoutField("cell_count", 2, "B"),
+        LayoutField("cell_voltages", 3, "H", 1000, count=16),
+        # cell 1 to 4, environment and power/MOSFET in 0.1 K
+        LayoutField("temperatures", 36, "H", count=6),
+        LayoutField("current", 48, "h", 100),
+        LayoutField("voltage", 50, "H", 100),
+        LayoutField("capacity_remain", 52, "H", 100),
+        LayoutField("capacity", 55, "H", 100),
+        LayoutField("soc", 57, "H", 10),
+        LayoutField("charge_cycles", 61, "H"),
+    ],
+    byteorder=">",
+)
+
+
 class Seplos(Battery):
     def __init__(self, port, baud, address):
         super(Seplos, self).__init__(port, baud, address)
@@ -17,6 +36,7 @@ class Seplos(Battery):
         self.type = self.BATTERYTYPE
         self.poll_interval = 5000
         self.history.exclude_values_to_calculate = ["charge_cycles"]
+        self.frame_parser = FrameParser(FRAME_FORMAT_ASCII_HEX)
 
     BATTERYTYPE = "Seplos"
 
@@ -44,27 +64,12 @@ class Seplos(Battery):
     @staticmethod
     def get_checksum(frame: bytes) -> int:
         """implements the Seplos checksum algorithm, returns 4 bytes"""
-        checksum = 0
-        for b in frame:
-            checksum += b
-        checksum %= 0xFFFF
-        checksum ^= 0xFFFF
-        checksum += 1
-        return checksum
+        return sum16_complement(frame)
 
     @staticmethod
     def get_info_length(info: bytes) -> int:
         """implements the Seplos checksum for the info length"""
-        lenid = len(info)
-        if lenid == 0:
-            return 0
-
-        lchksum = (lenid & 0xF) + ((lenid >> 4) & 0xF) + ((lenid >> 8) & 0xF)
-        lchksum %= 16
-        lchksum ^= 0xF
-        lchksum += 1
-
-        return (lchksum << 12) + lenid
+        return length_checksum(len(info))
 
     @staticmethod
     def encode_cmd(address: bytes, cid2: int, info: bytes = b"") -> bytes:
@@ -166,7 +171,7 @@ class Seplos(Battery):
 
         try:
             logger.debug("alarm info raw {}".format(data))
-            return self.decode_alarm_data(bytes.fromhex(data.decode("ascii")))
+            return self.decode_alarm_data(hex_to_bytes(data))
         except (ValueError, UnicodeDecodeError) as e:
             logger.warning("could not hex-decode raw alarm data", exc_info=e)
             return False
@@ -212,34 +217,32 @@ class Seplos(Battery):
         return True
 
     def decode_status_data(self, data):
-        cell_count_offset = 4
-        voltage_offset = 6
-        temps_offset = 72
-        self.cell_count = Seplos.int_from_1byte_hex_ascii(data=data, offset=cell_count_offset)
+        status = STATUS_LAYOUT.decode(hex_to_bytes(data))
+        self.cell_count = status["cell_count"]
         if self.cell_count == len(self.cells):
-            for i in range(self.cell_count):
-                voltage = Seplos.int_from_2byte_hex_ascii(data, voltage_offset + i * 4) / 1000
+            for i, voltage in enumerate(status["cell_voltages"][: self.cell_count]):
                 self.cells[i].voltage = voltage
                 logger.debug("Voltage cell[{}]={}V".format(i, voltage))
 
-        self.temperature_1 = (Seplos.int_from_2byte_hex_ascii(data, temps_offset + 0 * 4) - 2731) / 10
-        self.temperature_2 = (Seplos.int_from_2byte_hex_ascii(data, temps_offset + 1 * 4) - 2731) / 10
-        self.temperature_3 = (Seplos.int_from_2byte_hex_ascii(data, temps_offset + 2 * 4) - 2731) / 10
-        self.temperature_4 = (Seplos.int_from_2byte_hex_ascii(data, temps_offset + 3 * 4) - 2731) / 10
-        temperature_environment = (Seplos.int_from_2byte_hex_ascii(data, temps_offset + 4 * 4) - 2731) / 10  # currently not available in the Battery class
-        self.temperature_mos = (Seplos.int_from_2byte_hex_ascii(data, temps_offset + 5 * 4) - 2731) / 10
+        temperatures = [(value - 2731) / 10 for value in status["temperatures"]]
+        self.temperature_1 = temperatures[0]
+        self.temperature_2 = temperatures[1]
+        self.temperature_3 = temperatures[2]
+        self.temperature_4 = temperatures[3]
+        temperature_environment = temperatures[4]  # currently not available in the Battery class
+        self.temperature_mos = temperatures[5]
         logger.debug("Temp cell1={}°C".format(self.temperature_1))
         logger.debug("Temp cell2={}°C".format(self.temperature_2))
         logger.debug("Temp cell3={}°C".format(self.temperature_3))
         logger.debug("Temp cell4={}°C".format(self.temperature_4))
         logger.debug("Environment temperature = {}°C,  Power/MOSFET temperature = {}°C".format(temperature_environment, self.temperature_mos))
 
-        self.current = Seplos.int_from_2byte_hex_ascii(data, offset=96, signed=True) / 100
-        self.voltage = Seplos.int_from_2byte_hex_ascii(data, offset=100) / 100
-        self.capacity_remain = Seplos.int_from_2byte_hex_ascii(data, offset=104) / 100
-        self.capacity = Seplos.int_from_2byte_hex_ascii(data, offset=110) / 100
-        self.soc = Seplos.int_from_2byte_hex_ascii(data, offset=114) / 10
-        self.history.charge_cycles = Seplos.int_from_2byte_hex_ascii(data, offset=122)
+        self.current = status["current"]
+        self.voltage = status["voltage"]
+        self.capacity_remain = status["capacity_remain"]
+        self.capacity = status["capacity"]
+        self.soc = status["soc"]
+        self.history.charge_cycles = status["charge_cycles"]
         self.hardware_version = "Seplos BMS {}S".format(self.cell_count)
         logger.debug("Current = {}A , Voltage = {}V".format(self.current, self.voltage))
         logger.debug("Capacity = {}/{}Ah , SOC = {}%".format(self.capacity_remain, self.capacity, self.soc))
@@ -275,13 +278,15 @@ class Seplos(Battery):
     def read_serial_data_seplos(self, command):
         logger.debug("read serial data seplos")
 
-        with serial.Serial(self.port, baudrate=self.baud_rate, timeout=1) as ser:
+        with serial_port_manager.connection(self.port, self.baud_rate) as ser:
             ser.flushOutput()
             ser.flushInput()
+            self.frame_parser.reset()
             written = ser.write(command)
             logger.debug("wrote {} bytes to serial port {}, command={}".format(written, self.port, command))
 
-            data = ser.readline()
+            # the frame ends with a carriage return, so readline() would always wait for the timeout
+            data = self.frame_parser.read_frame(ser, 1) or b""
 
             if not Seplos.is_valid_frame(data):
                 return False
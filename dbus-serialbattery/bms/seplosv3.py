@@ -8,20 +8,34 @@ import math
 import struct
 from typing import Union
 
-import ext.minimalmodbus as minimalmodbus
-import serial
 from battery import Battery, Cell, Protection
 from utils import logger, USE_BMS_DVCC_VALUES
+from utils_modbus import ModbusField, ModbusTransport, decode_string
 
 RETRYCNT = 3
 
+# the identification strings are adjacent, so they are read with one request
+IDENTIFY_FIELDS = [
+    ModbusField("factory", 0x1700, 10, 4, decode_string),
+    ModbusField("model", 0x170A, 10, 4, decode_string),
+    ModbusField("sw_version", 0x1714, 1, 4, decode_string),
+    ModbusField("serialnumber", 0x1715, 15, 4, decode_string),
+]
+
+DATA_FIELDS = [
+    ModbusField("pia", 0x1000, 0x12, 4),
+    ModbusField("pib", 0x1100, 0x1A, 4),
+    ModbusField("spa", 0x1300, 0x6A, 4),
+    ModbusField("sca", 0x1500, 0x04, 4),
+]
+
 
 class Seplosv3(Battery):
     def __init__(self, port, baud, address):
         super(Seplosv3, self).__init__(port, baud, address)
         self.type = "Seplos v3"
         self.serialnumber = ""
-        self.mbdev: Union[minimalmodbus.Instrument, None] = None
+        self.transport: Union[ModbusTransport, None] = None
         if address is not None and len(address) > 0:
             self.slaveaddress: int = int(address)
             self.slaveaddresses: list[int] = [self.slaveaddress]
@@ -41,30 +55,13 @@ class Seplosv3(Battery):
         packval = struct.pack("<H", value)
         return struct.unpack("<h", packval)[0]
 
-    def get_modbus(self, slaveaddress=0) -> minimalmodbus.Instrument:
-        # hack to allow communication to the Seplos BMS using minimodbus which uses slaveaddress 0 as broadcast
-        # Make sure we re-set these values whenever we want to access the modbus. Just in case of a
-        # multi-device setup with different addresses and subsequent tries on a different address modified it.
-        if slaveaddress == 0:
-            minimalmodbus._SLAVEADDRESS_BROADCAST = 0xF0
-        else:
-            minimalmodbus._SLAVEADDRESS_BROADCAST = 0
-
-        if self.mbdev is not None and slaveaddress == self.slaveaddress:
-            return self.mbdev
-
-        mbdev = minimalmodbus.Instrument(
-            self.port,
-            slaveaddress=slaveaddress,
-            mode="rtu",
-            close_port_after_each_call=True,
-            debug=False,
-        )
-        mbdev.serial.parity = minimalmodbus.serial.PARITY_NONE
-        mbdev.serial.stopbits = serial.STOPBITS_ONE
-        mbdev.serial.baudrate = 19200
-        mbdev.serial.timeout = 0.4
-        return mbdev
+    def get_modbus(self, slaveaddress=0) -> ModbusTransport:
+        if self.transport is not None and slaveaddress == self.slaveaddress:
+            return self.transport
+
+        # the Seplos BMS uses slaveaddress 0 as normal address, while minimalmodbus uses it as broadcast.
+        # Disable the broadcast only for this connection, so other Modbus devices are not affected
+        return ModbusTransport(self.port, slaveaddress, 19200, timeout=0.4, broadcast_address=None)
 
     def test_connection(self):
         """
@@ -82,36 +79,23 @@ class Seplosv3(Battery):
 
             for n in range(1, RETRYCNT):
                 try:
-                    factory = mbdev.read_string(registeraddress=0x1700, number_of_registers=10, functioncode=4)
+                    identification = mbdev.read(IDENTIFY_FIELDS)
+                    factory = identification["factory"]
                     if "XZH-ElecTech Co.,Ltd" in factory:
                         logger.info(f"Identified Seplos v3 by '{factory}' on slave address {self.slaveaddress}")
-                        model = mbdev.read_string(
-                            registeraddress=0x170A,
-                            number_of_registers=10,
-                            functioncode=4,
-                        )
+                        model = identification["model"]
                         logger.info(f"Model: {model}")
                         self.model = model.rstrip("\x00")
                         self.hardware_version = model.rstrip("\x00")
 
-                        sn = mbdev.read_string(
-                            registeraddress=0x1715,
-                            number_of_registers=15,
-                            functioncode=4,
-                        )
-                        self.serialnumber = sn.rstrip("\x00")
+                        self.serialnumber = identification["serialnumber"].rstrip("\x00")
                         logger.info(f"Serial nr: {self.serialnumber}")
 
-                        sw_version = mbdev.read_string(
-                            registeraddress=0x1714,
-                            number_of_registers=1,
-                            functioncode=4,
-                        )
-                        sw_version = sw_version.rstrip("\x00")
+                        sw_version = identification["sw_version"].rstrip("\x00")
                         self.version = sw_version[0] + "." + sw_version[1]
                         logger.info(f"Firmware Version: {self.version}")
                         found = True
-                        self.mbdev = mbdev
+                        self.transport = mbdev
 
                 except Exception as e:
                     logger.debug(f"Seplos v3 testing failed ({e}) {n}/{RETRYCNT} for {self.port}({str(self.slaveaddress)})")
@@ -147,12 +131,11 @@ class Seplosv3(Battery):
         spa, pia, pib, sca, pic, sfa = None, None, None, None, None, None
         try:
             mb = self.get_modbus(self.slaveaddress)
-            spa = mb.read_registers(registeraddress=0x1300, number_of_registers=0x6A, functioncode=4)
-            pia = mb.read_registers(registeraddress=0x1000, number_of_registers=0x12, functioncode=4)
-            pib = mb.read_registers(registeraddress=0x1100, number_of_registers=0x1A, functioncode=4)
-            sca = mb.read_registers(registeraddress=0x1500, number_of_registers=0x04, functioncode=4)
-            pic = mb.read_bits(0x1200, number_of_bits=0x90, functioncode=1)
-            sfa = mb.read_bits(0x1400, number_of_bits=0x50, functioncode=1)
+            with mb.transaction() as instrument:
+                data = mb.read(DATA_FIELDS)
+                spa, pia, pib, sca = data["spa"], data["pia"], data["pib"], data["sca"]
+                pic = instrument.read_bits(0x1200, number_of_bits=0x90, functioncode=1)
+                sfa = instrument.read_bits(0x1400, number_of_bits=0x50, functioncode=1)
             logger.debug(f"spa: {spa}")
             logger.debug(f"pia: {pia}")
             logger.debug(f"pib: {pib}")
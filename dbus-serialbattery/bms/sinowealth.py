@@ -17,8 +17,20 @@ class Sinowealth(Battery):
         self.type = self.BATTERYTYPE
         self.history.exclude_values_to_calculate = ["charge_cycles"]
         self.temperature_sensors = None
+        # read all cell voltages with one request, disabled if the chip does not support it
+        self.cell_block_read = True
+        # consecutive block reads that failed while the single reads worked
+        self.cell_block_read_failures = 0
+        # number of requests sent during the last refresh_data()
+        self.transaction_count = 0
+        self._transactions = 0
 
     # command bytes [StartFlag=0A][Command byte][response dataLength=2 to 20 bytes][checksum]
+    CELL_BLOCK_READ_FAILURES_MAX = 3
+    """
+    Consecutive failed block reads, after which the cell voltages are only read one by one
+    """
+
     command_base = b"\x0a\x00\x04"
     command_cell_base = b"\x01"
     command_total_voltage = b"\x0b"
@@ -39,6 +51,8 @@ class Sinowealth(Battery):
     BATTERYTYPE = "Sinowealth"
     LENGTH_CHECK = 0
     LENGTH_POS = 0
+    # maximum response data length of the chip, which are 10 cell voltages
+    RESPONSE_LENGTH_MAX = 20
 
     def test_connection(self):
         """
@@ -85,6 +99,7 @@ class Sinowealth(Battery):
         return True
 
     def refresh_data(self):
+        self._transactions = 0
         result = self.read_soc()
         result = result and self.read_status_data()
         result = result and self.read_battery_status()
@@ -94,6 +109,9 @@ class Sinowealth(Battery):
         result = result and self.read_temperature_data()
         result = result and self.read_remaining_capacity()
         result = result and self.read_cycle_count()
+
+        self.transaction_count = self._transactions
+        logger.debug(">>> INFO: refresh_data needed %u transactions", self.transaction_count)
         return result
 
     def read_status_data(self):
@@ -217,10 +235,55 @@ class Sinowealth(Battery):
         if self.cell_count is None:
             self.read_pack_config_data()
 
+        if self.cell_block_read:
+            cell_voltages = self.read_cell_voltages()
+            if cell_voltages is not False:
+                for c in range(self.cell_count):
+                    self.cells[c].voltage = cell_voltages[c]
+                self.cell_block_read_failures = 0
+                return True
+
+        # fallback: read one cell per request
         for c in range(self.cell_count):
             self.cells[c].voltage = self.read_cell_voltage(c + 1)
+
+        # the block read failed, but the single reads work. A single failure can be noise or a timeout,
+        # so the block read is retried with the next refresh and only disabled if it fails repeatedly
+        if self.cell_block_read and any(cell.voltage is not None for cell in self.cells[: self.cell_count]):
+            self.cell_block_read_failures += 1
+            if self.cell_block_read_failures >= self.CELL_BLOCK_READ_FAILURES_MAX:
+                logger.info(">>> INFO: Reading all cell voltages at once failed repeatedly, reading them one by one")
+                self.cell_block_read = False
+
         return True
 
+    def read_cell_voltages(self):
+        """
+        Read the voltages of all cells with as few requests as possible.
+        The cell voltage registers are contiguous, starting with cell 1.
+
+        :return: List with the cell voltages in V or False, if the read failed
+        """
+        cells_per_request = self.RESPONSE_LENGTH_MAX // 2
+        cell_voltages = []
+
+        for first_cell in range(1, self.cell_count + 1, cells_per_request):
+            count = min(cells_per_request, self.cell_count - first_cell + 1)
+            cell_data = self.read_serial_data_sinowealth(first_cell.to_bytes(1, byteorder="little"), count * 2)
+            if cell_data is False or len(cell_data) < count * 2 + 1:
+                return False
+
+            for cell_voltage in unpack_from(">" + str(count) + "H", cell_data):
+                # an implausible value means that the chip did not return contiguous cell registers
+                if not 0 < cell_voltage < 5000:
+                    logger.info(">>> INFO: Implausible cell voltage in block read: %u mV, reading the cell voltages one by one", cell_voltage)
+                    self.cell_block_read = False
+                    return False
+                cell_voltages.append(cell_voltage / 1000)
+
+        logger.debug(">>> INFO: Cell voltages: %s V", cell_voltages)
+        return cell_voltages
+
     def read_cell_voltage(self, cell_index):
         cell_data = self.read_serial_data_sinowealth(cell_index.to_bytes(1, byteorder="little"))
         if cell_data is False:
@@ -275,19 +338,23 @@ class Sinowealth(Battery):
         )
         return True
 
-    def generate_command(self, command):
+    def generate_command(self, command, length=None):
         buffer = bytearray(self.command_base)
         buffer[1] = command[0]
+        if length is not None:
+            buffer[2] = length
         return buffer
 
-    def read_serial_data_sinowealth(self, command):
+    def read_serial_data_sinowealth(self, command, length=None):
+        buffer = self.generate_command(command, length)
+        self._transactions += 1
         data = read_serial_data(
-            self.generate_command(command),
+            buffer,
             self.port,
             self.baud_rate,
             self.LENGTH_POS,
             self.LENGTH_CHECK,
-            int(self.generate_command(command)[2]),
+            int(buffer[2]),
         )
         if data is False:
             return False
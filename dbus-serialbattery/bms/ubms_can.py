@@ -87,6 +87,20 @@ class Ubms_Can(Battery):
 
     BATTERYTYPE = "UBMS CAN"
 
+    # frames sent cyclically by the BMS, the cell voltages (0x350 to 0x365) are left out,
+    # since other batteries use the same IDs for the inverter protocol
+    CAN_FRAMES = {
+        "BMS_INFO": [0x180],
+        "STATUS": [0xC0],
+        "PACK_VOLTAGE": [0xC1],
+        "CHARGE_LIMITS": [0xC2],
+        "MINMAX": [0xC4],
+    }
+
+    @classmethod
+    def is_own_can_frame(cls, frame_id: int) -> bool:
+        return any(frame_id in frame_ids for frame_ids in cls.CAN_FRAMES.values())
+
     def connection_name(self) -> str:
         return f"CAN socketcan:{self.port}" + (f"__{self.device_address}" if self.device_address != 0 else "")
 
@@ -1,100 +1,54 @@
 #!/usr/bin/python
 # -*- coding: utf-8 -*-
-import math
 import os
 import signal
 import sys
-from datetime import datetime
-from time import sleep
-from typing import Union
+from time import monotonic, sleep
+from typing import Any, Dict, List, Tuple, Union
 
 from dbus.mainloop.glib import DBusGMainLoop
 from gi.repository import GLib as gobject
 
 from battery import Battery
 from dbushelper import DbusHelper
+from utils_bus import BusScheduler, IoWorker, main_loop_monitor, PollScheduler
+from utils_profiler import profiler
+from utils_detection import DetectionCache, match_can_frames, ProbePlanner, sniff_serial
+from utils_registry import get_bms_types, get_driver, get_rss, log_import_statistics, TRANSPORT_BLE, TRANSPORT_CAN, TRANSPORT_SERIAL
 from utils import (
     BATTERY_ADDRESSES,
+    BATTERY_ADDRESSES_POLL_INTERVAL,
     BMS_TYPE,
     bytearray_to_string,
+    detection_cache_file_path,
+    DETECTION_CACHE,
+    DETECTION_SNIFF_TIME,
     DRIVER_VERSION,
     EXCLUDED_DEVICES,
     EXTERNAL_SENSOR_DBUS_DEVICE,
     EXTERNAL_SENSOR_DBUS_PATH_CURRENT,
     EXTERNAL_SENSOR_DBUS_PATH_SOC,
+    IO_WORKER,
     logger,
+    MAIN_LOOP_MONITOR,
     POLL_INTERVAL,
+    serial_port_manager,
     validate_config_values,
 )
 
-# import battery classes
-# TODO: import only the classes that are needed
-from bms.daly import Daly
-from bms.daren_485 import Daren485
-from bms.ecs import Ecs
-from bms.eg4_lifepower import EG4_Lifepower
-from bms.eg4_ll import EG4_LL
-from bms.felicity import Felicity
-from bms.heltecmodbus import HeltecModbus
-from bms.hlpdatabms4s import HLPdataBMS4S
-from bms.jkbms import Jkbms
-from bms.jkbms_pb import Jkbms_pb
-from bms.lltjbd import LltJbd
-from bms.pace import Pace
-from bms.renogy import Renogy
-from bms.seplos import Seplos
-from bms.seplosv3 import Seplosv3
-
 # add ext folder to sys.path
 sys.path.insert(1, os.path.join(os.path.dirname(__file__), "ext"))
 
-# enabled only if explicitly set in config under "BMS_TYPE"
-if "ANT" in BMS_TYPE:
-    from bms.ant import ANT
-if "MNB" in BMS_TYPE:
-    from bms.mnb import MNB
-if "Sinowealth" in BMS_TYPE:
-    from bms.sinowealth import Sinowealth
-
-supported_bms_types = [
-    {"bms": Daly, "baud": 9600, "address": b"\x40"},
-    {"bms": Daly, "baud": 9600, "address": b"\x80"},
-    {"bms": Daren485, "baud": 19200, "address": b"\x01"},
-    {"bms": Ecs, "baud": 19200},
-    {"bms": EG4_Lifepower, "baud": 9600, "address": b"\x01"},
-    {"bms": EG4_LL, "baud": 9600, "address": b"\x01"},
-    {"bms": Felicity, "baud": 9600, "address": b"\x01"},
-    {"bms": HeltecModbus, "baud": 9600, "address": b"\x01"},
-    {"bms": HLPdataBMS4S, "baud": 9600},
-    {"bms": Jkbms, "baud": 115200},
-    {"bms": Jkbms_pb, "baud": 115200, "address": b"\x01"},
-    {"bms": LltJbd, "baud": 9600, "address": b"\x00"},
-    {"bms": Pace, "baud": 9600, "address": b"\x00"},
-    {"bms": Renogy, "baud": 9600, "address": b"\x30"},
-    {"bms": Renogy, "baud": 9600, "address": b"\xf7"},
-    {"bms": Seplos, "baud": 19200, "address": b"\x00"},
-    {"bms": Seplosv3, "baud": 19200},
-]
-
-# enabled only if explicitly set in config under "BMS_TYPE"
-if "ANT" in BMS_TYPE:
-    supported_bms_types.append({"bms": ANT, "baud": 19200})
-if "MNB" in BMS_TYPE:
-    supported_bms_types.append({"bms": MNB, "baud": 9600})
-if "Sinowealth" in BMS_TYPE:
-    supported_bms_types.append({"bms": Sinowealth, "baud": 9600})
-
-expected_bms_types = [battery_type for battery_type in supported_bms_types if battery_type["bms"].__name__ in BMS_TYPE or len(BMS_TYPE) == 0]
+# the driver modules are only imported, when a BMS type is tested
+# drivers which are disabled by default are only added, if explicitly set in config under "BMS_TYPE"
+supported_bms_types = get_bms_types(TRANSPORT_SERIAL, BMS_TYPE)
+
+expected_bms_types = [battery_type for battery_type in supported_bms_types if battery_type["bms"].name in BMS_TYPE or len(BMS_TYPE) == 0]
 
 logger.info("")
 logger.info("Starting dbus-serialbattery")
 
 
-# count loops
-count_for_loops = 5
-delayed_loop_count = 0
-
-
 def main():
     global expected_bms_types, supported_bms_types
 
@@ -107,156 +61,255 @@ def main():
         """
         logger.info("Exit signal received, exiting gracefully...")
 
-        port = get_port()
-
         # Stop the main loop, if set
         if "mainloop" in globals() and mainloop is not None:
             mainloop.quit()
 
-        # For BLE connections, disconnect from the BLE device
-        if port.endswith("_Ble"):
-            if battery and len(battery) > 0 and hasattr(battery[0], "disconnect") and callable(battery[0].disconnect):
-                battery[0].disconnect()
+        # For BLE connections, disconnect from the BLE devices
+        for battery in batteries.values():
+            for battery_object in battery.values():
+                if battery_object.port.startswith("ble_") and hasattr(battery_object, "disconnect") and callable(battery_object.disconnect):
+                    battery_object.disconnect()
 
-        # Stop the CanReceiverThread
-        elif port.startswith(("can", "vecan", "vcan")):
-            if "can_thread" in globals() and can_thread is not None:
-                can_thread.stop()
+        # Stop the CanReceiverThreads
+        for can_thread in can_threads:
+            can_thread.stop()
 
-        # Close the serial connection
-        else:
-            # Currently not feasible to close the serial connection
-            # TODO: Is it worth implementing this?
-            pass
+        # Close the serial connections
+        serial_port_manager.close_all()
 
         logger.info(f"Stopped dbus-serialbattery with exit code {code}")
         sys.exit(code)
 
+    # found batteries by port and bus address
+    batteries: Dict[str, Dict[Any, Battery]] = {}
+
+    # receiver threads of the CAN ports
+    can_threads = []
+
+    # scheduler of each port, not set for ports with an active callback
+    schedulers: Dict[str, Union[PollScheduler, BusScheduler]] = {}
+
     # Register the signal handler
     signal.signal(signal.SIGINT, exit_driver)
     signal.signal(signal.SIGTERM, exit_driver)
 
-    def poll_battery(loop) -> bool:
+    # start a profiling session of the running driver, e.g. with "pkill -USR1 -f dbus-serialbattery.py"
+    signal.signal(signal.SIGUSR1, lambda sig, frame: profiler.start())
+
+    def poll_battery(loop, helper: Dict[Any, DbusHelper]) -> bool:
         """
         Polls the battery for data and updates it on the dbus.
         Calls `publish_battery` from DbusHelper for each battery instance which
         then calls `refresh_data` from the battery instance to update the data.
 
         :param loop: The main event loop
+        :param helper: DbusHelper of each battery on the port
         :return: Always returns True
         """
-        global count_for_loops, delayed_loop_count
-
-        # count execution time in milliseconds
-        start = datetime.now()
-
-        for key_address in battery:
+        # a failed battery is removed from the helpers in host mode
+        for key_address in list(helper):
             helper[key_address].publish_battery(loop)
 
-        runtime = (datetime.now() - start).total_seconds()
-        logger.debug(f"Polling data took {runtime:.3f} seconds")
-
-        # check if polling took too long and adjust poll interval, but only after 5 loops
-        # since the first polls are always slower
-        if runtime > battery[first_key].poll_interval / 1000:
-            delayed_loop_count += 1
-            if delayed_loop_count > 1:
-                logger.warning(f"Polling data took {runtime:.3f} seconds. Automatically increase interval in {count_for_loops - delayed_loop_count} cycles.")
-        else:
-            delayed_loop_count = 0
-
-        if delayed_loop_count >= count_for_loops:
-            # round up to the next half second
-            new_poll_interval = math.ceil((runtime + 0.05) * 2) / 2 * 1000
-
-            # limit max poll interval to 60 seconds
-            if new_poll_interval > 60000:
-                new_poll_interval = 60000
+        return True
 
-            battery[first_key].poll_interval = new_poll_interval
-            logger.warning(f"Polling took too long for the last {count_for_loops} cycles. Set to {new_poll_interval/1000:.3f} s")
+    def test_bms_type(test: dict, _port: str, _bus_address: hex = None, can_transport_interface: object = None, record: bool = True) -> Union[Battery, None]:
+        """
+        Tests one BMS type and returns the battery object if it answered.
 
-            delayed_loop_count = 0
+        :param test: Entry of `expected_bms_types`.
+        :param _port: The port to connect to.
+        :param _bus_address: The Modbus/CAN address to connect to (optional).
+        :param record: Let the probe planner learn from the result.
+        :return: The battery object if a connection is established, otherwise None.
+        :raises KeyboardInterrupt: if the driver is stopped
+        """
+        found = False
+        time_start = monotonic()
+        # noinspection PyBroadException
+        try:
+            if _bus_address is not None:
+                # Convert hex string to bytes
+                _bms_address = bytes.fromhex(_bus_address.replace("0x", ""))
+            elif "address" in test:
+                _bms_address = test["address"]
+            else:
+                _bms_address = None
+
+            logger.info("Testing " + test["bms"].name + (' at address "' + bytearray_to_string(_bms_address) + '"' if _bms_address is not None else ""))
+            # the driver module is imported on the first test
+            batteryClass = test["bms"].load()
+            baud = test["baud"] if "baud" in test else None
+            battery: Battery = batteryClass(port=_port, baud=baud, address=_bms_address)
+            battery.set_can_transport_interface(can_transport_interface)
+            found = bool(battery.test_connection() and battery.validate_data())
+            if found:
+                logger.info("-- Connection established to " + battery.__class__.__name__)
+                return battery
+        except KeyboardInterrupt:
+            raise
+        except Exception:
+            (
+                exception_type,
+                exception_object,
+                exception_traceback,
+            ) = sys.exc_info()
+            file = exception_traceback.tb_frame.f_code.co_filename
+            line = exception_traceback.tb_lineno
+            logger.error("Non blocking exception occurred: " + f"{repr(exception_object)} of type {exception_type} in {file} line #{line}")
+            # Ignore any malfunction test_function()
+        finally:
+            duration = monotonic() - time_start
+            logger.info(f"Testing {test['bms'].name} took {duration:.3f} s")
+            if record:
+                probe_planner.record(test, duration, found)
 
-        return True
+        return None
 
     def get_battery(_port: str, _bus_address: hex = None, can_transport_interface: object = None) -> Union[Battery, None]:
         """
         Attempts to establish a connection to the battery and returns the battery object if successful.
+        The BMS type found on the last start is tried first, all expected BMS types only if it does not answer.
+        If BMS types are recognized by listening on the port, only they are tested, the others only if none answers.
+        They are tested in the order of the probe planner, grouped by baud rate and the most promising first.
 
         :param _port: The port to connect to.
         :param _bus_address: The Modbus/CAN address to connect to (optional).
         :return: The battery object if a connection is established, otherwise None.
         """
-        # Try to establish communications with the battery 3 times, else exit
-        retry = 1
-        retries = 3
-        while retry <= retries:
-            logger.info("-- Testing BMS: " + str(retry) + " of " + str(retries) + " rounds")
-            # Create a new battery object that can read the battery and run connection test
-            for test in expected_bms_types:
-                # noinspection PyBroadException
-                try:
-                    if _bus_address is not None:
-                        # Convert hex string to bytes
-                        _bms_address = bytes.fromhex(_bus_address.replace("0x", ""))
-                    elif "address" in test:
-                        _bms_address = test["address"]
-                    else:
-                        _bms_address = None
-
-                    logger.info(
-                        "Testing " + test["bms"].__name__ + (' at address "' + bytearray_to_string(_bms_address) + '"' if _bms_address is not None else "")
-                    )
-                    batteryClass = test["bms"]
-                    baud = test["baud"] if "baud" in test else None
-                    battery: Battery = batteryClass(port=_port, baud=baud, address=_bms_address)
-                    battery.set_can_transport_interface(can_transport_interface)
-                    if battery.test_connection() and battery.validate_data():
-                        logger.info("-- Connection established to " + battery.__class__.__name__)
+        try:
+            if detection_cache is not None:
+                cached = detection_cache.get_candidate(_port, _bus_address, expected_bms_types)
+                if cached is not None:
+                    logger.info("-- Testing BMS found on the last start")
+                    # not learned, else the cache would be written on each start
+                    battery = test_bms_type(cached, _port, _bus_address, can_transport_interface, record=False)
+                    if battery is not None:
                         return battery
-                except KeyboardInterrupt:
-                    return None
-                except Exception:
-                    (
-                        exception_type,
-                        exception_object,
-                        exception_traceback,
-                    ) = sys.exc_info()
-                    file = exception_traceback.tb_frame.f_code.co_filename
-                    line = exception_traceback.tb_lineno
-                    logger.error("Non blocking exception occurred: " + f"{repr(exception_object)} of type {exception_type} in {file} line #{line}")
-                    # Ignore any malfunction test_function()
-                    pass
-            retry += 1
-            sleep(0.5)
+                    logger.info("-- BMS found on the last start did not answer, testing all BMS types")
+
+            wait_for_port()
+
+            # do not send foreign frames to the bus, if the BMS type can be recognized by its frames
+            sniffed_bms_types = sniff_bms_types(_port, can_transport_interface)
+            if len(sniffed_bms_types) > 0:
+                bms_types_steps = [sniffed_bms_types, [bms_type for bms_type in expected_bms_types if bms_type not in sniffed_bms_types]]
+            else:
+                bms_types_steps = [expected_bms_types]
+
+            for step, bms_types in enumerate(bms_types_steps):
+                if len(bms_types) == 0:
+                    continue
+                if step > 0:
+                    logger.info("-- Recognized BMS did not answer, testing all other BMS types")
+
+                # Try to establish communications with the battery 3 times, else exit
+                retry = 1
+                retries = 3
+                while retry <= retries:
+                    logger.info("-- Testing BMS: " + str(retry) + " of " + str(retries) + " rounds")
+                    # Create a new battery object that can read the battery and run connection test
+                    for test in probe_planner.plan(bms_types):
+                        battery = test_bms_type(test, _port, _bus_address, can_transport_interface)
+                        if battery is not None:
+                            if detection_cache is not None:
+                                detection_cache.store(_port, _bus_address, test)
+                            return battery
+                    retry += 1
+                    sleep(0.5)
+        except KeyboardInterrupt:
+            return None
+        finally:
+            # keep the learned test durations for the next start
+            probe_planner.save()
 
         return None
 
-    def get_port() -> str:
+    def wait_for_port() -> None:
         """
-        Retrieves the port to connect to from the command line arguments.
+        Waits once for the serial port to settle, before all BMS types are tested.
 
-        :return: The port to connect to.
+        :return: None
         """
-        if len(sys.argv) > 1:
-            port = sys.argv[1]
-            if port not in EXCLUDED_DEVICES:
-                return port
-            else:
-                logger.debug("Stopping dbus-serialbattery: " + str(port) + " is excluded through the config file")
-                sleep(60)
-                # Exit with error so that the serialstarter continues
-                exit_driver(None, None, 1)
-        elif "MNB" in BMS_TYPE:
-            # Special case for MNB-SPI
-            logger.info("No Port needed")
-            return "/dev/ttyUSB9"
-        else:
+        nonlocal port_settle_time, ports_settled
+        if port_settle_time > 0:
+            logger.info(f"Wait {port_settle_time} seconds for the port to be ready")
+            sleep(port_settle_time)
+            port_settle_time = 0
+            # the ports settle at the same time, the other ports do not have to wait again
+            ports_settled = True
+
+    def sniff_bms_types(_port: str, can_transport_interface: object = None) -> list:
+        """
+        Recognizes the BMS types by the frames received on the port, before any BMS type is tested.
+        A serial port is listened on only once, also if several addresses are tested.
+
+        :param _port: The port to listen on.
+        :param can_transport_interface: CAN transport interface, if it's a CAN port.
+        :return: Entries of `expected_bms_types`, whose frames were received.
+        """
+        nonlocal sniffed_serial_bms_types
+        if DETECTION_SNIFF_TIME == 0:
+            return []
+
+        # the CAN frames were received while waiting for the bus to settle
+        if can_transport_interface is not None:
+            return match_can_frames(can_transport_interface.can_message_cache_callback(), expected_bms_types)
+
+        if sniffed_serial_bms_types is None:
+            logger.info(f"Listen on {_port} for frames of known BMS types")
+            sniffed_serial_bms_types = sniff_serial(_port, expected_bms_types, DETECTION_SNIFF_TIME)
+        return sniffed_serial_bms_types
+
+    def get_ports() -> List[Tuple[str, Union[str, None]]]:
+        """
+        Retrieves the ports to connect to from the command line arguments.
+
+        The serial starter passes one port and a Bluetooth BMS is passed as BMS type and Bluetooth address.
+        With several ports the driver runs in host mode: one process serves all ports, each with its own I/O worker,
+        and registers a separate dbus service for each battery. A Bluetooth BMS is passed as `BMS type:address`, e.g.
+        `./dbus-serialbattery.py /dev/ttyUSB0 /dev/ttyUSB1 can0 Jkbms_Ble:C8:47:8C:12:34:56`
+
+        :return: The ports to connect to, with the Bluetooth address for a Bluetooth BMS.
+        """
+        arguments = sys.argv[1:]
+
+        if len(arguments) == 0:
+            if "MNB" in BMS_TYPE:
+                # Special case for MNB-SPI
+                logger.info("No Port needed")
+                return [("/dev/ttyUSB9", None)]
+
             logger.error("ERROR >>> No port specified in the command line arguments")
             sleep(60)
             exit_driver(None, None, 1)
 
+        # Bluetooth BMS started by its service
+        if len(arguments) == 2 and arguments[0].endswith("_Ble"):
+            arguments = [arguments[0] + ":" + arguments[1]]
+
+        ports = []
+        for argument in arguments:
+            port, ble_address = argument, None
+            if argument.partition(":")[0].endswith("_Ble"):
+                port, _, ble_address = argument.partition(":")
+                if ble_address == "":
+                    logger.error(f"ERROR >>> Bluetooth address is missing in the command line arguments for {port}")
+                    continue
+
+            if port in EXCLUDED_DEVICES:
+                logger.debug("Stopping dbus-serialbattery: " + str(port) + " is excluded through the config file")
+                continue
+
+            ports.append((port, ble_address))
+
+        if len(ports) == 0:
+            sleep(60)
+            # Exit with error so that the serialstarter continues
+            exit_driver(None, None, 1)
+
+        return ports
+
     def check_bms_types(supported_bms_types, type) -> None:
         """
         Checks if BMS_TYPE is not empty and all specified BMS types are supported.
@@ -279,183 +332,285 @@ def main():
 
         if len(bms_types) > 0:
             for bms_type in bms_types:
-                if bms_type not in [bms["bms"].__name__ for bms in supported_bms_types]:
+                if bms_type not in [bms["bms"].name for bms in supported_bms_types]:
                     logger.error(
                         f'ERROR >>> BMS type "{bms_type}" is not supported. Supported BMS types are: '
-                        + f"{', '.join([bms['bms'].__name__ for bms in supported_bms_types])}"
+                        + f"{', '.join([bms['bms'].name for bms in supported_bms_types])}"
                         + "; Disabled by default: ANT, MNB, Sinowealth"
                     )
                     exit_driver(None, None, 1)
 
-    # read the version of Venus OS
-    with open("/opt/victronenergy/version", "r") as f:
-        venus_version = f.readline().strip()
+    def find_batteries(port: str, ble_address: Union[str, None] = None) -> Dict[Any, Battery]:
+        """
+        Finds the batteries on one port.
 
-    # read the GX device type
-    with open("/sys/firmware/devicetree/base/model", "r") as f:
-        gx_device_type = f.readline().strip()
+        :param port: The port to connect to, for a Bluetooth BMS the BMS type.
+        :param ble_address: The Bluetooth address, if it's a Bluetooth BMS.
+        :return: The found batteries by bus address, empty if none was found.
+        """
+        global expected_bms_types, supported_bms_types
+        nonlocal port_settle_time, sniffed_serial_bms_types
+        battery = {}
 
-    # show Venus OS version and device type
-    logger.info("Venus OS " + venus_version + " running on " + gx_device_type)
+        # the state of the detection is kept per port
+        port_settle_time = 0
+        sniffed_serial_bms_types = None
+        supported_bms_types = get_bms_types(TRANSPORT_SERIAL, BMS_TYPE)
+        expected_bms_types = [battery_type for battery_type in supported_bms_types if battery_type["bms"].name in BMS_TYPE or len(BMS_TYPE) == 0]
 
-    # show the version of the driver
-    logger.info("dbus-serialbattery v" + str(DRIVER_VERSION))
+        # BLUETOOTH
+        if port.endswith("_Ble"):
+            """
+            Import BLE classes only if it's a BLE port; otherwise, the driver won't start due to missing Python modules.
+            This prevents issues when using the driver exclusively with a serial connection.
+            """
+            driver = get_driver(port, TRANSPORT_BLE)
 
-    port = get_port()
-    battery = {}
+            if driver is None:
+                logger.error("ERROR >>> Unknown Bluetooth BMS type: " + port)
+                logger.error(
+                    "Supported Bluetooth BMS types (CASE SENSITIVE!): " + ", ".join(bms_type["bms"].name for bms_type in get_bms_types(TRANSPORT_BLE, []))
+                )
+                if not host_mode:
+                    sleep(60)
+                return battery
 
-    # BLUETOOTH
-    if port.endswith("_Ble"):
-        """
-        Import BLE classes only if it's a BLE port; otherwise, the driver won't start due to missing Python modules.
-        This prevents issues when using the driver exclusively with a serial connection.
-        """
+            class_ = driver.load()
 
-        if len(sys.argv) <= 2:
-            logger.error("ERROR >>> Bluetooth address is missing in the command line arguments")
-            sleep(60)
-            exit_driver(None, None, 1)
+            # do not remove ble_ prefix, since the dbus service cannot be only numbers
+            testbms = class_("ble_" + ble_address.replace(":", "").lower(), 9600, ble_address)
+
+            if testbms.test_connection():
+                logger.info("-- Connection established to " + testbms.__class__.__name__)
+                battery[0] = testbms
+
+        # CAN
+        elif port.startswith(("can", "vecan", "vcan")):
+            """
+            Import CAN classes only if it's a CAN port; otherwise, the driver won't start due to missing Python modules.
+            This prevents issues when using the driver exclusively with a serial connection.
+
+            can: Older GX devices and Raspberry Pi with CAN hat
+            vecan: Newer Venus GX devices
+            vcan: Virtual CAN interface for testing
+            """
+            # only try CAN BMS on CAN port
+            supported_bms_types = get_bms_types(TRANSPORT_CAN, BMS_TYPE)
+
+            # check if BMS_TYPE is not empty and all BMS types in the list are supported
+            check_bms_types(supported_bms_types, "can")
+
+            expected_bms_types = [battery_type for battery_type in supported_bms_types if battery_type["bms"].name in BMS_TYPE or len(BMS_TYPE) == 0]
+
+            # If no BMS type is supported, use all supported BMS types
+            if len(expected_bms_types) == 0:
+                logger.warning(f"No supported CAN BMS type found in BMS_TYPE: {', '.join(BMS_TYPE)}. Using all supported BMS types.")
+                expected_bms_types = supported_bms_types
+
+            # start the corresponding CanReceiverThread if BMS for this type found
+            from utils_can import CanReceiverThread, CanTransportInterface
+
+            # find the bitrate by listening only, before the receiver is started and anything is sent to the bus
+            bitrate = CanReceiverThread.detect_bitrate(port)
+
+            try:
+                can_thread = CanReceiverThread.get_instance(bustype="socketcan", channel=port, bitrate=bitrate)
+                can_threads.append(can_thread)
+            except Exception as e:
+                logger.error(f"Error while accessing CAN interface: {e}")
+                if not host_mode:
+                    sleep(60)
+                return battery
+
+            # wait until thread has initialized
+            if not can_thread.can_initialised.wait(2):
+                logger.error("Timeout while accessing CAN interface")
+                if not host_mode:
+                    sleep(60)
+                return battery
+
+            can_transport_interface = CanTransportInterface()
+            can_transport_interface.can_message_cache_callback = can_thread.get_message_cache
+            can_transport_interface.can_bus = can_thread.can_bus
+            logger.debug("Wait shortly to make sure that all needed data is in the cache")
+            # Slowest message cycle transmission is every 1 second, wait a bit more for the first time to fetch all needed data (only jk bms)
+            sleep(2)
+            addresses = [None] if len(BATTERY_ADDRESSES) == 0 else BATTERY_ADDRESSES  # use default address, if not configured
+
+            for address in addresses:
+                bat = get_battery(port, address, can_transport_interface)
+                if bat:
+                    battery[address] = bat
+                    logger.info(f"Successful battery connection at {port} and this address {str(address)}")
+                else:
+                    logger.warning(f"No battery connection at {port} and this address {str(address)}")
+
+        # SERIAL
         else:
-            ble_address = sys.argv[2]
+            # check if BMS_TYPE is not empty and all BMS types in the list are supported
+            check_bms_types(supported_bms_types, "serial")
+
+            # wait some seconds to be sure that the serial connection is ready
+            # else the error throw a lot of timeouts
+            # the wait is skipped, if the BMS found on the last start answers or another port already waited
+            port_settle_time = 0 if ports_settled else 16
+
+            # Check if BATTERY_ADDRESSES is not empty
+            if BATTERY_ADDRESSES:
+                for address in BATTERY_ADDRESSES:
+                    found_battery = get_battery(port, address)
+                    if found_battery:
+                        battery[address] = found_battery
+                        logger.info(f"Successful battery connection at {port} and this address {address}")
+                    else:
+                        logger.warning(f"No battery connection at {port} and this address {address}")
+            # Use default address
+            else:
+                found_battery = get_battery(port)
+                if found_battery:
+                    battery[0] = found_battery
 
-            if port == "Jkbms_Ble":
-                # noqa: F401 --> ignore flake "imported but unused" error
-                from bms.jkbms_ble import Jkbms_Ble  # noqa: F401
+        return battery
 
-            elif port == "Kilovault_Ble":
-                # noqa: F401 --> ignore flake "imported but unused" error
-                from bms.kilovault_ble import Kilovault_Ble  # noqa: F401
+    def start_polling(port: str, battery: Dict[Any, Battery], helper: Dict[Any, DbusHelper]) -> None:
+        """
+        Starts polling the batteries of one port. Each port gets its own I/O worker, so the ports are polled concurrently.
 
-            elif port == "LiTime_Ble":
-                # noqa: F401 --> ignore flake "imported but unused" error
-                from bms.litime_ble import LiTime_Ble  # noqa: F401
+        :param port: The port of the batteries.
+        :param battery: The batteries on the port by bus address.
+        :param helper: The DbusHelper of each battery.
+        :return: None
+        """
+        # get first key from battery dict
+        first_key = list(battery.keys())[0]
 
-            elif port == "LltJbd_Ble":
-                # noqa: F401 --> ignore flake "imported but unused" error
-                from bms.lltjbd_ble import LltJbd_Ble  # noqa: F401
+        # try using active callback on this battery (normally only used for Bluetooth BMS)
+        if battery[first_key].use_callback(lambda: poll_battery(mainloop, helper)):
+            logger.info(f"Polling interval of {port}: active callback used")
+            return
 
-            else:
-                logger.error("ERROR >>> Unknown Bluetooth BMS type: " + port)
-                logger.error("Supported Bluetooth BMS types (CASE SENSITIVE!): Jkbms_Ble, Kilovault_Ble, LiTime_Ble, LltJbd_Ble")
-                sleep(60)
-                exit_driver(None, None, 1)
+        # change poll interval if set in config
+        for key_address in battery:
+            if key_address in BATTERY_ADDRESSES and BATTERY_ADDRESSES_POLL_INTERVAL:
+                battery[key_address].poll_interval = BATTERY_ADDRESSES_POLL_INTERVAL[BATTERY_ADDRESSES.index(key_address)]
+            elif POLL_INTERVAL is not None:
+                battery[key_address].poll_interval = POLL_INTERVAL
 
-            class_ = eval(port)
+        # read the data from the BMS in a separate thread, so the main loop is not blocked meanwhile
+        io_worker = None
+        if IO_WORKER:
+            io_worker = IoWorker(port)
+            io_worker.start()
 
-            # do not remove ble_ prefix, since the dbus service cannot be only numbers
-            testbms = class_("ble_" + ble_address.replace(":", "").lower(), 9600, ble_address)
+        # multiple batteries on one bus, let the bus scheduler interleave them
+        if len(battery) > 1:
+            bus_scheduler = BusScheduler(port, mainloop, io_worker)
 
-            if testbms.test_connection():
-                logger.info("-- Connection established to " + testbms.__class__.__name__)
-                battery[0] = testbms
+            for key_address in battery:
+                logger.info(f"Polling interval of battery {key_address} on {port}: {battery[key_address].poll_interval/1000:.3f} s")
+                bus_scheduler.add(key_address, helper[key_address], battery[key_address].poll_interval)
+
+            bus_scheduler.start()
+            schedulers[port] = bus_scheduler
+
+        else:
+            logger.info(f"Polling interval of {port}: {battery[first_key].poll_interval/1000:.3f} s")
 
-    # CAN
-    elif port.startswith(("can", "vecan", "vcan")):
+            # if not possible, poll the battery every poll_interval milliseconds,
+            # the interval is increased if the polls take longer and decreased again if they are fast
+            poll_scheduler = PollScheduler(helper[first_key], mainloop, io_worker)
+            poll_scheduler.start()
+            schedulers[port] = poll_scheduler
+
+    def remove_battery(port: str, key_address: Any, helper: Dict[Any, DbusHelper]) -> None:
         """
-        Import CAN classes only if it's a CAN port; otherwise, the driver won't start due to missing Python modules.
-        This prevents issues when using the driver exclusively with a serial connection.
+        Removes a failed battery in host mode, so the batteries on the other ports keep running.
+        The main loop is only stopped, when the last battery failed.
 
-        can: Older GX devices and Raspberry Pi with CAN hat
-        vecan: Newer Venus GX devices
-        vcan: Virtual CAN interface for testing
+        :param port: The port of the battery.
+        :param key_address: The bus address of the battery.
+        :param helper: The DbusHelper of each battery on the port.
+        :return: None
         """
-        from bms.daly_can import Daly_Can
-        from bms.jkbms_can import Jkbms_Can
-        from bms.ubms_can import Ubms_Can
+        logger.error(f"ERROR >>> Battery {key_address} on {port} failed, removing it and continuing with the other batteries")
 
-        # only try CAN BMS on CAN port
-        supported_bms_types = [
-            {"bms": Daly_Can},
-            {"bms": Jkbms_Can},
-            {"bms": Ubms_Can},
-        ]
+        # stop polling the battery
+        scheduler = schedulers.get(port)
+        if isinstance(scheduler, BusScheduler):
+            scheduler.remove(key_address)
+        elif scheduler is not None:
+            scheduler.stop()
 
-        # check if BMS_TYPE is not empty and all BMS types in the list are supported
-        check_bms_types(supported_bms_types, "can")
+        # remove the dbus service, the active callback polls only the remaining helpers
+        helper.pop(key_address).remove_vedbus()
 
-        expected_bms_types = [battery_type for battery_type in supported_bms_types if battery_type["bms"].__name__ in BMS_TYPE or len(BMS_TYPE) == 0]
+        battery_object = batteries[port].pop(key_address)
+        if battery_object.port.startswith("ble_") and hasattr(battery_object, "disconnect") and callable(battery_object.disconnect):
+            battery_object.disconnect()
 
-        # If no BMS type is supported, use all supported BMS types
-        if len(expected_bms_types) == 0:
-            logger.warning(f"No supported CAN BMS type found in BMS_TYPE: {', '.join(BMS_TYPE)}. Using all supported BMS types.")
-            expected_bms_types = supported_bms_types
+        if len(batteries[port]) == 0:
+            del batteries[port]
+            if scheduler is not None and scheduler.worker is not None:
+                scheduler.worker.stop()
 
-        # start the corresponding CanReceiverThread if BMS for this type found
-        from utils_can import CanReceiverThread, CanTransportInterface
+        if len(batteries) == 0:
+            logger.error("ERROR >>> All batteries failed, stopping the driver")
+            mainloop.quit()
 
-        try:
-            can_thread = CanReceiverThread.get_instance(bustype="socketcan", channel=port)
-        except Exception as e:
-            logger.error(f"Error while accessing CAN interface: {e}")
-            sleep(60)
-            exit_driver(None, None, 1)
+    # read the version of Venus OS
+    with open("/opt/victronenergy/version", "r") as f:
+        venus_version = f.readline().strip()
 
-        # wait until thread has initialized
-        if not can_thread.can_initialised.wait(2):
-            logger.error("Timeout while accessing CAN interface")
-            sleep(60)
-            exit_driver(None, None, 1)
+    # read the GX device type
+    with open("/sys/firmware/devicetree/base/model", "r") as f:
+        gx_device_type = f.readline().strip()
 
-        can_transport_interface = CanTransportInterface()
-        can_transport_interface.can_message_cache_callback = can_thread.get_message_cache
-        can_transport_interface.can_bus = can_thread.can_bus
-        logger.debug("Wait shortly to make sure that all needed data is in the cache")
-        # Slowest message cycle transmission is every 1 second, wait a bit more for the first time to fetch all needed data (only jk bms)
-        sleep(2)
-        addresses = [None] if len(BATTERY_ADDRESSES) == 0 else BATTERY_ADDRESSES  # use default address, if not configured
+    # show Venus OS version and device type
+    logger.info("Venus OS " + venus_version + " running on " + gx_device_type)
 
-        for busspeed in [250, 500]:
-            for address in addresses:
-                bat = get_battery(port, address, can_transport_interface)
-                if bat:
-                    battery[address] = bat
-                    logger.info(f"Successful battery connection at {port} and this address {str(address)}")
-                else:
-                    logger.warning(f"No battery connection at {port} and this address {str(address)}")
+    # show the version of the driver
+    logger.info("dbus-serialbattery v" + str(DRIVER_VERSION))
 
-            # if we've found at least 1 battery, stop the search here. otherwise retry with other bus speeds
-            if len(battery) > 0:
-                break
+    ports = get_ports()
 
-            logger.info(f"Found no devices on can bus, retrying with {busspeed} kbps")
-            can_thread.setup_can(channel=port, bitrate=busspeed, force=True)
-            sleep(2)
+    # serve several ports in one process
+    host_mode = len(ports) > 1
+    if host_mode:
+        logger.info("Host mode for the ports: " + ", ".join(port if ble_address is None else f"{port}:{ble_address}" for port, ble_address in ports))
 
-    # SERIAL
-    else:
-        # check if BMS_TYPE is not empty and all BMS types in the list are supported
-        check_bms_types(supported_bms_types, "serial")
+    # memory before the first driver is imported
+    rss_start = get_rss()
 
-        # wait some seconds to be sure that the serial connection is ready
-        # else the error throw a lot of timeouts
-        sleep(16)
+    # seconds to wait for the port, before all BMS types are tested
+    port_settle_time = 0
 
-        # Check if BATTERY_ADDRESSES is not empty
-        if BATTERY_ADDRESSES:
-            for address in BATTERY_ADDRESSES:
-                found_battery = get_battery(port, address)
-                if found_battery:
-                    battery[address] = found_battery
-                    logger.info(f"Successful battery connection at {port} and this address {address}")
-                else:
-                    logger.warning(f"No battery connection at {port} and this address {address}")
-        # Use default address
-        else:
-            battery[0] = get_battery(port)
+    # set after the wait, all ports settle at the same time
+    ports_settled = False
+
+    # BMS types recognized by listening on the serial port
+    sniffed_serial_bms_types = None
+
+    # try the BMS type found on the last start first
+    detection_cache = DetectionCache(detection_cache_file_path) if DETECTION_CACHE else None
+    probe_planner = ProbePlanner(detection_cache)
+
+    for port, ble_address in ports:
+        battery = find_batteries(port, ble_address)
+
+        if len(battery) == 0:
+            logger.error(
+                f"ERROR >>> No battery connection at {port}"
+                + (" and this bus addresses: " + ", ".join(BATTERY_ADDRESSES) if BATTERY_ADDRESSES and not port.endswith("_Ble") else "")
+                + (f" {ble_address}" if ble_address is not None else "")
+            )
+            continue
 
-    # check if at least one BMS was found
-    battery_found = False
+        batteries[port if ble_address is None else f"{port}:{ble_address}"] = battery
 
-    for key_address in battery:
-        if battery[key_address] is not None:
-            battery_found = True
+    log_import_statistics(rss_start)
 
-    if not battery_found:
-        logger.error(
-            f"ERROR >>> No battery connection at {port}"
-            + (" and this bus addresses: " + ", ".join(BATTERY_ADDRESSES) if BATTERY_ADDRESSES else "")
-            + (f" {ble_address}" if port.endswith("_Ble") else "")
-        )
+    # check if at least one BMS was found, in host mode the ports without a battery are skipped
+    if len(batteries) == 0:
         exit_driver(None, None, 1)
 
     # Have a mainloop, so we can send/receive asynchronous calls to and from dbus
@@ -464,56 +619,49 @@ def main():
         gobject.threads_init()
     mainloop = gobject.MainLoop()
 
-    # Get the initial values for the battery used by setup_vedbus
-    helper = {}
+    for port, battery in batteries.items():
+        # Get the initial values for the battery used by setup_vedbus
+        helper = {}
 
-    for key_address in battery:
-        helper[key_address] = DbusHelper(battery[key_address], key_address)
-        if not helper[key_address].setup_vedbus():
-            logger.error(
-                f"ERROR >>> Problem with battery set up at {port}"
-                + (" and this bus address: " + ", ".join(BATTERY_ADDRESSES) if BATTERY_ADDRESSES else "")
-                + (f" {ble_address}" if port.endswith("_Ble") else "")
-            )
-            exit_driver(None, None, 1)
-
-        # Calculate the initial values for the battery
-        battery[key_address].set_calculated_data()
+        for key_address in battery:
+            helper[key_address] = DbusHelper(battery[key_address], key_address)
+            if not helper[key_address].setup_vedbus():
+                logger.error(
+                    f"ERROR >>> Problem with battery set up at {port}"
+                    + (" and this bus address: " + ", ".join(BATTERY_ADDRESSES) if BATTERY_ADDRESSES and not port.partition(":")[0].endswith("_Ble") else "")
+                )
+                exit_driver(None, None, 1)
 
-    # get first key from battery dict
-    first_key = list(battery.keys())[0]
+            # Calculate the initial values for the battery
+            battery[key_address].set_calculated_data()
 
-    # try using active callback on this battery (normally only used for Bluetooth BMS)
-    if not battery[first_key].use_callback(lambda: poll_battery(mainloop)):
-        # change poll interval if set in config
-        if POLL_INTERVAL is not None:
-            battery[first_key].poll_interval = POLL_INTERVAL
+            # in host mode a failed battery must not stop the batteries on the other ports
+            if host_mode:
+                helper[key_address].on_failed = lambda port=port, key_address=key_address, helper=helper: remove_battery(port, key_address, helper)
 
-        logger.info(f"Polling interval: {battery[first_key].poll_interval/1000:.3f} s")
+        start_polling(port, battery, helper)
 
-        # if not possible, poll the battery every poll_interval milliseconds
-        gobject.timeout_add(
-            battery[first_key].poll_interval,
-            lambda: poll_battery(mainloop),
-        )
-    else:
-        logger.info("Polling interval: active callback used")
+    if MAIN_LOOP_MONITOR:
+        main_loop_monitor.start()
 
     # print log at this point, else not all data is correctly populated
-    for key_address in battery:
-        battery[key_address].log_settings()
+    for battery in batteries.values():
+        for key_address in battery:
+            battery[key_address].log_settings()
 
     # check config, if there are any invalid values trigger "settings incorrect" error
     # and set the battery in error state to prevent chargin/discharging
     if not validate_config_values():
-        for key_address in battery:
-            battery[key_address].state = 10
-            battery[key_address].error_code = 119
+        for battery in batteries.values():
+            for key_address in battery:
+                battery[key_address].state = 10
+                battery[key_address].error_code = 119
 
     # check, if external current sensor should be used
     if EXTERNAL_SENSOR_DBUS_DEVICE is not None and (EXTERNAL_SENSOR_DBUS_PATH_CURRENT is not None or EXTERNAL_SENSOR_DBUS_PATH_SOC is not None):
-        for key_address in battery:
-            battery[key_address].setup_external_sensor()
+        for battery in batteries.values():
+            for key_address in battery:
+                battery[key_address].setup_external_sensor()
 
     # Run the main loop
     try:
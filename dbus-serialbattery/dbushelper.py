@@ -4,13 +4,17 @@ import os
 import platform
 import dbus
 import traceback
-from time import sleep, time
+from time import monotonic, sleep, time
 from utils import logger, publish_config_variables
+from utils_bus import main_loop_monitor
+from utils_profiler import profiler
+from utils_publish import FilteredServiceContext, get_publish_filter
 import utils
 from xml.etree import ElementTree
 import requests
 import threading
 import json
+from typing import Callable, Union
 
 # add path to velib_python
 sys.path.insert(1, os.path.join(os.path.dirname(__file__), "ext", "velib_python"))
@@ -69,10 +73,19 @@ class DbusHelper:
         """
         Last time the history values were calculated.
         """
+        self.publish_filter = get_publish_filter(utils.PUBLISH_FILTER)
+        """
+        Filter of the values published to dbus, None if all values are published
+        """
         self.telemetry_upload_error_count: int = 0
         self.telemetry_upload_interval: int = 60 * 60 * 3  # 3 hours
         self.telemetry_upload_last: int = 0
         self.telemetry_upload_running: bool = False
+        self.on_failed: Union[Callable[[], None], None] = None
+        """
+        Called instead of quitting the main loop, if the battery failed. Set in host mode, so the batteries on the
+        other ports keep running
+        """
 
     def create_pid_file(self) -> bool:
         """
@@ -747,6 +760,35 @@ class DbusHelper:
                 onchangecallback=self.battery.reset_soc_callback,
             )
 
+        # statistics for troubleshooting, they change each poll
+        if utils.PUBLISH_DEBUG_VALUES:
+            # learned timing of the connection to the BMS
+            if self.battery.link_timing is not None:
+                for key in self.battery.link_timing.get_statistics():
+                    self._dbusservice.add_path(f"/Debug/Link/{key}", None, writeable=False)
+
+            # effective poll interval and how often the polls took longer
+            for key in self.battery.poll_timing.get_statistics():
+                self._dbusservice.add_path(f"/Debug/Poll/{key}", None, writeable=False)
+
+            # start a profiling session by writing 1, it's 1 while the session is running
+            self._dbusservice.add_path("/Debug/Profile", 0, writeable=True, onchangecallback=self.profile_callback)
+
+            # how many values of the filtered paths were published and suppressed
+            if self.publish_filter is not None:
+                for key in self.publish_filter.get_statistics():
+                    self._dbusservice.add_path(f"/Debug/Publish/{key}", None, writeable=False)
+
+            # duration of the phases of each poll
+            for phase, statistics in self.battery.cycle_timing.get_statistics().items():
+                for key in statistics:
+                    self._dbusservice.add_path(f"/Debug/Timing/{phase}/{key}", None, writeable=False)
+
+        # how long the main loop was blocked, e.g. while waiting for the BMS
+        if utils.MAIN_LOOP_MONITOR:
+            for key in main_loop_monitor.get_statistics():
+                self._dbusservice.add_path(f"/Debug/MainLoop/{key}", None, writeable=False)
+
         self._dbusservice.add_path("/JsonData", None, writeable=False)
 
         # register VeDbusService after all paths where added
@@ -756,16 +798,23 @@ class DbusHelper:
 
         return True
 
-    def publish_battery(self, loop) -> None:
+    def publish_battery(self, loop, result: bool = None) -> None:
         """
         Publishes the battery data to dbus.
         This is called every battery.poll_interval milli second as set up per battery type to read and update the data
 
         :param loop: The main loop of the driver.
+        :param result: Result of `refresh_data()`, if the data was already refreshed by the `IoWorker`.
+            If None, the data is refreshed here.
         """
+        cycle_timing = self.battery.cycle_timing
+        cycle_start = monotonic()
+
         try:
-            # Call the battery's refresh_data function
-            result = self.battery.refresh_data()
+            # Call the battery's refresh_data function, if the worker did not already
+            if result is None:
+                with cycle_timing.span("RefreshData"):
+                    result = self.battery.refresh_data()
 
             # Check if external sensor is still connected
             if utils.EXTERNAL_SENSOR_DBUS_DEVICE is not None and (
@@ -782,7 +831,8 @@ class DbusHelper:
                     self.battery.setup_external_sensor()
 
             # Calculate the values for the battery
-            self.battery.set_calculated_data()
+            with cycle_timing.span("SetCalculatedData"):
+                self.battery.set_calculated_data()
 
             if result:
                 # reset error variables
@@ -846,17 +896,21 @@ class DbusHelper:
 
                 # if the battery did not update in 60 second, it's assumed to be completely failed
                 if time_since_first_error >= 60 and (utils.BLOCK_ON_DISCONNECT or not self.cell_voltages_good):
-                    loop.quit()
+                    self.battery_failed(loop)
+                    return
 
                 # if the cells are between 3.2 and 3.3 volt we can continue for some time
                 if time_since_first_error >= 60 * utils.BLOCK_ON_DISCONNECT_TIMEOUT_MINUTES and not utils.BLOCK_ON_DISCONNECT:
-                    loop.quit()
+                    self.battery_failed(loop)
+                    return
 
             # This is to manage CVCL
-            self.battery.manage_charge_voltage()
+            with cycle_timing.span("ManageChargeVoltage"):
+                self.battery.manage_charge_voltage()
 
             # This is to manage CCL\DCL
-            self.battery.manage_charge_and_discharge_current()
+            with cycle_timing.span("ManageChargeAndDischargeCurrent"):
+                self.battery.manage_charge_and_discharge_current()
 
             # Manage battery error code reset
             # Check if the error code should be reset every hour
@@ -880,307 +934,364 @@ class DbusHelper:
                 self.battery.state = 9
 
             # publish all the data from the battery object to dbus
-            self.publish_dbus()
+            with cycle_timing.span("PublishDbus"):
+                self.publish_dbus()
 
             # upload telemetry data
             self.telemetry_upload()
 
+            cycle_timing.record("PublishBattery", cycle_start, monotonic())
+            cycle_timing.end_cycle()
+
         except Exception:
             traceback.print_exc()
+            self.battery_failed(loop)
+
+    def battery_failed(self, loop) -> None:
+        """
+        Stop the driver, because the battery failed. In host mode only the failed battery is removed by `on_failed`
+        and the main loop keeps running for the other batteries.
+
+        :param loop: The main loop of the driver.
+        :return: None
+        """
+        if self.on_failed is not None:
+            self.on_failed()
+        else:
             loop.quit()
 
+    def remove_vedbus(self) -> None:
+        """
+        Remove the dbus service of the battery, e.g. after it failed in host mode.
+
+        :return: None
+        """
+        # deregister the service and all its paths immediately, see VeDbusService.__del__()
+        self._dbusservice.__del__()
+
     def publish_dbus(self) -> None:
         """
         Publishes the battery data to dbus and refresh it.
+
+        All values of a cycle are set in one transaction, so the changed values are sent with one
+        `ItemsChanged` signal on the root instead of one `PropertiesChanged` signal per path.
+        Values jittering within the deadbands of `PUBLISH_FILTER` are not set.
         """
-        self._dbusservice["/System/NrOfCellsPerBattery"] = self.battery.cell_count
-        if utils.SOC_CALCULATION or utils.EXTERNAL_SENSOR_DBUS_PATH_SOC is not None:
-            self._dbusservice["/Soc"] = round(self.battery.soc_calc, 2) if self.battery.soc_calc is not None else None
-            # add original SOC for comparing
-            self._dbusservice["/SocBms"] = round(self.battery.soc, 2) if self.battery.soc is not None else None
-        else:
-            self._dbusservice["/Soc"] = round(self.battery.soc_calc, 2) if self.battery.soc is not None else None
-        self._dbusservice["/Soh"] = round(self.battery.soh, 2) if self.battery.soh is not None else None
-        self._dbusservice["/Dc/0/Voltage"] = round(self.battery.voltage, 2) if self.battery.voltage is not None else None
-        self._dbusservice["/Dc/0/Current"] = round(self.battery.current_calc, 2) if self.battery.current_calc is not None else None
-        self._dbusservice["/Dc/0/Power"] = round(self.battery.power_calc, 2) if self.battery.power_calc is not None else None
-        self._dbusservice["/Dc/0/Temperature"] = self.battery.get_temperature()
-        self._dbusservice["/Capacity"] = self.battery.get_capacity_remain()
-        self._dbusservice["/ConsumedAmphours"] = self.battery.get_capacity_consumed()
-
-        midpoint, deviation = self.battery.get_midvoltage()
-        if midpoint is not None:
-            self._dbusservice["/Dc/0/MidVoltage"] = midpoint
-            self._dbusservice["/Dc/0/MidVoltageDeviation"] = deviation
-
-        # Update battery extras
-        self._dbusservice["/State"] = self.battery.state
-        # https://github.com/victronenergy/veutil/blob/master/inc/veutil/ve_regs_payload.h
-        # https://github.com/victronenergy/veutil/blob/master/src/qt/bms_error.cpp
-        self._dbusservice["/ErrorCode"] = self.battery.error_code
-        self._dbusservice["/ConnectionInformation"] = self.battery.connection_info
-
-        self._dbusservice["/History/DeepestDischarge"] = (
-            abs(self.battery.history.deepest_discharge) * -1 if self.battery.history.deepest_discharge is not None else None
-        )
-        self._dbusservice["/History/LastDischarge"] = abs(self.battery.history.last_discharge) * -1 if self.battery.history.last_discharge is not None else None
-        self._dbusservice["/History/AverageDischarge"] = (
-            abs(self.battery.history.average_discharge) * -1 if self.battery.history.average_discharge is not None else None
-        )
-        self._dbusservice["/History/TotalAhDrawn"] = abs(self.battery.history.total_ah_drawn) * -1 if self.battery.history.total_ah_drawn is not None else None
-        self._dbusservice["/History/ChargeCycles"] = self.battery.history.charge_cycles
-        self._dbusservice["/History/FullDischarges"] = self.battery.history.full_discharges
-        self._dbusservice["/History/MinimumVoltage"] = self.battery.history.minimum_voltage
-        self._dbusservice["/History/MaximumVoltage"] = self.battery.history.maximum_voltage
-        self._dbusservice["/History/MinimumCellVoltage"] = self.battery.history.minimum_cell_voltage
-        self._dbusservice["/History/MaximumCellVoltage"] = self.battery.history.maximum_cell_voltage
-        self._dbusservice["/History/TimeSinceLastFullCharge"] = (
-            int(time()) - self.battery.history.timestamp_last_full_charge if self.battery.history.timestamp_last_full_charge is not None else None
-        )
-        self._dbusservice["/History/LowVoltageAlarms"] = self.battery.history.low_voltage_alarms
-        self._dbusservice["/History/HighVoltageAlarms"] = self.battery.history.high_voltage_alarms
-        self._dbusservice["/History/MinimumTemperature"] = self.battery.history.minimum_temperature
-        self._dbusservice["/History/MaximumTemperature"] = self.battery.history.maximum_temperature
-        self._dbusservice["/History/DischargedEnergy"] = self.battery.history.discharged_energy
-        self._dbusservice["/History/ChargedEnergy"] = self.battery.history.charged_energy
-        self._dbusservice["/History/Clear"] = self.battery.history.clear
-
-        self._dbusservice["/Io/AllowToCharge"] = 1 if self.battery.get_allow_to_charge() else 0
-        self._dbusservice["/Io/AllowToDischarge"] = 1 if self.battery.get_allow_to_discharge() else 0
-        self._dbusservice["/Io/AllowToBalance"] = 1 if self.battery.get_allow_to_balance() else 0
-        self._dbusservice["/System/NrOfModulesBlockingCharge"] = 0 if self.battery.get_allow_to_charge() else 1
-        self._dbusservice["/System/NrOfModulesBlockingDischarge"] = 0 if self.battery.get_allow_to_discharge() else 1
-        self._dbusservice["/System/NrOfModulesOnline"] = 1 if self.battery.online else 0
-        self._dbusservice["/System/NrOfModulesOffline"] = 0 if self.battery.online else 1
-        self._dbusservice["/System/MinCellTemperature"] = self.battery.get_min_temperature()
-        self._dbusservice["/System/MinTemperatureCellId"] = self.battery.get_min_temperature_id()
-        self._dbusservice["/System/MaxCellTemperature"] = self.battery.get_max_temperature()
-        self._dbusservice["/System/MaxTemperatureCellId"] = self.battery.get_max_temperature_id()
-        self._dbusservice["/System/MOSTemperature"] = self.battery.temperature_mos
-        self._dbusservice["/System/Temperature1"] = self.battery.temperature_1
-        self._dbusservice["/System/Temperature1Name"] = utils.TEMPERATURE_1_NAME
-        self._dbusservice["/System/Temperature2"] = self.battery.temperature_2
-        self._dbusservice["/System/Temperature2Name"] = utils.TEMPERATURE_2_NAME
-        self._dbusservice["/System/Temperature3"] = self.battery.temperature_3
-        self._dbusservice["/System/Temperature3Name"] = utils.TEMPERATURE_3_NAME
-        self._dbusservice["/System/Temperature4"] = self.battery.temperature_4
-        self._dbusservice["/System/Temperature4Name"] = utils.TEMPERATURE_4_NAME
-
-        # Voltage control
-        self._dbusservice["/Info/BatteryLowVoltage"] = self.battery.min_battery_voltage
-        self._dbusservice["/Info/MaxChargeVoltage"] = (
-            round(self.battery.control_voltage + utils.VOLTAGE_DROP, 2) if self.battery.control_voltage is not None else None
-        )
+        with self._dbusservice as context:
+            dbusservice = FilteredServiceContext(context, self.publish_filter) if self.publish_filter is not None else context
+
+            dbusservice["/System/NrOfCellsPerBattery"] = self.battery.cell_count
+            if utils.SOC_CALCULATION or utils.EXTERNAL_SENSOR_DBUS_PATH_SOC is not None:
+                dbusservice["/Soc"] = round(self.battery.soc_calc, 2) if self.battery.soc_calc is not None else None
+                # add original SOC for comparing
+                dbusservice["/SocBms"] = round(self.battery.soc, 2) if self.battery.soc is not None else None
+            else:
+                dbusservice["/Soc"] = round(self.battery.soc_calc, 2) if self.battery.soc is not None else None
+            dbusservice["/Soh"] = round(self.battery.soh, 2) if self.battery.soh is not None else None
+            dbusservice["/Dc/0/Voltage"] = round(self.battery.voltage, 2) if self.battery.voltage is not None else None
+            dbusservice["/Dc/0/Current"] = round(self.battery.current_calc, 2) if self.battery.current_calc is not None else None
+            dbusservice["/Dc/0/Power"] = round(self.battery.power_calc, 2) if self.battery.power_calc is not None else None
+            dbusservice["/Dc/0/Temperature"] = self.battery.get_temperature()
+            dbusservice["/Capacity"] = self.battery.get_capacity_remain()
+            dbusservice["/ConsumedAmphours"] = self.battery.get_capacity_consumed()
+
+            midpoint, deviation = self.battery.get_midvoltage()
+            if midpoint is not None:
+                dbusservice["/Dc/0/MidVoltage"] = midpoint
+                dbusservice["/Dc/0/MidVoltageDeviation"] = deviation
+
+            # Update battery extras
+            dbusservice["/State"] = self.battery.state
+            # https://github.com/victronenergy/veutil/blob/master/inc/veutil/ve_regs_payload.h
+            # https://github.com/victronenergy/veutil/blob/master/src/qt/bms_error.cpp
+            dbusservice["/ErrorCode"] = self.battery.error_code
+            dbusservice["/ConnectionInformation"] = self.battery.connection_info
+
+            dbusservice["/History/DeepestDischarge"] = (
+                abs(self.battery.history.deepest_discharge) * -1 if self.battery.history.deepest_discharge is not None else None
+            )
+            dbusservice["/History/LastDischarge"] = abs(self.battery.history.last_discharge) * -1 if self.battery.history.last_discharge is not None else None
+            dbusservice["/History/AverageDischarge"] = (
+                abs(self.battery.history.average_discharge) * -1 if self.battery.history.average_discharge is not None else None
+            )
+            dbusservice["/History/TotalAhDrawn"] = abs(self.battery.history.total_ah_drawn) * -1 if self.battery.history.total_ah_drawn is not None else None
+            dbusservice["/History/ChargeCycles"] = self.battery.history.charge_cycles
+            dbusservice["/History/FullDischarges"] = self.battery.history.full_discharges
+            dbusservice["/History/MinimumVoltage"] = self.battery.history.minimum_voltage
+            dbusservice["/History/MaximumVoltage"] = self.battery.history.maximum_voltage
+            dbusservice["/History/MinimumCellVoltage"] = self.battery.history.minimum_cell_voltage
+            dbusservice["/History/MaximumCellVoltage"] = self.battery.history.maximum_cell_voltage
+            dbusservice["/History/TimeSinceLastFullCharge"] = (
+                int(time()) - self.battery.history.timestamp_last_full_charge if self.battery.history.timestamp_last_full_charge is not None else None
+            )
+            dbusservice["/History/LowVoltageAlarms"] = self.battery.history.low_voltage_alarms
+            dbusservice["/History/HighVoltageAlarms"] = self.battery.history.high_voltage_alarms
+            dbusservice["/History/MinimumTemperature"] = self.battery.history.minimum_temperature
+            dbusservice["/History/MaximumTemperature"] = self.battery.history.maximum_temperature
+            dbusservice["/History/DischargedEnergy"] = self.battery.history.discharged_energy
+            dbusservice["/History/ChargedEnergy"] = self.battery.history.charged_energy
+            dbusservice["/History/Clear"] = self.battery.history.clear
+
+            dbusservice["/Io/AllowToCharge"] = 1 if self.battery.get_allow_to_charge() else 0
+            dbusservice["/Io/AllowToDischarge"] = 1 if self.battery.get_allow_to_discharge() else 0
+            dbusservice["/Io/AllowToBalance"] = 1 if self.battery.get_allow_to_balance() else 0
+            dbusservice["/System/NrOfModulesBlockingCharge"] = 0 if self.battery.get_allow_to_charge() else 1
+            dbusservice["/System/NrOfModulesBlockingDischarge"] = 0 if self.battery.get_allow_to_discharge() else 1
+            dbusservice["/System/NrOfModulesOnline"] = 1 if self.battery.online else 0
+            dbusservice["/System/NrOfModulesOffline"] = 0 if self.battery.online else 1
+            dbusservice["/System/MinCellTemperature"] = self.battery.get_min_temperature()
+            dbusservice["/System/MinTemperatureCellId"] = self.battery.get_min_temperature_id()
+            dbusservice["/System/MaxCellTemperature"] = self.battery.get_max_temperature()
+            dbusservice["/System/MaxTemperatureCellId"] = self.battery.get_max_temperature_id()
+            dbusservice["/System/MOSTemperature"] = self.battery.temperature_mos
+            dbusservice["/System/Temperature1"] = self.battery.temperature_1
+            dbusservice["/System/Temperature1Name"] = utils.TEMPERATURE_1_NAME
+            dbusservice["/System/Temperature2"] = self.battery.temperature_2
+            dbusservice["/System/Temperature2Name"] = utils.TEMPERATURE_2_NAME
+            dbusservice["/System/Temperature3"] = self.battery.temperature_3
+            dbusservice["/System/Temperature3Name"] = utils.TEMPERATURE_3_NAME
+            dbusservice["/System/Temperature4"] = self.battery.temperature_4
+            dbusservice["/System/Temperature4Name"] = utils.TEMPERATURE_4_NAME
+
+            # Voltage control
+            dbusservice["/Info/BatteryLowVoltage"] = self.battery.min_battery_voltage
+            dbusservice["/Info/MaxChargeVoltage"] = (
+                round(self.battery.control_voltage + utils.VOLTAGE_DROP, 2) if self.battery.control_voltage is not None else None
+            )
 
-        # Charge control
-        self._dbusservice["/Info/MaxChargeCurrent"] = self.battery.control_charge_current
-        self._dbusservice["/Info/MaxDischargeCurrent"] = self.battery.control_discharge_current
-
-        # Voltage and charge control info (custom dbus paths)
-        self._dbusservice["/Info/ChargeMode"] = self.battery.charge_mode
-        self._dbusservice["/Info/ChargeModeDebug"] = self.battery.charge_mode_debug
-        self._dbusservice["/Info/ChargeModeDebugFloat"] = self.battery.charge_mode_debug_float
-        self._dbusservice["/Info/ChargeModeDebugBulk"] = self.battery.charge_mode_debug_bulk
-        self._dbusservice["/Info/ChargeLimitation"] = self.battery.charge_limitation
-        self._dbusservice["/Info/DischargeLimitation"] = self.battery.discharge_limitation
-
-        # Updates from cells
-        self._dbusservice["/System/MinVoltageCellId"] = self.battery.get_min_cell_desc()
-        self._dbusservice["/System/MaxVoltageCellId"] = self.battery.get_max_cell_desc()
-        self._dbusservice["/System/MinCellVoltage"] = self.battery.get_min_cell_voltage()
-        self._dbusservice["/System/MaxCellVoltage"] = self.battery.get_max_cell_voltage()
-        self._dbusservice["/Balancing"] = self.battery.get_balancing()
-
-        # Update the alarms
-        self.battery.protection.set_previous()
-        self._dbusservice["/Alarms/LowVoltage"] = self.battery.protection.low_voltage
-        self._dbusservice["/Alarms/LowCellVoltage"] = self.battery.protection.low_cell_voltage
-        # disable high voltage warning temporarly, if loading to bulk voltage and bulk voltage reached is 30 minutes ago
-        self._dbusservice["/Alarms/HighVoltage"] = (
-            self.battery.protection.high_voltage
-            if (self.battery.soc_reset_requested is False and self.battery.soc_reset_last_reached < int(time()) - (60 * 30))
-            else 0
-        )
-        self._dbusservice["/Alarms/HighCellVoltage"] = (
-            self.battery.protection.high_cell_voltage
-            if (self.battery.soc_reset_requested is False and self.battery.soc_reset_last_reached < int(time()) - (60 * 30))
-            else 0
-        )
-        self._dbusservice["/Alarms/LowSoc"] = self.battery.protection.low_soc
-        self._dbusservice["/Alarms/HighChargeCurrent"] = self.battery.protection.high_charge_current
-        self._dbusservice["/Alarms/HighDischargeCurrent"] = self.battery.protection.high_discharge_current
-        self._dbusservice["/Alarms/CellImbalance"] = self.battery.protection.cell_imbalance
-        self._dbusservice["/Alarms/InternalFailure"] = self.battery.protection.internal_failure
-        self._dbusservice["/Alarms/HighChargeTemperature"] = self.battery.protection.high_charge_temperature
-        self._dbusservice["/Alarms/LowChargeTemperature"] = self.battery.protection.low_charge_temperature
-        self._dbusservice["/Alarms/HighTemperature"] = self.battery.protection.high_temperature
-        self._dbusservice["/Alarms/LowTemperature"] = self.battery.protection.low_temperature
-        self._dbusservice["/Alarms/BmsCable"] = 2 if self.battery.block_because_disconnect else 0
-        self._dbusservice["/Alarms/HighInternalTemperature"] = self.battery.protection.high_internal_temperature
-        self._dbusservice["/Alarms/FuseBlown"] = self.battery.protection.fuse_blown
+            # Charge control
+            dbusservice["/Info/MaxChargeCurrent"] = self.battery.control_charge_current
+            dbusservice["/Info/MaxDischargeCurrent"] = self.battery.control_discharge_current
+
+            # Voltage and charge control info (custom dbus paths)
+            dbusservice["/Info/ChargeMode"] = self.battery.charge_mode
+            dbusservice["/Info/ChargeModeDebug"] = self.battery.charge_mode_debug
+            dbusservice["/Info/ChargeModeDebugFloat"] = self.battery.charge_mode_debug_float
+            dbusservice["/Info/ChargeModeDebugBulk"] = self.battery.charge_mode_debug_bulk
+            dbusservice["/Info/ChargeLimitation"] = self.battery.charge_limitation
+            dbusservice["/Info/DischargeLimitation"] = self.battery.discharge_limitation
+
+            # Updates from cells
+            dbusservice["/System/MinVoltageCellId"] = self.battery.get_min_cell_desc()
+            dbusservice["/System/MaxVoltageCellId"] = self.battery.get_max_cell_desc()
+            dbusservice["/System/MinCellVoltage"] = self.battery.get_min_cell_voltage()
+            dbusservice["/System/MaxCellVoltage"] = self.battery.get_max_cell_voltage()
+            dbusservice["/Balancing"] = self.battery.get_balancing()
+
+            # Update the alarms
+            self.battery.protection.set_previous()
+            dbusservice["/Alarms/LowVoltage"] = self.battery.protection.low_voltage
+            dbusservice["/Alarms/LowCellVoltage"] = self.battery.protection.low_cell_voltage
+            # disable high voltage warning temporarly, if loading to bulk voltage and bulk voltage reached is 30 minutes ago
+            dbusservice["/Alarms/HighVoltage"] = (
+                self.battery.protection.high_voltage
+                if (self.battery.soc_reset_requested is False and self.battery.soc_reset_last_reached < int(time()) - (60 * 30))
+                else 0
+            )
+            dbusservice["/Alarms/HighCellVoltage"] = (
+                self.battery.protection.high_cell_voltage
+                if (self.battery.soc_reset_requested is False and self.battery.soc_reset_last_reached < int(time()) - (60 * 30))
+                else 0
+            )
+            dbusservice["/Alarms/LowSoc"] = self.battery.protection.low_soc
+            dbusservice["/Alarms/HighChargeCurrent"] = self.battery.protection.high_charge_current
+            dbusservice["/Alarms/HighDischargeCurrent"] = self.battery.protection.high_discharge_current
+            dbusservice["/Alarms/CellImbalance"] = self.battery.protection.cell_imbalance
+            dbusservice["/Alarms/InternalFailure"] = self.battery.protection.internal_failure
+            dbusservice["/Alarms/HighChargeTemperature"] = self.battery.protection.high_charge_temperature
+            dbusservice["/Alarms/LowChargeTemperature"] = self.battery.protection.low_charge_temperature
+            dbusservice["/Alarms/HighTemperature"] = self.battery.protection.high_temperature
+            dbusservice["/Alarms/LowTemperature"] = self.battery.protection.low_temperature
+            dbusservice["/Alarms/BmsCable"] = 2 if self.battery.block_because_disconnect else 0
+            dbusservice["/Alarms/HighInternalTemperature"] = self.battery.protection.high_internal_temperature
+            dbusservice["/Alarms/FuseBlown"] = self.battery.protection.fuse_blown
+
+            # cell voltages
+            if utils.BATTERY_CELL_DATA_FORMAT > 0:
+                try:
+                    voltage_sum = 0
+                    for i in range(self.battery.cell_count):
+                        voltage = self.battery.get_cell_voltage(i)
+                        cellpath = "/Cell/%s/Volts" if (utils.BATTERY_CELL_DATA_FORMAT & 2) else "/Voltages/Cell%s"
+                        dbusservice[cellpath % (str(i + 1))] = voltage
+                        if utils.BATTERY_CELL_DATA_FORMAT & 1:
+                            dbusservice["/Balances/Cell%s" % (str(i + 1))] = self.battery.get_cell_balancing(i)
+                        if voltage:
+                            voltage_sum += voltage
+                    pathbase = "Cell" if (utils.BATTERY_CELL_DATA_FORMAT & 2) else "Voltages"
+                    dbusservice["/%s/Sum" % pathbase] = round(voltage_sum, 2)
+                    dbusservice["/%s/Diff" % pathbase] = round(
+                        self.battery.get_max_cell_voltage() - self.battery.get_min_cell_voltage(),
+                        3,
+                    )
+                except Exception:
+                    # set error code, to show in the GUI that something is wrong
+                    self.battery.manage_error_code(8)
+
+                    exception_type, exception_object, exception_traceback = sys.exc_info()
+                    file = exception_traceback.tb_frame.f_code.co_filename
+                    line = exception_traceback.tb_lineno
+                    logger.error("Non blocking exception occurred: " + f"{repr(exception_object)} of type {exception_type} in {file} line #{line}")
+
+            # Calculate average current for the last 300 cycles
+            self.battery.previous_current_avg = self.battery.current_avg
+            if self.battery.current_calc is not None:
+                self.battery.current_avg_lst.append(self.battery.current_calc)
+                # delete oldest value
+                if len(self.battery.current_avg_lst) > 300:
+                    del self.battery.current_avg_lst[0]
+
+                self.battery.current_avg = round(
+                    sum(self.battery.current_avg_lst) / len(self.battery.current_avg_lst),
+                    2,
+                )
+            else:
+                self.battery.current_avg = None
 
-        # cell voltages
-        if utils.BATTERY_CELL_DATA_FORMAT > 0:
+            dbusservice["/CurrentAvg"] = self.battery.current_avg
+
+            # Update TimeToGo and/or TimeToSoC
             try:
-                voltage_sum = 0
-                for i in range(self.battery.cell_count):
-                    voltage = self.battery.get_cell_voltage(i)
-                    cellpath = "/Cell/%s/Volts" if (utils.BATTERY_CELL_DATA_FORMAT & 2) else "/Voltages/Cell%s"
-                    self._dbusservice[cellpath % (str(i + 1))] = voltage
-                    if utils.BATTERY_CELL_DATA_FORMAT & 1:
-                        self._dbusservice["/Balances/Cell%s" % (str(i + 1))] = self.battery.get_cell_balancing(i)
-                    if voltage:
-                        voltage_sum += voltage
-                pathbase = "Cell" if (utils.BATTERY_CELL_DATA_FORMAT & 2) else "Voltages"
-                self._dbusservice["/%s/Sum" % pathbase] = round(voltage_sum, 2)
-                self._dbusservice["/%s/Diff" % pathbase] = round(
-                    self.battery.get_max_cell_voltage() - self.battery.get_min_cell_voltage(),
-                    3,
-                )
-            except Exception:
-                # set error code, to show in the GUI that something is wrong
-                self.battery.manage_error_code(8)
+                # if Time-To-Go or Time-To-SoC is enabled
 
-                exception_type, exception_object, exception_traceback = sys.exc_info()
-                file = exception_traceback.tb_frame.f_code.co_filename
-                line = exception_traceback.tb_lineno
-                logger.error("Non blocking exception occurred: " + f"{repr(exception_object)} of type {exception_type} in {file} line #{line}")
+                if (
+                    self.battery.capacity is not None
+                    and self.battery.current_avg is not None
+                    and (utils.TIME_TO_GO_ENABLE or len(utils.TIME_TO_SOC_POINTS) > 0)
+                    and (int(time()) - self.battery.time_to_soc_update >= utils.TIME_TO_SOC_RECALCULATE_EVERY)
+                ):
+                    self.battery.time_to_soc_update = int(time())
 
-        # Calculate average current for the last 300 cycles
-        self.battery.previous_current_avg = self.battery.current_avg
-        if self.battery.current_calc is not None:
-            self.battery.current_avg_lst.append(self.battery.current_calc)
-            # delete oldest value
-            if len(self.battery.current_avg_lst) > 300:
-                del self.battery.current_avg_lst[0]
-
-            self.battery.current_avg = round(
-                sum(self.battery.current_avg_lst) / len(self.battery.current_avg_lst),
-                2,
-            )
-        else:
-            self.battery.current_avg = None
+                    percent_per_seconds = abs(self.battery.current_avg / (self.battery.capacity / 100)) / 3600
 
-        self._dbusservice["/CurrentAvg"] = self.battery.current_avg
+                    # Update TimeToGo item
+                    if utils.TIME_TO_GO_ENABLE and percent_per_seconds is not None:
 
-        # Update TimeToGo and/or TimeToSoC
-        try:
-            # if Time-To-Go or Time-To-SoC is enabled
+                        # Get settings from dbus
+                        settings_battery_life = self.get_settings_with_values(
+                            get_bus(),
+                            "com.victronenergy.settings",
+                            "/Settings/CGwacs/BatteryLife",
+                        )
+                        settings_hub4mode = self.get_settings_with_values(
+                            get_bus(),
+                            "com.victronenergy.settings",
+                            "/Settings/CGwacs/Hub4Mode",
+                        )
 
-            if (
-                self.battery.capacity is not None
-                and self.battery.current_avg is not None
-                and (utils.TIME_TO_GO_ENABLE or len(utils.TIME_TO_SOC_POINTS) > 0)
-                and (int(time()) - self.battery.time_to_soc_update >= utils.TIME_TO_SOC_RECALCULATE_EVERY)
-            ):
-                self.battery.time_to_soc_update = int(time())
+                        hub4mode = int(settings_hub4mode["Settings"]["CGwacs"]["Hub4Mode"]) if "Settings" in settings_hub4mode else None
+                        state = (
+                            int(settings_battery_life["Settings"]["CGwacs"]["BatteryLife"]["State"])
+                            if "Settings" in settings_battery_life and "State" in settings_battery_life["Settings"]["CGwacs"]["BatteryLife"]
+                            else None
+                        )
 
-                percent_per_seconds = abs(self.battery.current_avg / (self.battery.capacity / 100)) / 3600
+                        if (
+                            hub4mode == 1
+                            and state != 9
+                            and "Settings" in settings_battery_life
+                            and "MinimumSocLimit" in settings_battery_life["Settings"]["CGwacs"]["BatteryLife"]
+                            and "SocLimit" in settings_battery_life["Settings"]["CGwacs"]["BatteryLife"]
+                        ):
+                            # Optimized without BatteryLife
+                            if state >= 10 and state <= 12:
+                                time_to_go_soc = int(float(settings_battery_life["Settings"]["CGwacs"]["BatteryLife"]["MinimumSocLimit"]))
+                                logger.debug(f"Time-to-Go: Use /Settings/CGwacs/BatteryLife/MinimumSocLimit: {time_to_go_soc}")
+                            # Optimized with BatteryLife
+                            else:
+                                time_to_go_soc = int(float(settings_battery_life["Settings"]["CGwacs"]["BatteryLife"]["SocLimit"]))
+                                logger.debug(f"Time-to-Go: Use /Settings/CGwacs/BatteryLife/SocLimit: {time_to_go_soc}")
+                        # External control
+                        # Keep batteries charged
+                        # all others fall back to default
+                        else:
+                            time_to_go_soc = utils.SOC_LOW_WARNING
+                            logger.debug(f"Time-to-Go: Use utils.SOC_LOW_WARNING: {time_to_go_soc}")
+
+                        # Update TimeToGo item, has to be a positive int since it's used from dbus-systemcalc-py
+                        time_to_go = self.battery.get_time_to_soc(
+                            # switch value depending on charging/discharging
+                            (time_to_go_soc if self.battery.current_avg < 0 else 100),
+                            percent_per_seconds,
+                            True,
+                        )
 
-                # Update TimeToGo item
-                if utils.TIME_TO_GO_ENABLE and percent_per_seconds is not None:
+                        # Check that time_to_go is not None and current is not near zero
+                        dbusservice["/TimeToGo"] = abs(int(time_to_go)) if time_to_go is not None and abs(self.battery.current_avg) > 0.1 else None
 
-                    # Get settings from dbus
-                    settings_battery_life = self.get_settings_with_values(
-                        get_bus(),
-                        "com.victronenergy.settings",
-                        "/Settings/CGwacs/BatteryLife",
-                    )
-                    settings_hub4mode = self.get_settings_with_values(
-                        get_bus(),
-                        "com.victronenergy.settings",
-                        "/Settings/CGwacs/Hub4Mode",
-                    )
+                    # Update TimeToSoc items
+                    if len(utils.TIME_TO_SOC_POINTS) > 0:
+                        for num in utils.TIME_TO_SOC_POINTS:
+                            dbusservice["/TimeToSoC/" + str(num)] = self.battery.get_time_to_soc(num, percent_per_seconds) if self.battery.current_avg else None
 
-                    hub4mode = int(settings_hub4mode["Settings"]["CGwacs"]["Hub4Mode"]) if "Settings" in settings_hub4mode else None
-                    state = (
-                        int(settings_battery_life["Settings"]["CGwacs"]["BatteryLife"]["State"])
-                        if "Settings" in settings_battery_life and "State" in settings_battery_life["Settings"]["CGwacs"]["BatteryLife"]
-                        else None
-                    )
+            except Exception:
+                # set error code, to show in the GUI that something is wrong
+                self.battery.manage_error_code(8)
 
-                    if (
-                        hub4mode == 1
-                        and state != 9
-                        and "Settings" in settings_battery_life
-                        and "MinimumSocLimit" in settings_battery_life["Settings"]["CGwacs"]["BatteryLife"]
-                        and "SocLimit" in settings_battery_life["Settings"]["CGwacs"]["BatteryLife"]
-                    ):
-                        # Optimized without BatteryLife
-                        if state >= 10 and state <= 12:
-                            time_to_go_soc = int(float(settings_battery_life["Settings"]["CGwacs"]["BatteryLife"]["MinimumSocLimit"]))
-                            logger.debug(f"Time-to-Go: Use /Settings/CGwacs/BatteryLife/MinimumSocLimit: {time_to_go_soc}")
-                        # Optimized with BatteryLife
-                        else:
-                            time_to_go_soc = int(float(settings_battery_life["Settings"]["CGwacs"]["BatteryLife"]["SocLimit"]))
-                            logger.debug(f"Time-to-Go: Use /Settings/CGwacs/BatteryLife/SocLimit: {time_to_go_soc}")
-                    # External control
-                    # Keep batteries charged
-                    # all others fall back to default
-                    else:
-                        time_to_go_soc = utils.SOC_LOW_WARNING
-                        logger.debug(f"Time-to-Go: Use utils.SOC_LOW_WARNING: {time_to_go_soc}")
-
-                    # Update TimeToGo item, has to be a positive int since it's used from dbus-systemcalc-py
-                    time_to_go = self.battery.get_time_to_soc(
-                        # switch value depending on charging/discharging
-                        (time_to_go_soc if self.battery.current_avg < 0 else 100),
-                        percent_per_seconds,
-                        True,
-                    )
+                exception_type, exception_object, exception_traceback = sys.exc_info()
+                file = exception_traceback.tb_frame.f_code.co_filename
+                line = exception_traceback.tb_lineno
+                logger.error("Non blocking exception occurred: " + f"{repr(exception_object)} of type {exception_type} in {file} line #{line}")
 
-                    # Check that time_to_go is not None and current is not near zero
-                    self._dbusservice["/TimeToGo"] = abs(int(time_to_go)) if time_to_go is not None and abs(self.battery.current_avg) > 0.1 else None
+            # calculate history values every 60 seconds
+            if utils.HISTORY_ENABLE and int(time()) - self.history_calculated_last_time > 60:
+                self.battery.history_calculate_values()
+                self.history_calculated_last_time = int(time())
 
-                # Update TimeToSoc items
-                if len(utils.TIME_TO_SOC_POINTS) > 0:
-                    for num in utils.TIME_TO_SOC_POINTS:
-                        self._dbusservice["/TimeToSoC/" + str(num)] = (
-                            self.battery.get_time_to_soc(num, percent_per_seconds) if self.battery.current_avg else None
-                        )
+            # save settings every 15 seconds to dbus
+            if int(time()) % 15:
+                with self.battery.cycle_timing.span("SaveCurrentBatteryState"):
+                    self.save_current_battery_state()
 
-        except Exception:
-            # set error code, to show in the GUI that something is wrong
-            self.battery.manage_error_code(8)
+            if self.battery.soc is not None:
+                logger.debug("logged to dbus [%s]" % str(round(self.battery.soc, 2)))
+                self.battery.log_cell_data()
 
-            exception_type, exception_object, exception_traceback = sys.exc_info()
-            file = exception_traceback.tb_frame.f_code.co_filename
-            line = exception_traceback.tb_lineno
-            logger.error("Non blocking exception occurred: " + f"{repr(exception_object)} of type {exception_type} in {file} line #{line}")
+            if self.battery.has_settings:
+                dbusservice["/Settings/ResetSoc"] = self.battery.reset_soc
 
-        # calculate history values every 60 seconds
-        if utils.HISTORY_ENABLE and int(time()) - self.history_calculated_last_time > 60:
-            self.battery.history_calculate_values()
-            self.history_calculated_last_time = int(time())
+            if utils.PUBLISH_DEBUG_VALUES:
+                if self.battery.link_timing is not None:
+                    for key, value in self.battery.link_timing.get_statistics().items():
+                        dbusservice[f"/Debug/Link/{key}"] = value
 
-        # save settings every 15 seconds to dbus
-        if int(time()) % 15:
-            self.save_current_battery_state()
+                for key, value in self.battery.poll_timing.get_statistics().items():
+                    dbusservice[f"/Debug/Poll/{key}"] = value
 
-        if self.battery.soc is not None:
-            logger.debug("logged to dbus [%s]" % str(round(self.battery.soc, 2)))
-            self.battery.log_cell_data()
+                dbusservice["/Debug/Profile"] = 1 if profiler.running else 0
 
-        if self.battery.has_settings:
-            self._dbusservice["/Settings/ResetSoc"] = self.battery.reset_soc
+                if self.publish_filter is not None:
+                    for key, value in self.publish_filter.get_statistics().items():
+                        dbusservice[f"/Debug/Publish/{key}"] = value
 
-        # get all paths from the dbus service
-        if utils.PUBLISH_BATTERY_DATA_AS_JSON:
-            all_items = self._dbusservice._dbusnodes["/"].GetItems()
+                # the values of the current cycle are published with the next cycle
+                for phase, statistics in self.battery.cycle_timing.get_statistics().items():
+                    for key, value in statistics.items():
+                        dbusservice[f"/Debug/Timing/{phase}/{key}"] = value
 
-            # Convert dbus data types to python native data types
-            all_items = {key: self.dbus_to_python(value["Value"]) for key, value in all_items.items()}
+            if utils.MAIN_LOOP_MONITOR:
+                for key, value in main_loop_monitor.get_statistics().items():
+                    dbusservice[f"/Debug/MainLoop/{key}"] = value
 
-            # Filter out unwanted keys
-            filtered_data = {key: value for key, value in all_items.items() if key not in ["/JsonData", "/Settings/ResetSoc", "/Settings/HasSettings"]}
+            # get all paths from the dbus service
+            if utils.PUBLISH_BATTERY_DATA_AS_JSON:
+                json_start = monotonic()
+                all_items = self._dbusservice._dbusnodes["/"].GetItems()
 
-            # Set empty lists to empty string
-            filtered_data = {key: "" if value == [] else value for key, value in filtered_data.items()}
+                # Convert dbus data types to python native data types
+                all_items = {key: self.dbus_to_python(value["Value"]) for key, value in all_items.items()}
 
-            cascaded_data_json = json.dumps(self.cascade_data(filtered_data))
+                # Filter out unwanted keys
+                filtered_data = {key: value for key, value in all_items.items() if key not in ["/JsonData", "/Settings/ResetSoc", "/Settings/HasSettings"]}
 
-            # publish the data to the JsonData path
-            self._dbusservice["/JsonData"] = cascaded_data_json
+                # Set empty lists to empty string
+                filtered_data = {key: "" if value == [] else value for key, value in filtered_data.items()}
+
+                cascaded_data_json = json.dumps(self.cascade_data(filtered_data))
+
+                # publish the data to the JsonData path
+                dbusservice["/JsonData"] = cascaded_data_json
+                self.battery.cycle_timing.record("PublishJson", json_start, monotonic())
 
     def dbus_to_python(self, data) -> any:
         """
@@ -1365,6 +1476,23 @@ class DbusHelper:
             else:
                 dict1[key] = dict2[key]
 
+    def profile_callback(self, path, value) -> bool:
+        """
+        Start or stop a profiling session.
+
+        :param path: The dbus path.
+        :param value: 1 to start, 0 to stop the session.
+        :return: True if the value is accepted.
+        """
+        if value == 1:
+            return profiler.start()
+
+        if value == 0:
+            profiler.stop()
+            return True
+
+        return False
+
     def custom_name_callback(self, path, value) -> str:
         """
         Callback function to set a custom name for the battery.
@@ -2,16 +2,26 @@
 # Standard library imports
 import bisect
 import configparser
+import json
 import logging
+import os
+import select
 import sys
+import threading
+from collections import deque
+from contextlib import contextmanager
+from math import ceil
 from pathlib import Path
-from struct import unpack_from
-from time import sleep
-from typing import List, Any, Callable, Union
+from struct import calcsize, unpack_from
+from time import monotonic, sleep
+from typing import List, Any, Callable, Dict, Iterator, Union
 
 # Third-party imports
 import serial
 
+# Local imports
+from utils_checksum import sum8, sum16_complement
+
 
 # CONSTANTS
 DRIVER_VERSION: str = "2.0.20250324dev"
@@ -36,11 +46,14 @@ logger = logging.getLogger("SerialBattery")
 
 PATH_CONFIG_DEFAULT: str = "config.default.ini"
 PATH_CONFIG_USER: str = "config.ini"
+PATH_DETECTION_CACHE: str = "/data/conf/dbus-serialbattery/detection_cache.json"
 
 config = configparser.ConfigParser()
 path = Path(__file__).parents[0]
 default_config_file_path = str(path.joinpath(PATH_CONFIG_DEFAULT).absolute())
 custom_config_file_path = str(path.joinpath(PATH_CONFIG_USER).absolute())
+# the driver folder is replaced by an update, outside of Venus OS the cache is kept in the driver folder
+detection_cache_file_path = PATH_DETECTION_CACHE if os.path.isdir("/data") else str(path.joinpath(os.path.basename(PATH_DETECTION_CACHE)).absolute())
 config.read([default_config_file_path, custom_config_file_path])
 
 # Map config logging levels to logging module levels
@@ -219,6 +232,17 @@ BLUETOOTH_FORCE_RESET_BLE_STACK = get_bool_from_config("DEFAULT", "BLUETOOTH_FOR
 
 # --------- Daisy Chain Configuration (Multiple BMS on one cable) ---------
 BATTERY_ADDRESSES: list = get_list_from_config("DEFAULT", "BATTERY_ADDRESSES", str)
+BATTERY_ADDRESSES_POLL_INTERVAL: List[float] = [value * 1000 for value in get_list_from_config("DEFAULT", "BATTERY_ADDRESSES_POLL_INTERVAL", float)]
+"""
+Poll interval in milliseconds for each battery address, in the same order as BATTERY_ADDRESSES
+"""
+if len(BATTERY_ADDRESSES_POLL_INTERVAL) > 0 and len(BATTERY_ADDRESSES_POLL_INTERVAL) != len(BATTERY_ADDRESSES):
+    check_config_issue(
+        True,
+        f"BATTERY_ADDRESSES_POLL_INTERVAL has {len(BATTERY_ADDRESSES_POLL_INTERVAL)} values, but BATTERY_ADDRESSES has {len(BATTERY_ADDRESSES)}. "
+        "The values were ignored. Please specify one poll interval per battery address or leave it empty.",
+    )
+    BATTERY_ADDRESSES_POLL_INTERVAL = []
 
 # --------- BMS Disconnect Behavior ---------
 BLOCK_ON_DISCONNECT: bool = get_bool_from_config("DEFAULT", "BLOCK_ON_DISCONNECT")
@@ -464,10 +488,43 @@ HISTORY_ENABLE: bool = get_bool_from_config("DEFAULT", "HISTORY_ENABLE")
 # --------- Additional settings ---------
 BMS_TYPE: List[str] = get_list_from_config("DEFAULT", "BMS_TYPE", str)
 EXCLUDED_DEVICES: List[str] = get_list_from_config("DEFAULT", "EXCLUDED_DEVICES", str)
+DETECTION_CACHE: bool = get_bool_from_config("DEFAULT", "DETECTION_CACHE")
+DETECTION_SNIFF_TIME: float = max(get_float_from_config("DEFAULT", "DETECTION_SNIFF_TIME"), 0)
+"""
+Time in seconds to listen on the port for known frames, before the BMS types are tested
+"""
 POLL_INTERVAL: Union[float, None] = float(config["DEFAULT"]["POLL_INTERVAL"]) * 1000 if config["DEFAULT"]["POLL_INTERVAL"] else None
 """
 Poll interval in milliseconds
 """
+POLL_INTERVAL_MEDIUM: float = max(get_float_from_config("DEFAULT", "POLL_INTERVAL_MEDIUM"), 0) * 1000
+"""
+Poll interval in milliseconds for the data of the medium poll tier, e.g. single cell voltages and temperatures. 0 reads all data every poll
+"""
+IO_WORKER: bool = get_bool_from_config("DEFAULT", "IO_WORKER")
+"""
+Read the data from the BMS in a separate thread, so the main loop is not blocked meanwhile
+"""
+PUBLISH_DEBUG_VALUES: bool = get_bool_from_config("DEFAULT", "PUBLISH_DEBUG_VALUES")
+"""
+Publish the statistics for troubleshooting to the dbus paths `/Debug/`, they change each poll
+"""
+MAIN_LOOP_MONITOR: bool = get_bool_from_config("DEFAULT", "MAIN_LOOP_MONITOR")
+"""
+Measure how long the main loop is blocked, it wakes up the driver every 100 ms
+"""
+TIMING_TRACE_CYCLES: int = max(get_int_from_config("DEFAULT", "TIMING_TRACE_CYCLES"), 0)
+"""
+Number of poll cycles written as Chrome trace, 0 to disable it
+"""
+PROFILE_DURATION: float = max(get_float_from_config("DEFAULT", "PROFILE_DURATION"), 1)
+"""
+Duration in seconds of a profiling session started with SIGUSR1 or `/Debug/Profile` (with `PUBLISH_DEBUG_VALUES`)
+"""
+PUBLISH_FILTER: List[str] = get_list_from_config("DEFAULT", "PUBLISH_FILTER", str)
+"""
+Rules `<path>:<absolute>:<relative>:<min interval>:<max interval>` of the values published to dbus
+"""
 PUBLISH_CONFIG_VALUES: bool = get_bool_from_config("DEFAULT", "PUBLISH_CONFIG_VALUES")
 PUBLISH_BATTERY_DATA_AS_JSON: bool = get_bool_from_config("DEFAULT", "PUBLISH_BATTERY_DATA_AS_JSON")
 BATTERY_CELL_DATA_FORMAT: int = get_int_from_config("DEFAULT", "BATTERY_CELL_DATA_FORMAT")
@@ -642,7 +699,8 @@ def bytearray_to_string(data: bytearray) -> str:
 
 def open_serial_port(port: str, baud: int) -> Union[serial.Serial, None]:
     """
-    Open a serial port.
+    Open a serial port. The handle is managed by `serial_port_manager` and shared by all drivers on the port,
+    so it must not be closed by the caller. Use `serial_port_manager.connection()` to hold the port lock.
 
     :param port: Serial port
     :param baud: Baud rate
@@ -651,13 +709,827 @@ def open_serial_port(port: str, baud: int) -> Union[serial.Serial, None]:
     tries = 3
     while tries > 0:
         try:
-            return serial.Serial(port, baudrate=baud, timeout=0.1)
+            return serial_port_manager.get(port, baud, 0.1)
         except serial.SerialException as e:
             logger.error(e)
             tries -= 1
     return None
 
 
+class SerialPortManager:
+    """
+    Keeps one open serial handle per port and reuses it for all requests.
+
+    Opening a tty is expensive (open, several termios calls, close) and on a GX device
+    it can race with serial-starter. Instead of opening the port for every request,
+    the handle is kept open, reconfigured in place if a driver needs a different
+    baud rate or timeout and only closed and reopened after an I/O error.
+
+    Each port also has a transaction lock. A driver holds it from sending a request until the
+    reply is complete (see `transaction()`), so batteries on the same bus polled from different
+    threads can't interleave their frames. Batteries on different ports don't block each other.
+    """
+
+    def __init__(self):
+        self._ports: Dict[str, serial.Serial] = {}
+        self._lock = threading.RLock()
+        self._port_locks: Dict[str, threading.RLock] = {}
+        self.open_count: int = 0
+        """
+        Number of times a serial port was (re)opened. Useful for troubleshooting.
+        """
+
+    def get(
+        self,
+        port: str,
+        baud: int,
+        timeout: float = 0.1,
+        parity: str = serial.PARITY_NONE,
+        bytesize: int = serial.EIGHTBITS,
+        stopbits: float = serial.STOPBITS_ONE,
+    ) -> serial.Serial:
+        """
+        Get the open handle for a port. Open it, if needed, else reconfigure it in place.
+        All settings are applied on each call, since the handle is shared by all drivers on the port.
+
+        :param port: Serial port
+        :param baud: Baud rate
+        :param timeout: Read timeout in seconds
+        :param parity: Parity, one of the `serial.PARITY_*` constants
+        :param bytesize: Number of data bits
+        :param stopbits: Number of stop bits
+        :return: Opened serial port
+        :raises serial.SerialException: if the port could not be opened
+        """
+        with self._lock:
+            ser = self._ports.get(port)
+
+            if ser is not None and ser.is_open:
+                # only touch the port settings if they changed, since each change triggers a termios call
+                if ser.baudrate != baud:
+                    ser.baudrate = baud
+                if ser.timeout != timeout:
+                    ser.timeout = timeout
+                if ser.parity != parity:
+                    ser.parity = parity
+                if ser.bytesize != bytesize:
+                    ser.bytesize = bytesize
+                if ser.stopbits != stopbits:
+                    ser.stopbits = stopbits
+                return ser
+
+            ser = serial.Serial(port, baudrate=baud, timeout=timeout, parity=parity, bytesize=bytesize, stopbits=stopbits)
+            self._ports[port] = ser
+            self.open_count += 1
+            logger.debug(f"Serial port {port} opened with {baud} baud")
+            return ser
+
+    def lock(self, port: str) -> threading.RLock:
+        """
+        Get the transaction lock of a port. It's reentrant, so a driver can hold it over several requests
+        and still call functions which lock the port themselves.
+
+        :param port: Serial port
+        :return: Lock of the port
+        """
+        with self._lock:
+            if port not in self._port_locks:
+                self._port_locks[port] = threading.RLock()
+            return self._port_locks[port]
+
+    @contextmanager
+    def transaction(self, port: str) -> Iterator[None]:
+        """
+        Get exclusive access to a port for one or more request/response windows.
+
+        :param port: Serial port
+        """
+        with self.lock(port):
+            yield
+
+    def close(self, port: str) -> None:
+        """
+        Close a port and forget the handle. The next request will reopen it.
+        Waits until a running transaction on the port is finished.
+
+        :param port: Serial port
+        """
+        with self.lock(port), self._lock:
+            ser = self._ports.pop(port, None)
+
+        if ser is not None:
+            try:
+                ser.close()
+            except Exception:
+                pass
+            logger.debug(f"Serial port {port} closed")
+
+    def discard(self, ser: serial.Serial) -> None:
+        """
+        Close a handle after an I/O error, if it is managed by this class.
+
+        :param ser: Serial port handle
+        """
+        if ser is not None and self._ports.get(ser.port) is ser:
+            self.close(ser.port)
+
+    def close_all(self) -> None:
+        """
+        Close all managed ports, e.g. when the driver exits.
+        """
+        for port in list(self._ports):
+            self.close(port)
+
+    @contextmanager
+    def connection(self, port: str, baud: int, timeout: float = 0.1) -> Iterator[serial.Serial]:
+        """
+        Use a managed port for several requests in a row. The transaction lock of the port is held
+        until the block is left.
+        Unlike `with serial.Serial(...)` the port stays open afterwards, except an I/O error occurred.
+
+        :param port: Serial port
+        :param baud: Baud rate
+        :param timeout: Read timeout in seconds
+        :return: Opened serial port
+        """
+        with self.transaction(port):
+            ser = self.get(port, baud, timeout)
+            try:
+                yield ser
+            except OSError:
+                # serial.SerialException is a subclass of OSError
+                self.discard(ser)
+                raise
+
+
+serial_port_manager = SerialPortManager()
+"""
+Shared instance used by all serial drivers
+"""
+
+
+def wait_for_serial_data(ser: serial.Serial, timeout: float) -> int:
+    """
+    Block on the file descriptor of the serial port until data is available or the timeout is reached.
+
+    :param ser: Serial port
+    :param timeout: Maximum time to wait in seconds
+    :return: Number of bytes waiting in the input buffer
+    """
+    if timeout > 0:
+        readable, _, _ = select.select([ser.fileno()], [], [], timeout)
+        if not readable:
+            return 0
+
+    waiting = ser.in_waiting
+    if waiting == 0 and timeout > 0:
+        # the file descriptor is readable, but there is nothing to read
+        raise serial.SerialException("device reports readiness to read but returned no data (device disconnected or multiple access on port?)")
+
+    return waiting
+
+
+class LinkTiming:
+    """
+    Timing model of the link to one BMS type on one port.
+
+    Many BMS need a pause between two frames or some time until they start to reply. Instead of a fixed sleep,
+    the model measures the response latency and learns the shortest delay that is still safe:
+
+    - after each successful transaction the delay shrinks towards `delay_min`
+    - after a timeout the delay is doubled and the delay that failed is remembered,
+      so the delay does not shrink below it again
+    - the reply timeout follows the 95th percentile of the measured latency
+    """
+
+    SAMPLES: int = 50
+    """
+    Number of latency samples used to calculate the 95th percentile
+    """
+
+    def __init__(self, name: str, delay: float, delay_min: float = 0.0, delay_max: Union[float, None] = None, alpha: float = 0.1):
+        """
+        :param name: Name used in the log
+        :param delay: Initial delay in seconds, normally the value of the fixed sleep that was used before
+        :param delay_min: Minimum delay in seconds
+        :param delay_max: Maximum delay in seconds, defaults to four times the initial delay
+        :param alpha: Weight of a new sample in the exponentially weighted moving average
+        """
+        self.name = name
+        self.delay: float = delay
+        """
+        Current delay in seconds
+        """
+        self.delay_min: float = delay_min
+        self.delay_max: float = delay_max if delay_max is not None else max(delay * 4, delay_min)
+        self.delay_safe: float = delay_min
+        """
+        Smallest delay that did not lead to a timeout
+        """
+        self.alpha: float = alpha
+        self.latency_ewma: Union[float, None] = None
+        self.latency_p95: Union[float, None] = None
+        self.transactions: int = 0
+        self.timeouts: int = 0
+        self._timeout_streak: int = 0
+        self._samples: deque = deque(maxlen=self.SAMPLES)
+        self._last_transaction: float = 0.0
+
+    def wait(self) -> None:
+        """
+        Wait until the delay since the end of the last transaction has passed.
+        Time spent elsewhere since the last transaction is taken into account.
+
+        :return: None
+        """
+        remaining = self.delay - (monotonic() - self._last_transaction)
+        if remaining > 0:
+            sleep(remaining)
+
+    def record(self, latency: Union[float, None]) -> None:
+        """
+        Record the result of a transaction and adapt the delay.
+
+        :param latency: Time in seconds from sending the command until the reply was complete, None on a timeout
+        :return: None
+        """
+        self.transactions += 1
+        self._last_transaction = monotonic()
+
+        if latency is None:
+            self.timeouts += 1
+            self._timeout_streak += 1
+            # the current delay is not safe, do not shrink below it again
+            self.delay_safe = min(self.delay_max, max(self.delay_safe, self.delay * 1.25))
+            self.delay = min(self.delay_max, max(self.delay * 2, self.delay_safe, 0.005))
+            logger.debug(f"LinkTiming {self.name}: timeout, delay increased to {self.delay * 1000:.1f} ms")
+            return
+
+        self._timeout_streak = 0
+        self.latency_ewma = latency if self.latency_ewma is None else self.latency_ewma + self.alpha * (latency - self.latency_ewma)
+        self._samples.append(latency)
+        self.latency_p95 = sorted(self._samples)[int(len(self._samples) * 0.95)]
+        self.delay = max(self.delay_min, self.delay_safe, self.delay * 0.9)
+
+    def reply_timeout(self, default: float) -> float:
+        """
+        Get the time to wait for a reply based on the measured latency.
+
+        :param default: Timeout in seconds to use until enough samples are collected or after a timeout,
+            it's also the upper limit
+        :return: Timeout in seconds
+        """
+        if len(self._samples) < 10 or self._timeout_streak > 0:
+            return default
+
+        return min(default, max(0.05, self.latency_p95 * 2))
+
+    def get_statistics(self) -> Dict[str, Union[float, int, None]]:
+        """
+        Get the learned values for publishing.
+
+        :return: Dictionary with the values, times in milliseconds
+        """
+        return {
+            "Delay": round(self.delay * 1000, 1),
+            "LatencyAvg": round(self.latency_ewma * 1000, 1) if self.latency_ewma is not None else None,
+            "LatencyP95": round(self.latency_p95 * 1000, 1) if self.latency_p95 is not None else None,
+            "Transactions": self.transactions,
+            "Timeouts": self.timeouts,
+        }
+
+
+link_timings: Dict[tuple, LinkTiming] = {}
+"""
+Timing models per port and BMS type
+"""
+
+
+def get_link_timing(port: str, bms_type: str, delay: float, **kwargs) -> LinkTiming:
+    """
+    Get the timing model for a BMS type on a port, create it if it does not exist yet.
+    Batteries of the same type on the same bus share the model.
+
+    :param port: Serial port
+    :param bms_type: BMS type, normally the class name of the driver
+    :param delay: Initial delay in seconds
+    :param kwargs: Further arguments for LinkTiming
+    :return: Timing model
+    """
+    key = (port, bms_type)
+    if key not in link_timings:
+        link_timings[key] = LinkTiming(f"{bms_type}@{port}", delay, **kwargs)
+
+    return link_timings[key]
+
+
+class PollTiming:
+    """
+    Adaptive poll interval of one battery.
+
+    The runtime of each poll is measured. If the polls take longer than the interval for several cycles in a row,
+    the interval is increased to the 95th percentile of the runtime, rounded up to the next half second. If the link
+    recovers and the runtime of a full sample window fits into a shorter interval, it's decreased again, but never
+    below the configured interval.
+    """
+
+    SAMPLES: int = 50
+    """
+    Number of runtime samples used to calculate the 95th percentile
+    """
+
+    OVERRUN_CYCLES: int = 5
+    """
+    Number of polls in a row, which have to take longer than the interval, until it's increased
+    """
+
+    INTERVAL_MAX: float = 60000
+    """
+    Maximum poll interval in milliseconds
+    """
+
+    def __init__(self, interval: float, alpha: float = 0.1):
+        """
+        :param interval: Configured poll interval in milliseconds, which is also the minimum
+        :param alpha: Weight of a new sample in the exponentially weighted moving average
+        """
+        self.interval_base: float = interval
+        """
+        Configured poll interval in milliseconds
+        """
+        self.interval: float = interval
+        """
+        Effective poll interval in milliseconds
+        """
+        self.alpha: float = alpha
+        self.runtime_ewma: Union[float, None] = None
+        self.runtime_p95: Union[float, None] = None
+        self.polls: int = 0
+        self.overruns: int = 0
+        """
+        Number of polls, which took longer than the effective interval
+        """
+        self._overrun_streak: int = 0
+        self._fit_streak: int = 0
+        self._samples: deque = deque(maxlen=self.SAMPLES)
+
+    def set_interval_base(self, interval: float) -> None:
+        """
+        Change the configured poll interval, the effective interval is reset to it.
+
+        :param interval: Poll interval in milliseconds
+        :return: None
+        """
+        self.interval_base = interval
+        self.interval = interval
+        self._overrun_streak = 0
+        self._fit_streak = 0
+
+    def get_interval_needed(self) -> float:
+        """
+        Get the interval the 95th percentile of the runtime fits in, with a small margin.
+
+        :return: Poll interval in milliseconds
+        """
+        # round up to the next half second
+        needed = ceil((self.runtime_p95 + 0.05) * 2) / 2 * 1000
+        return min(self.INTERVAL_MAX, max(self.interval_base, needed))
+
+    def record(self, runtime: float) -> bool:
+        """
+        Record the runtime of a poll and adapt the interval.
+
+        :param runtime: Time in seconds the poll took
+        :return: True if the effective interval changed
+        """
+        self.polls += 1
+        self.runtime_ewma = runtime if self.runtime_ewma is None else self.runtime_ewma + self.alpha * (runtime - self.runtime_ewma)
+        self._samples.append(runtime)
+        self.runtime_p95 = sorted(self._samples)[int(len(self._samples) * 0.95)]
+
+        if runtime > self.interval / 1000:
+            self.overruns += 1
+            self._overrun_streak += 1
+            if self._overrun_streak > 1:
+                logger.warning(
+                    f"Polling data took {runtime:.3f} seconds. Automatically increase interval in {self.OVERRUN_CYCLES - self._overrun_streak} cycles."
+                )
+        else:
+            self._overrun_streak = 0
+
+        interval_needed = self.get_interval_needed()
+
+        if self._overrun_streak >= self.OVERRUN_CYCLES and interval_needed > self.interval:
+            self.interval = interval_needed
+            self._overrun_streak = 0
+            self._fit_streak = 0
+            logger.warning(f"Polling took too long for the last {self.OVERRUN_CYCLES} cycles. Set to {self.interval / 1000:.3f} s")
+            return True
+
+        # decrease only after a full sample window without slow polls, so the percentile is not based on old samples
+        self._fit_streak = self._fit_streak + 1 if interval_needed < self.interval else 0
+        if self._fit_streak >= self.SAMPLES:
+            self.interval = interval_needed
+            self._fit_streak = 0
+            logger.info(f"Polling is fast again. Poll interval decreased to {self.interval / 1000:.3f} s")
+            return True
+
+        return False
+
+    def get_statistics(self) -> Dict[str, Union[float, int, None]]:
+        """
+        Get the values for publishing.
+
+        :return: Dictionary with the values, times in milliseconds
+        """
+        return {
+            "Interval": round(self.interval),
+            "RuntimeAvg": round(self.runtime_ewma * 1000, 1) if self.runtime_ewma is not None else None,
+            "RuntimeP95": round(self.runtime_p95 * 1000, 1) if self.runtime_p95 is not None else None,
+            "Polls": self.polls,
+            "Overruns": self.overruns,
+        }
+
+
+class CycleTiming:
+    """
+    Duration of the phases of the poll cycles of one battery.
+
+    Each phase is measured with `span()` and the durations of the last `SAMPLES` cycles are kept per phase,
+    so the minimum, average, 95th percentile and maximum can be published. If `trace_cycles` is set, the spans
+    of the last cycles are kept as well and written as Chrome trace every `trace_cycles` cycles, which shows
+    the phases on a timeline, also the ones running in the `IoWorker` thread.
+    """
+
+    PHASES: List[str] = [
+        "PublishBattery",
+        "RefreshData",
+        "SetCalculatedData",
+        "ManageChargeVoltage",
+        "ManageChargeAndDischargeCurrent",
+        "PublishDbus",
+        "SaveCurrentBatteryState",
+        "PublishJson",
+    ]
+    """
+    Measured phases, `PublishBattery` includes `RefreshData` only if it's not read by the `IoWorker`
+    """
+
+    SAMPLES: int = 100
+    """
+    Number of cycles used for the statistics
+    """
+
+    def __init__(self, name: str, trace_cycles: int = 0):
+        """
+        :param name: Name of the battery, used for the file name of the trace
+        :param trace_cycles: Number of cycles in the trace, 0 to disable it
+        """
+        self.name = name
+        self.trace_cycles = trace_cycles
+        self.cycles: int = 0
+        self._samples: Dict[str, deque] = {phase: deque(maxlen=self.SAMPLES) for phase in self.PHASES}
+        self._trace: deque = deque(maxlen=max(trace_cycles, 1))
+        self._trace_cycle: List[dict] = []
+        self._thread_names: Dict[int, str] = {}
+        # the data is refreshed in the IoWorker thread
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def span(self, phase: str) -> Iterator[None]:
+        """
+        Measure the duration of a phase.
+
+        :param phase: Name of the phase, one of `PHASES`
+        """
+        start = monotonic()
+        try:
+            yield
+        finally:
+            self.record(phase, start, monotonic())
+
+    def record(self, phase: str, start: float, end: float) -> None:
+        """
+        Record the duration of a phase.
+
+        :param phase: Name of the phase, one of `PHASES`
+        :param start: Monotonic time the phase started
+        :param end: Monotonic time the phase ended
+        :return: None
+        """
+        with self._lock:
+            self._samples[phase].append(end - start)
+
+            if self.trace_cycles > 0:
+                thread_id = threading.get_ident()
+                self._thread_names[thread_id] = threading.current_thread().name
+                self._trace_cycle.append({"name": phase, "ph": "X", "ts": round(start * 1e6), "dur": round((end - start) * 1e6), "tid": thread_id})
+
+    def end_cycle(self) -> None:
+        """
+        Mark the end of a poll cycle, the trace is written every `trace_cycles` cycles.
+
+        :return: None
+        """
+        self.cycles += 1
+        if self.trace_cycles <= 0:
+            return
+
+        with self._lock:
+            self._trace.append(self._trace_cycle)
+            self._trace_cycle = []
+
+        if self.cycles % self.trace_cycles == 0:
+            self.write_trace()
+
+    def get_trace_file_path(self) -> str:
+        return f"/tmp/dbus-serialbattery_trace_{self.name}.json"
+
+    def write_trace(self) -> bool:
+        """
+        Write the spans of the last cycles as Chrome trace. The file is replaced, so it's never half written.
+
+        :return: True if the file was written
+        """
+        pid = os.getpid()
+        with self._lock:
+            # name the threads, e.g. the main loop and the IoWorker
+            events = [
+                {"name": "thread_name", "ph": "M", "pid": pid, "tid": thread_id, "args": {"name": name}} for thread_id, name in self._thread_names.items()
+            ]
+            events += [dict(event, pid=pid) for cycle in self._trace for event in cycle]
+
+        file_path = self.get_trace_file_path()
+        try:
+            with open(file_path + ".tmp", "w") as file:
+                json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, file)
+            os.replace(file_path + ".tmp", file_path)
+        except OSError as e:
+            logger.warning(f"Could not write the timing trace {file_path}: {e}")
+            return False
+
+        logger.debug(f"Timing trace of the last {len(self._trace)} cycles written to {file_path}")
+        return True
+
+    def get_statistics(self) -> Dict[str, Dict[str, Union[float, None]]]:
+        """
+        Get the values for publishing.
+
+        :return: Dictionary with the minimum, average, 95th percentile and maximum per phase in milliseconds
+        """
+        with self._lock:
+            samples = {phase: sorted(durations) for phase, durations in self._samples.items()}
+
+        return {
+            phase: {
+                "Min": round(durations[0] * 1000, 2) if durations else None,
+                "Avg": round(sum(durations) / len(durations) * 1000, 2) if durations else None,
+                "P95": round(durations[int(len(durations) * 0.95)] * 1000, 2) if durations else None,
+                "Max": round(durations[-1] * 1000, 2) if durations else None,
+            }
+            for phase, durations in samples.items()
+        }
+
+
+class FrameFormat:
+    """
+    Describes a frame of a BMS protocol, so that `FrameParser` can find it in a stream of bytes.
+
+    :param name: Name of the protocol, used for logging
+    :param start: Start bytes of the frame
+    :param header_size: Number of bytes needed to calculate the frame length
+    :param frame_length: Function that returns the total frame length from the header,
+        a value smaller than `header_size` marks the header as invalid
+    :param is_valid: Function that validates the complete frame (checksum, end byte, etc.)
+    :param max_length: Maximum frame length, longer frames are treated as invalid
+    """
+
+    def __init__(
+        self,
+        name: str,
+        start: bytes,
+        header_size: int,
+        frame_length: Callable[[memoryview], int],
+        is_valid: Callable[[memoryview], bool],
+        max_length: int = 1024,
+    ):
+        self.name = name
+        self.start = start
+        self.header_size = header_size
+        self.frame_length = frame_length
+        self.is_valid = is_valid
+        self.max_length = max_length
+
+
+def is_valid_frame_daly(frame: memoryview) -> bool:
+    return sum8(frame[:-1]) == frame[-1]
+
+
+def is_valid_frame_lltjbd(frame: memoryview) -> bool:
+    return frame[-1] == 0x77 and int.from_bytes(frame[-3:-1], "big") == sum16_complement(frame[2:-3])
+
+
+def is_valid_frame_jkbms(frame: memoryview) -> bool:
+    return frame[-5] == 0x68 and sum(frame[:-4]) == int.from_bytes(frame[-2:], "big")
+
+
+def frame_length_ascii_hex(header: memoryview) -> int:
+    try:
+        # SOI (1) + VER (2) + ADR (2) + CID1 (2) + CID2 (2) + LENGTH (4) + INFO + CHKSUM (4) + EOI (1)
+        return 13 + int(bytes(header[10:13]), 16) + 5
+    except ValueError:
+        return 0
+
+
+def is_valid_frame_ascii_hex(frame: memoryview) -> bool:
+    try:
+        return frame[-1] == 0x0D and int(bytes(frame[-5:-1]), 16) == sum16_complement(frame[1:-5])
+    except ValueError:
+        return False
+
+
+FRAME_FORMAT_DALY = FrameFormat("Daly", b"\xa5", 4, lambda header: header[3] + 5, is_valid_frame_daly, 13)
+"""
+Daly: [0xA5][Address][Command][Length=8][8 data bytes][checksum]
+"""
+FRAME_FORMAT_LLTJBD = FrameFormat("LltJbd", b"\xdd", 4, lambda header: header[3] + 7, is_valid_frame_lltjbd)
+"""
+LLT/JBD: [0xDD][Command][Status][Length][data][checksum (2)][0x77]
+"""
+FRAME_FORMAT_JKBMS = FrameFormat("Jkbms", b"\x4e\x57", 4, lambda header: int.from_bytes(header[2:4], "big") + 2, is_valid_frame_jkbms)
+"""
+JKBMS: [0x4E 0x57][Length (2)][data][0x68][checksum (4)]
+"""
+FRAME_FORMAT_ASCII_HEX = FrameFormat("Pace/Seplos", b"\x7e", 13, frame_length_ascii_hex, is_valid_frame_ascii_hex)
+"""
+Pace/Seplos: [0x7E][ASCII hex encoded header, data and checksum][0x0D]
+"""
+
+
+class FrameParser:
+    """
+    Incremental parser that extracts complete frames from a stream of bytes.
+
+    The received bytes are stored in a preallocated buffer. The parser scans for the start bytes
+    of the protocol and validates the length and checksum through memoryview slices without copying
+    the data. If a candidate frame is invalid, the parser skips one byte and searches for the next
+    start bytes. This way noise on the line only costs the broken frame and not the whole cycle.
+
+    :param frame_format: Format of the frames to parse
+    :param buffer_size: Size of the preallocated buffer in bytes
+    """
+
+    def __init__(self, frame_format: FrameFormat, buffer_size: int = 2048):
+        self.frame_format = frame_format
+        self._buffer = bytearray(max(buffer_size, frame_format.max_length * 2))
+        self._view = memoryview(self._buffer)
+        self._start = 0
+        self._end = 0
+        self.skipped_bytes: int = 0
+        """
+        Number of bytes that were skipped while searching for valid frames
+        """
+
+    def __len__(self) -> int:
+        return self._end - self._start
+
+    def reset(self) -> None:
+        """
+        Discard all buffered bytes, e.g. after flushing the serial input buffer.
+        """
+        self._start = 0
+        self._end = 0
+
+    def feed(self, data: bytes) -> None:
+        """
+        Append received bytes to the buffer.
+
+        :param data: Received bytes
+        """
+        size = len(data)
+        capacity = len(self._buffer)
+
+        if self._end + size > capacity:
+            # move the unprocessed bytes to the beginning of the buffer
+            buffered = self._end - self._start
+            self._buffer[0:buffered] = self._view[self._start : self._end]
+            self._start = 0
+            self._end = buffered
+
+            # still not enough space, drop the oldest bytes
+            if self._end + size > capacity:
+                drop = min(self._end + size - capacity, self._end)
+                self.skipped_bytes += drop
+                self._buffer[0 : self._end - drop] = self._view[drop : self._end]
+                self._end -= drop
+
+                if size > capacity:
+                    self.skipped_bytes += size - capacity
+                    data = data[size - capacity :]
+                    size = capacity
+
+        self._buffer[self._end : self._end + size] = data
+        self._end += size
+
+    def _skip(self, count: int) -> None:
+        self._start += count
+        self.skipped_bytes += count
+
+    def get_frame(self) -> Union[bytearray, None]:
+        """
+        Get the next complete and valid frame from the buffer.
+
+        :return: The frame or None if no complete frame is available yet
+        """
+        frame_format = self.frame_format
+        start = frame_format.start
+
+        while self._end - self._start >= len(start):
+            index = self._buffer.find(start, self._start, self._end)
+
+            if index == -1:
+                # keep the last bytes, since they could be the beginning of the start bytes
+                self._skip(self._end - self._start - (len(start) - 1))
+                return None
+
+            if index > self._start:
+                self._skip(index - self._start)
+
+            if self._end - index < frame_format.header_size:
+                return None
+
+            length = frame_format.frame_length(self._view[index : index + frame_format.header_size])
+            if length < frame_format.header_size or length > frame_format.max_length:
+                # not a valid header, search for the next start bytes
+                self._skip(1)
+                continue
+
+            if self._end - index < length:
+                # the start bytes could be noise with a plausible length, check if a complete frame follows
+                index = self._find_complete_frame(index + 1)
+                if index == -1:
+                    return None
+
+                self._skip(index - self._start)
+                continue
+
+            frame = self._view[index : index + length]
+            if not frame_format.is_valid(frame):
+                logger.debug(f"FrameParser {frame_format.name}: invalid frame, resynchronizing")
+                self._skip(1)
+                continue
+
+            self._start = index + length
+            return bytearray(frame)
+
+        return None
+
+    def _find_complete_frame(self, position: int) -> int:
+        """
+        Search for a complete and valid frame after the given position.
+
+        :param position: Position in the buffer to start searching
+        :return: Position of the frame or -1 if there is none
+        """
+        frame_format = self.frame_format
+
+        while True:
+            index = self._buffer.find(frame_format.start, position, self._end)
+            if index == -1 or self._end - index < frame_format.header_size:
+                return -1
+
+            length = frame_format.frame_length(self._view[index : index + frame_format.header_size])
+            if (
+                frame_format.header_size <= length <= frame_format.max_length
+                and self._end - index >= length
+                and frame_format.is_valid(self._view[index : index + length])
+            ):
+                return index
+
+            position = index + 1
+
+    def read_frame(self, ser: serial.Serial, timeout: float) -> Union[bytearray, bool]:
+        """
+        Read from the serial port until a complete and valid frame was received.
+
+        :param ser: Serial port
+        :param timeout: Maximum time to wait in seconds
+        :return: The frame or False if no frame was received in time
+        """
+        deadline = monotonic() + timeout
+
+        while True:
+            frame = self.get_frame()
+            if frame is not None:
+                return frame
+
+            waiting = wait_for_serial_data(ser, deadline - monotonic())
+            if waiting == 0:
+                return False
+
+            self.feed(ser.read(waiting))
+
+
 def read_serialport_data(
     ser: serial.Serial,
     command: bytearray,
@@ -665,16 +1537,23 @@ def read_serialport_data(
     length_check: int,
     length_fixed: Union[int, None] = None,
     length_size: str = "B",
+    reply_timeout: float = 0.25,
+    timeout: float = 1.0,
 ) -> bytearray:
     """
     Read data from a serial port
 
+    Instead of polling the input buffer, the function blocks on the file descriptor and
+    returns as soon as the frame is complete.
+
     :param ser: Serial port
     :param command: Command to send
     :param length_pos: Position of the length byte
     :param length_check: Length of the checksum
     :param length_fixed: Fixed length of the data, if not set it will be read from the data
     :param length_size: Size of the length byte, can be "B", "H", "I" or "L"
+    :param reply_timeout: Time in seconds in which the reply has to reach the length byte
+    :param timeout: Time in seconds in which the complete reply has to be received
     :return: Data read from the serial port
     """
     try:
@@ -682,52 +1561,46 @@ def read_serialport_data(
         ser.flushInput()
         ser.write(command)
 
-        if length_size.upper() == "B":
-            length_byte_size = 1
-        elif length_size.upper() == "H":
-            length_byte_size = 2
-        elif length_size.upper() == "I" or length_size.upper() == "L":
-            length_byte_size = 4
-
-        count = 0
-        toread = ser.inWaiting()
-
-        while toread < (length_pos + length_byte_size):
-            sleep(0.005)
-            toread = ser.inWaiting()
-            count += 1
-            if count > 50:
-                logger.error(">>> ERROR: No reply - returning")
-                return False
+        header_size = length_pos + calcsize(">" + length_size.upper())
+        length = None
+        data = bytearray()
 
-        # logger.info('serial data toread ' + str(toread))
-        res = ser.read(toread)
-        if length_fixed is not None:
-            length = length_fixed
-        else:
-            if len(res) < (length_pos + length_byte_size):
-                logger.error(">>> ERROR: No reply - returning [len:" + str(len(res)) + "]")
-                return False
-            length = unpack_from(">" + length_size, res, length_pos)[0]
-
-        # logger.info('serial data length ' + str(length))
-
-        count = 0
-        data = bytearray(res)
-        while len(data) <= length + length_check:
-            res = ser.read(length + length_check)
-            data.extend(res)
-            # logger.info('serial data length ' + str(len(data)))
-            sleep(0.005)
-            count += 1
-            if count > 150:
-                logger.error(">>> ERROR: No reply - returning [len:" + str(len(data)) + "/" + str(length + length_check) + "]")
+        time_start = monotonic()
+        deadline = time_start + reply_timeout
+
+        while True:
+            # the length is known as soon as the header is received
+            if length is None and len(data) >= header_size:
+                length = length_fixed if length_fixed is not None else unpack_from(">" + length_size, data, length_pos)[0]
+                deadline = time_start + timeout
+
+            if length is not None and len(data) > length + length_check:
+                break
+
+            waiting = wait_for_serial_data(ser, deadline - monotonic())
+            if waiting == 0:
+                if length is None:
+                    logger.error(">>> ERROR: No reply - returning" + (f" [len:{len(data)}]" if len(data) > 0 else ""))
+                else:
+                    logger.error(f">>> ERROR: No reply - returning [len:{len(data)}/{length + length_check}]")
                 return False
 
+            data.extend(ser.read(waiting))
+
+        # get also the bytes that arrived in the meantime, like the previous implementation did
+        waiting = ser.in_waiting
+        if waiting > 0:
+            data.extend(ser.read(waiting))
+
+        logger.debug(f"read_serialport_data: waited {(monotonic() - time_start) * 1000:.1f} ms for {len(data)} bytes")
+
         return data
 
-    except serial.SerialException as e:
+    except OSError as e:
+        # serial.SerialException is a subclass of OSError
         logger.error(e)
+        # reopen the port on the next request
+        serial_port_manager.discard(ser)
         return False
 
     except Exception:
@@ -763,19 +1636,16 @@ def read_serial_data(
     :param length_size: Size of the length byte, can be "B", "H", "I" or "L"
     :return: Data read from the serial port
     """
-    ser = None  # Initialize ser to None
     try:
-        with serial.Serial(port, baudrate=baud, timeout=0.1) as ser:
+        # the port is kept open between requests and only reopened after an I/O error
+        with serial_port_manager.transaction(port):
+            ser = serial_port_manager.get(port, baud)
             return read_serialport_data(ser, command, length_pos, length_check, length_fixed, length_size)
 
     except serial.SerialException as e:
         logger.error(e)
-        if ser is not None:
-            # close the serial port if it was opened
-            ser.close()
-            logger.error("Serial port closed")
-        else:
-            logger.error("Serial port could not be opened")
+        logger.error("Serial port could not be opened")
+        serial_port_manager.close(port)
 
         return False
 
@@ -0,0 +1,476 @@
+# -*- coding: utf-8 -*-
+import queue
+import sys
+import threading
+from collections import deque
+from time import monotonic
+from typing import Any, Callable, Dict, List, Union
+
+from gi.repository import GLib as gobject
+
+from utils import logger
+
+
+class IoWorker(threading.Thread):
+    """
+    Runs the BMS I/O of one port in a separate thread, so the main loop is not blocked while the driver waits
+    for the replies of the BMS and is able to answer D-Bus requests (e.g. from systemcalc or the GUI) meanwhile.
+
+    The worker and the main loop take turns on the battery object: the worker runs `refresh_data()` and then
+    hands the battery back to the main loop, which calculates and publishes the values. The next refresh is
+    only requested after publishing, so the data does not change while it's calculated and published.
+    The D-Bus callbacks only set triggers, which are written to the BMS with the next refresh.
+    """
+
+    def __init__(self, port: str):
+        """
+        :param port: Port used by the batteries, only used for the thread name and the log
+        """
+        super().__init__(name=f"IoWorker-{port}")
+        self.daemon = True
+        self.port = port
+        self._requests: queue.Queue = queue.Queue()
+
+    def refresh(self, battery: Any, done: Callable[[bool], None]) -> None:
+        """
+        Request a refresh of the battery data.
+
+        :param battery: Battery to refresh
+        :param done: Called in the main loop with the result of `refresh_data()`
+        :return: None
+        """
+        self._requests.put((battery, done))
+
+    def stop(self) -> None:
+        """
+        Stop the worker after the current refresh.
+
+        :return: None
+        """
+        self._requests.put(None)
+
+    def run(self) -> None:
+        while True:
+            request = self._requests.get()
+            if request is None:
+                return
+
+            battery, done = request
+            try:
+                with battery.cycle_timing.span("RefreshData"):
+                    result = battery.refresh_data()
+            except Exception:
+                exception_type, exception_object, exception_traceback = sys.exc_info()
+                file = exception_traceback.tb_frame.f_code.co_filename
+                line = exception_traceback.tb_lineno
+                logger.error(f"Exception occurred on {self.port}: {repr(exception_object)} of type {exception_type} in {file} line #{line}")
+                result = False
+
+            # hand the battery back to the main loop
+            gobject.idle_add(self._deliver, done, result)
+
+    @staticmethod
+    def _deliver(done: Callable[[bool], None], result: bool) -> bool:
+        done(result)
+        return False
+
+
+class MainLoopMonitor:
+    """
+    Measures how long the main loop is blocked by callbacks, e.g. by a refresh that waits for the BMS.
+
+    A timer is armed every `INTERVAL` seconds, the delay with which it's called is the time, in which
+    the main loop was not able to handle anything else, like the D-Bus requests of other services.
+    """
+
+    INTERVAL: float = 0.1
+    """
+    Interval of the timer in seconds
+    """
+
+    SAMPLES: int = 600
+    """
+    Number of delays used for the statistics, which is one minute
+    """
+
+    def __init__(self):
+        self.stall_ewma: float = 0.0
+        self.stalls: int = 0
+        """
+        Number of times the main loop was blocked longer than one second
+        """
+        self._samples: deque = deque(maxlen=self.SAMPLES)
+        self._due: float = 0.0
+        self._timer: Union[int, None] = None
+
+    def start(self) -> None:
+        """
+        Start measuring.
+
+        :return: None
+        """
+        if self._timer is None:
+            self._due = monotonic() + self.INTERVAL
+            self._timer = gobject.timeout_add(int(self.INTERVAL * 1000), self._run)
+
+    def _run(self) -> bool:
+        now = monotonic()
+        stall = max(0.0, now - self._due)
+        self._samples.append(stall)
+        self.stall_ewma += 0.1 * (stall - self.stall_ewma)
+        if stall > 1:
+            self.stalls += 1
+
+        # one-shot timer, else GLib would catch up on the missed calls
+        self._due = now + self.INTERVAL
+        self._timer = gobject.timeout_add(int(self.INTERVAL * 1000), self._run)
+        return False
+
+    def get_statistics(self) -> Dict[str, Union[float, int, None]]:
+        """
+        Get the values for publishing.
+
+        :return: Dictionary with the values, times in milliseconds
+        """
+        if not self._samples:
+            return {"StallAvg": None, "StallP95": None, "StallMax": None, "Stalls": self.stalls}
+
+        samples = sorted(self._samples)
+        return {
+            "StallAvg": round(self.stall_ewma * 1000, 1),
+            "StallP95": round(samples[int(len(samples) * 0.95)] * 1000, 1),
+            "StallMax": round(samples[-1] * 1000, 1),
+            "Stalls": self.stalls,
+        }
+
+
+main_loop_monitor = MainLoopMonitor()
+
+
+class PollScheduler:
+    """
+    Polls one battery with an adaptive interval (see `PollTiming`).
+
+    The scheduler owns the timer. It's a one-shot timer, which is re-armed after each poll, so a changed interval
+    takes effect with the next poll. The next poll is due one interval after the start of the last one. If a poll
+    took longer, the next one starts right after it, but missed polls are not caught up.
+    """
+
+    def __init__(self, helper: Any, loop: Any, worker: Union[IoWorker, None] = None):
+        """
+        :param helper: DbusHelper of the battery, its `poll_timing` adapts the interval
+        :param loop: The main loop of the driver
+        :param worker: Worker which refreshes the data, if None it's refreshed in the main loop
+        """
+        self.helper = helper
+        self.battery = helper.battery
+        self.loop = loop
+        self.worker = worker
+        self.next_due: float = 0.0
+        self.running: bool = False
+        self._timer: Union[int, None] = None
+
+    def start(self) -> None:
+        """
+        Start polling the battery with its configured poll interval.
+
+        :return: None
+        """
+        self.battery.poll_timing.set_interval_base(self.battery.poll_interval)
+        self.next_due = monotonic()
+        self.running = True
+        self._arm()
+
+    def stop(self) -> None:
+        """
+        Stop polling the battery, also if it's called while the data is published.
+
+        :return: None
+        """
+        self.running = False
+        self._cancel()
+
+    def _cancel(self) -> None:
+        """
+        Cancel the pending timer.
+
+        :return: None
+        """
+        if self._timer is not None:
+            gobject.source_remove(self._timer)
+            self._timer = None
+
+    def _arm(self) -> None:
+        """
+        Re-arm the timer for the next poll.
+
+        :return: None
+        """
+        if not self.running:
+            return
+
+        self._cancel()
+        delay = max(0, int((self.next_due - monotonic()) * 1000))
+        self._timer = gobject.timeout_add(delay, self._run)
+
+    def _run(self) -> bool:
+        """
+        Poll the battery, the timer is re-armed after the data was published.
+
+        :return: Always False, the timer is re-armed for the next poll
+        """
+        self._timer = None
+        start = monotonic()
+
+        if self.worker is not None:
+            self.worker.refresh(self.battery, lambda result: self._publish(start, result))
+        else:
+            self._publish(start, None)
+
+        return False
+
+    def _publish(self, start: float, result: Union[bool, None]) -> None:
+        """
+        Publish the data and calculate when the battery is due again.
+
+        :param start: Start time of the poll
+        :param result: Result of `refresh_data()`, None if it's refreshed by `publish_battery()`
+        :return: None
+        """
+        self.helper.publish_battery(self.loop, result)
+
+        end = monotonic()
+        runtime = end - start
+        logger.debug(f"Polling data took {runtime:.3f} seconds")
+
+        timing = self.battery.poll_timing
+        if timing.record(runtime):
+            self.battery.poll_interval = timing.interval
+
+        # keep the cadence, but do not try to catch up on missed polls
+        self.next_due = max(start + timing.interval / 1000, end)
+
+        self._arm()
+
+
+class BusSlot:
+    """
+    Scheduling state of one battery on a shared bus
+    """
+
+    def __init__(self, key: Any, helper: Any, interval: float):
+        self.key = key
+        self.helper = helper
+        self.interval: float = interval
+        """
+        Poll interval in milliseconds
+        """
+        self.next_due: float = 0.0
+        self.failures: int = 0
+        self.last_runtime: float = 0.0
+        self.polls: int = 0
+
+
+class BusScheduler:
+    """
+    Schedules the polling of several batteries which share one port (daisy chain, RS485 bus).
+
+    Only one battery is polled per main loop callback. After each poll the timer is re-armed for the battery
+    which is due next, so the main loop is able to handle D-Bus events between the packs and a slow pack
+    does not delay the others until their turn. The battery that is overdue the longest is polled first.
+
+    Batteries that do not reply are polled with an increasing delay, so a dead pack does not eat the bus time
+    of the others with its timeouts.
+    """
+
+    FAILURE_BACKOFF_MAX: float = 10.0
+    """
+    Maximum delay in seconds between two polls of a battery that does not reply
+    """
+
+    def __init__(self, port: str, loop: Any, worker: Union[IoWorker, None] = None):
+        """
+        :param port: Port shared by the batteries
+        :param loop: The main loop of the driver
+        :param worker: Worker which refreshes the data, if None it's refreshed in the main loop
+        """
+        self.port = port
+        self.loop = loop
+        self.worker = worker
+        self.slots: List[BusSlot] = []
+        self._timer: Union[int, None] = None
+        self._busy: bool = False
+        """
+        Set while the worker refreshes a battery, the timer is re-armed after it was published
+        """
+
+    def add(self, key: Any, helper: Any, interval: float) -> None:
+        """
+        Add a battery to the bus.
+
+        :param key: Key of the battery, normally the bus address
+        :param helper: DbusHelper of the battery
+        :param interval: Poll interval in milliseconds
+        :return: None
+        """
+        helper.battery.poll_timing.set_interval_base(interval)
+        self.slots.append(BusSlot(key, helper, interval))
+
+    def remove(self, key: Any) -> None:
+        """
+        Remove a battery from the bus, e.g. if it failed. The other batteries are still polled.
+
+        :param key: Key of the battery
+        :return: None
+        """
+        self.slots = [slot for slot in self.slots if slot.key != key]
+
+        if not self.slots:
+            self.stop()
+
+    def set_interval(self, key: Any, interval: float) -> None:
+        """
+        Change the poll interval of a battery.
+
+        :param key: Key of the battery
+        :param interval: Poll interval in milliseconds
+        :return: None
+        """
+        for slot in self.slots:
+            if slot.key == key:
+                slot.helper.battery.poll_timing.set_interval_base(interval)
+                slot.interval = interval
+                slot.next_due = min(slot.next_due, monotonic() + interval / 1000)
+
+        self._arm()
+
+    def start(self) -> None:
+        """
+        Start polling the batteries.
+
+        :return: None
+        """
+        now = monotonic()
+        for slot in self.slots:
+            slot.next_due = now
+
+        self._arm()
+
+    def stop(self) -> None:
+        """
+        Stop polling the batteries.
+
+        :return: None
+        """
+        if self._timer is not None:
+            gobject.source_remove(self._timer)
+            self._timer = None
+
+    def _next_slot(self) -> BusSlot:
+        return min(self.slots, key=lambda slot: slot.next_due)
+
+    def _arm(self) -> None:
+        """
+        Re-arm the timer for the battery that is due next.
+
+        :return: None
+        """
+        if not self.slots or self._busy:
+            return
+
+        self.stop()
+        delay = max(0, int((self._next_slot().next_due - monotonic()) * 1000))
+        self._timer = gobject.timeout_add(delay, self._run)
+
+    def _run(self) -> bool:
+        """
+        Poll the battery that is due next.
+
+        :return: Always False, the timer is re-armed for the next battery
+        """
+        self._timer = None
+        slot = self._next_slot()
+        now = monotonic()
+
+        if slot.next_due <= now:
+            if self.worker is not None:
+                self._busy = True
+                self.worker.refresh(slot.helper.battery, lambda result: self._publish(slot, now, result))
+                return False
+
+            self._publish(slot, now, None)
+
+        self._arm()
+        return False
+
+    def _publish(self, slot: BusSlot, start: float, result: Union[bool, None]) -> None:
+        """
+        Publish the data of one battery and calculate when it is due again.
+
+        :param slot: Battery that was polled
+        :param start: Start time of the poll
+        :param result: Result of `refresh_data()`, None if it's refreshed by `publish_battery()`
+        :return: None
+        """
+        slot.helper.publish_battery(self.loop, result)
+
+        # the battery was removed while it was published, because it failed
+        if slot not in self.slots:
+            self._busy = False
+            self._arm()
+            return
+
+        end = monotonic()
+        slot.last_runtime = end - start
+        slot.polls += 1
+
+        # the interval is increased, if the battery is polled slower than configured, and decreased, if it recovers
+        timing = slot.helper.battery.poll_timing
+        if timing.record(slot.last_runtime):
+            slot.interval = slot.helper.battery.poll_interval = timing.interval
+
+        interval = slot.interval / 1000
+
+        # publish_battery() resets the error count after a successful refresh
+        if slot.helper.error["count"] == 0:
+            slot.failures = 0
+            # keep the cadence, but do not try to catch up on missed polls
+            slot.next_due = max(slot.next_due + interval, end)
+        else:
+            slot.failures += 1
+            delay = min(interval * 2 ** (slot.failures - 1), max(interval, self.FAILURE_BACKOFF_MAX))
+            slot.next_due = end + delay
+            logger.debug(f"Battery {slot.key} on {self.port} did not reply {slot.failures} time(s), next poll in {delay:.3f} s")
+
+        if slot.last_runtime > interval:
+            logger.debug(f"Polling battery {slot.key} took {slot.last_runtime:.3f} s, longer than its poll interval")
+
+        if slot is self.slots[0]:
+            logger.debug(f"Polling all {len(self.slots)} batteries on {self.port} takes {self.sweep_time:.3f} s")
+
+        if self._busy:
+            self._busy = False
+            self._arm()
+
+    @property
+    def sweep_time(self) -> float:
+        """
+        Bus time in seconds needed to poll every battery once, based on the last poll of each battery.
+        """
+        return sum(slot.last_runtime for slot in self.slots)
+
+    def get_statistics(self) -> Dict[Any, Dict[str, float]]:
+        """
+        Get the scheduling statistics of all batteries.
+
+        :return: Dictionary with the statistics per battery key
+        """
+        return {
+            slot.key: {
+                "interval": slot.interval,
+                "last_runtime": slot.last_runtime,
+                "failures": slot.failures,
+                "polls": slot.polls,
+            }
+            for slot in self.slots
+        }
@@ -3,7 +3,13 @@ import threading
 import can
 import subprocess
 from utils import logger
-from time import sleep, time
+from time import monotonic, sleep, time
+from typing import List, Tuple, Union
+
+CAN_BITRATES: List[int] = [250, 500]
+"""
+Bitrates in kbps, which are tried to find the bitrate of a CAN bus
+"""
 
 
 class CanTransportInterface:
@@ -22,7 +28,7 @@ class CanReceiverThread(threading.Thread):
 
     _instances = {}
 
-    def __init__(self, channel, bustype):
+    def __init__(self, channel, bustype, bitrate: Union[int, None] = None):
 
         # singleton for tuple
         if (channel, bustype) in CanReceiverThread._instances:
@@ -31,6 +37,7 @@ class CanReceiverThread(threading.Thread):
         super().__init__(name=f"CanReceiverThread-{channel}")
         self.channel = channel
         self.bustype = bustype
+        self.bitrate = bitrate  # bitrate in kbps, used if the interface is down
         self._current_time = int(time())
         self.message_cache = {}  # cache can frames here
         self.cache_lock = threading.Lock()  # lock for thread safety
@@ -45,18 +52,19 @@ class CanReceiverThread(threading.Thread):
         self.initial_interface_state = self.get_link_status()
 
     @classmethod
-    def get_instance(cls, channel, bustype) -> "CanReceiverThread":
+    def get_instance(cls, channel, bustype, bitrate: Union[int, None] = None) -> "CanReceiverThread":
         """
         Get the instance of the CAN receiver thread for the given channel
 
         :param channel: CAN interface name
         :param bustype: CAN interface type
+        :param bitrate: bitrate in kbps to bring up the interface with, if it's down, e.g. from `detect_bitrate()`
         :return: instance of the CAN receiver thread
         """
         # check for instance
         if (channel, bustype) not in cls._instances:
             # create new one
-            instance = cls(channel, bustype)
+            instance = cls(channel, bustype, bitrate)
             instance.start()
         return cls._instances[(channel, bustype)]
 
@@ -67,7 +75,7 @@ class CanReceiverThread(threading.Thread):
         :return: None
         """
         # setup up the CAN interface, if not already UP
-        self.setup_can(self.channel)
+        self.setup_can(self.channel, bitrate=self.bitrate or 250)
         self.can_bus = can.interface.Bus(channel=self.channel, bustype=self.bustype)
 
         # fetch the bitrate from the current port, for logging only
@@ -214,13 +222,14 @@ class CanReceiverThread(threading.Thread):
             raise
 
     @staticmethod
-    def setup_can(channel: str, bitrate: int = 250, force: bool = False) -> None:
+    def setup_can(channel: str, bitrate: int = 250, force: bool = False, listen_only: bool = False) -> None:
         """
         Bring up the CAN interface
 
         :param channel: CAN interface name
         :param bitrate: bitrate in kbps, default is 250 kbps
         :param force: force to bring up/reset the interface, default is False
+        :param listen_only: only receive, the controller does not send frames, acknowledges or error frames
         """
         try:
             # check if CAN interface exists and is down
@@ -239,7 +248,7 @@ class CanReceiverThread(threading.Thread):
 
             # bring up the interface with the given bitrate
             result = subprocess.run(
-                ["ip", "link", "set", f"{channel}", "type", "can", "bitrate", f"{bitrate * 1000}"],
+                ["ip", "link", "set", f"{channel}", "type", "can", "bitrate", f"{bitrate * 1000}", "listen-only", "on" if listen_only else "off"],
                 capture_output=True,
                 text=True,
                 check=True,
@@ -249,8 +258,122 @@ class CanReceiverThread(threading.Thread):
             result = subprocess.run(["ip", "link", "set", f"{channel}", "up"], capture_output=True, text=True, check=True)
             result.check_returncode()
 
-            logger.info(f"CAN Bus {channel} is up with bitrate {bitrate} kbps")
+            logger.info(f"CAN Bus {channel} is up with bitrate {bitrate} kbps" + (" in listen-only mode" if listen_only else ""))
 
         except Exception as e:
             logger.error(f"Error bringing up {channel}: {e}")
             raise
+
+    @staticmethod
+    def get_bus_errors(channel: str) -> int:
+        """
+        Fetch the bus error counter of the CAN interface
+
+        :param channel: CAN interface name
+        :return: number of bus errors since the interface was brought up, 0 if not available
+        """
+        try:
+            result = subprocess.run(["ip", "-details", "-statistics", "link", "show", channel], capture_output=True, text=True, check=True)
+            lines = result.stdout.split("\n")
+            for index, line in enumerate(lines[:-1]):
+                if "bus-errors" in line:
+                    return int(lines[index + 1].split()[line.split().index("bus-errors")])
+        except Exception as e:
+            logger.debug(f"Error fetching bus errors: {e}")
+
+        return 0
+
+    @staticmethod
+    def listen(channel: str, duration: float) -> Tuple[int, int]:
+        """
+        Count the frames received on the CAN interface without sending anything
+
+        :param channel: CAN interface name
+        :param duration: time to listen in seconds
+        :return: number of valid frames and number of errors
+        """
+        frames = 0
+        error_frames = 0
+        bus_errors = CanReceiverThread.get_bus_errors(channel)
+
+        can_bus = can.interface.Bus(channel=channel, bustype="socketcan")
+        try:
+            time_end = monotonic() + duration
+            remaining = duration
+            while remaining > 0:
+                message = can_bus.recv(timeout=remaining)
+                if message is not None:
+                    if message.is_error_frame:
+                        error_frames += 1
+                    else:
+                        frames += 1
+                remaining = time_end - monotonic()
+        except can.exceptions.CanOperationError as e:
+            logger.debug(f"CAN Bus {channel}: {e}")
+            error_frames += 1
+        finally:
+            can_bus.shutdown()
+
+        # with a wrong bitrate the controller counts bus errors, even if it does not report them as error frames
+        return frames, max(error_frames, CanReceiverThread.get_bus_errors(channel) - bus_errors)
+
+    @staticmethod
+    def detect_bitrate(channel: str, bitrates: List[int] = CAN_BITRATES, duration: float = 1.5) -> Union[int, None]:
+        """
+        Find the bitrate of the CAN bus without disturbing it.
+
+        If the interface is already up, it's not touched, since it can be configured by the system (e.g. VE.Can on a
+        GX device), and its bitrate is returned. Else it's brought up in listen-only mode at each bitrate for a short
+        time and the bitrate with the most valid frames and the fewest errors is used. With a wrong bitrate nothing is
+        sent to the bus, since a listen-only controller does not acknowledge frames or send error frames.
+
+        A bus on which no frame is received, e.g. with a BMS that only answers requests, can't be detected.
+
+        :param channel: CAN interface name
+        :param bitrates: bitrates in kbps to try
+        :param duration: time to listen per bitrate in seconds, the BMS should send at least one frame in this time
+        :return: bitrate in kbps, None if it could not be detected. The interface is then down as before.
+        """
+        # vcan doesn't support bitrate
+        if channel.startswith("vcan"):
+            return None
+
+        detected = None
+        listen_only = False
+        try:
+            result = subprocess.run(["ip", "link", "show", channel], capture_output=True, text=True, check=True)
+            if "DOWN" not in result.stdout:
+                bitrate = CanReceiverThread.get_bitrate(channel) // 1000
+                logger.info(f"CAN Bus {channel} is already up with {bitrate} kbps, the bitrate is not changed")
+                return bitrate
+
+            results = {}
+            for bitrate in bitrates:
+                listen_only = True
+                CanReceiverThread.setup_can(channel, bitrate=bitrate, force=True, listen_only=True)
+                results[bitrate] = CanReceiverThread.listen(channel, duration)
+                logger.info(f"CAN Bus {channel} at {bitrate} kbps: {results[bitrate][0]} frames, {results[bitrate][1]} errors")
+
+                # a clean reception is the right bitrate, no need to try the others
+                if results[bitrate][0] > 0 and results[bitrate][1] == 0:
+                    break
+
+            candidates = [bitrate for bitrate in results if results[bitrate][0] > 0]
+            if candidates:
+                detected = max(candidates, key=lambda bitrate: results[bitrate][0] - results[bitrate][1])
+                logger.info(f"Detected CAN Bus bitrate: {detected} kbps")
+            else:
+                logger.info(f"Could not detect the bitrate of CAN Bus {channel}, no frames received, using the default of 250 kbps")
+
+        except Exception as e:
+            logger.error(f"Error detecting the bitrate of {channel}: {e}")
+            detected = None
+
+        # leave the listen-only mode, the interface is brought up by the receiver thread with the detected bitrate
+        if listen_only:
+            try:
+                subprocess.run(["ip", "link", "set", f"{channel}", "down"], capture_output=True, text=True, check=True)
+            except Exception as e:
+                logger.error(f"Error restoring {channel}: {e}")
+
+        return detected
@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+from functools import lru_cache
+from typing import List, Union
+
+# bytes, bytearray, memoryview or a list of ints, like the frame buffers of the BLE drivers
+Buffer = Union[bytes, bytearray, memoryview, List[int]]
+
+
+def crc16_table(polynomial: int) -> List[int]:
+    """
+    Calculate the lookup table of a reflected CRC16.
+
+    :param polynomial: Reflected polynomial, e.g. 0xA001 for CRC16-Modbus
+    :return: List with the CRC of each byte value
+    """
+    table = []
+    for byte in range(256):
+        crc = byte
+        for _ in range(8):
+            crc = (crc >> 1) ^ polynomial if crc & 1 else crc >> 1
+        table.append(crc)
+    return table
+
+
+CRC16_MODBUS_TABLE: List[int] = crc16_table(0xA001)
+"""
+Lookup table of the CRC16-Modbus (polynomial 0x8005 reflected)
+"""
+
+
+def crc16_modbus(data: Buffer) -> int:
+    """
+    Calculate the CRC16-Modbus with a lookup table, one step per byte instead of eight.
+
+    :param data: Data to calculate the CRC for
+    :return: CRC value, send it little endian
+    """
+    table = CRC16_MODBUS_TABLE
+    crc = 0xFFFF
+    for byte in data:
+        crc = (crc >> 8) ^ table[(crc ^ byte) & 0xFF]
+    return crc
+
+
+def crc16_modbus_bytes(data: Buffer) -> bytes:
+    """
+    Calculate the CRC16-Modbus as it's sent on the wire.
+
+    :param data: Data to calculate the CRC for
+    :return: CRC as two bytes, little endian
+    """
+    return crc16_modbus(data).to_bytes(2, "little")
+
+
+@lru_cache(maxsize=128)
+def crc16_modbus_frame(frame: bytes) -> bytes:
+    """
+    Append the CRC16-Modbus to a frame. The result is cached, so for the static commands
+    of a driver the CRC is only calculated once.
+
+    :param frame: Frame without CRC, has to be `bytes` to be cacheable
+    :return: Frame with CRC
+    """
+    return frame + crc16_modbus_bytes(frame)
+
+
+def sum8(data: Buffer) -> int:
+    """
+    Calculate the 8 bit sum of all bytes, like Daly, JKBMS BLE and others use it.
+
+    :param data: Data to calculate the checksum for
+    :return: Checksum
+    """
+    return sum(data) & 0xFF
+
+
+def sum16(data: Buffer) -> int:
+    """
+    Calculate the 16 bit sum of all bytes.
+
+    :param data: Data to calculate the checksum for
+    :return: Checksum
+    """
+    return sum(data) & 0xFFFF
+
+
+def sum16_complement(data: Buffer) -> int:
+    """
+    Calculate the two's complement of the 16 bit sum of all bytes, like LLT/JBD and the ASCII hex
+    protocols (Seplos, Pace, Daren, EG4 Lifepower) use it.
+
+    :param data: Data to calculate the checksum for
+    :return: Checksum
+    """
+    return -sum(data) & 0xFFFF
+
+
+@lru_cache(maxsize=64)
+def length_checksum(length: int) -> int:
+    """
+    Add the checksum to the info length of the ASCII hex protocols (LENID with LCHKSUM in the upper 4 bits).
+
+    :param length: Number of ASCII characters of the info, 0 to 4095
+    :return: LENGTH field value, 0 for an empty info
+    """
+    length &= 0x0FFF
+    if length == 0:
+        return 0
+
+    lchksum = (-((length & 0xF) + ((length >> 4) & 0xF) + ((length >> 8) & 0xF))) & 0xF
+    return (lchksum << 12) | length
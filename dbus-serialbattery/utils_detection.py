@@ -0,0 +1,340 @@
+# -*- coding: utf-8 -*-
+import json
+import os
+import re
+from time import monotonic, time
+from typing import Dict, Iterable, List, Union
+
+from serial.tools import list_ports
+
+from utils import logger, serial_port_manager, wait_for_serial_data
+
+
+def get_usb_id(port: str) -> str:
+    """
+    Get the identification of the USB adapter of a serial port.
+
+    :param port: Serial port, e.g. `/dev/ttyUSB0`
+    :return: `VID:PID:serial number` of the USB adapter or an empty string, if the port is not an USB adapter
+    """
+    try:
+        device = os.path.realpath(port)
+        for port_info in list_ports.comports():
+            if port_info.device in (port, device) and port_info.vid is not None:
+                return f"{port_info.vid:04x}:{port_info.pid:04x}:{port_info.serial_number or ''}"
+    except Exception as e:
+        logger.debug(f"Could not get the USB adapter of {port}: {e}")
+
+    return ""
+
+
+def sniff_serial(port: str, bms_types: List[dict], sniff_time: float) -> List[dict]:
+    """
+    Listen on a serial port without sending anything and recognize the BMS types, whose frames are on the bus.
+    E.g. the replies of a BMS polled by a monitor or another master, like a JKBMS PB master polling its slaves.
+
+    Only BMS types with a `sniff_pattern` in the driver registry can be recognized, no driver is imported for it.
+    The port is listened on once per baud rate of these BMS types and it stops at the first baud rate, at which
+    a BMS type was recognized.
+
+    :param port: Serial port
+    :param bms_types: Entries of `expected_bms_types`
+    :param sniff_time: Time to listen per baud rate in seconds
+    :return: Entries of `bms_types`, whose frames were received, empty if nothing was recognized
+    """
+    groups: Dict[int, List[dict]] = {}
+    for bms_type in bms_types:
+        if bms_type["bms"].sniff_pattern is not None and bms_type.get("baud") is not None:
+            groups.setdefault(bms_type["baud"], []).append(bms_type)
+
+    for baud, group in groups.items():
+        data = bytearray()
+        try:
+            with serial_port_manager.connection(port, baud) as ser:
+                ser.reset_input_buffer()
+                time_end = monotonic() + sniff_time
+                remaining = sniff_time
+                while remaining > 0:
+                    waiting = wait_for_serial_data(ser, remaining)
+                    if waiting > 0:
+                        data += ser.read(waiting)
+                    remaining = time_end - monotonic()
+        except OSError as e:
+            # serial.SerialException is a subclass of OSError
+            logger.debug(f"Could not listen on {port} with {baud} baud: {e}")
+            return []
+
+        if len(data) == 0:
+            continue
+
+        found = [bms_type for bms_type in group if re.search(bms_type["bms"].sniff_pattern, data, re.DOTALL)]
+        logger.info(
+            f"Received {len(data)} bytes on {port} with {baud} baud"
+            + (", recognized: " + ", ".join(bms_type["bms"].name for bms_type in found) if found else ", no known BMS recognized")
+        )
+        if found:
+            return found
+
+    return []
+
+
+def match_can_frames(frame_ids: Iterable[int], bms_types: List[dict]) -> List[dict]:
+    """
+    Recognize the BMS types, whose frames were received on a CAN bus.
+
+    :param frame_ids: Arbitration IDs of the received frames, e.g. the keys of the message cache of the `CanReceiverThread`
+    :param bms_types: Entries of `expected_bms_types`
+    :return: Entries of `bms_types`, whose frames were received, empty if nothing was recognized
+    """
+    frame_ids = set(frame_ids)
+    found = [bms_type for bms_type in bms_types if any(bms_type["bms"].load().is_own_can_frame(frame_id) for frame_id in frame_ids)]
+    if frame_ids:
+        logger.info(
+            f"Received {len(frame_ids)} different CAN frames"
+            + (", recognized: " + ", ".join(bms_type["bms"].name for bms_type in found) if found else ", no known BMS recognized")
+        )
+    return found
+
+
+class DetectionCache:
+    """
+    Persisted result of the BMS detection.
+
+    For each port the BMS type, baud rate and address, which were found last, are stored. On the next start
+    this BMS is tried first, so all the other BMS types only have to be tested, if it does not answer anymore.
+    The entries are keyed by the port and the USB adapter, so a different adapter on the same port or a
+    different address on the same bus does not use the entry of another BMS.
+
+    The file also contains the statistics of the `ProbePlanner`.
+    """
+
+    def __init__(self, file_path: str):
+        """
+        :param file_path: Path of the JSON file
+        """
+        self.file_path = file_path
+        self.changed: bool = False
+        """
+        Set if the data has to be written by `save()`
+        """
+        self._data: Union[Dict[str, Dict[str, dict]], None] = None
+
+    @staticmethod
+    def get_key(port: str, bus_address: Union[str, None]) -> str:
+        return f"{port}|{get_usb_id(port)}|{bus_address if bus_address is not None else 'default'}"
+
+    def load(self) -> Dict[str, Dict[str, dict]]:
+        """
+        Load the data once, a missing or broken file is an empty cache.
+
+        :return: Dict with the found `batteries` and the `probes` statistics
+        """
+        if self._data is None:
+            self._data = {"batteries": {}, "probes": {}}
+            try:
+                with open(self.file_path, "r") as file:
+                    data = json.load(file)
+                for name in self._data:
+                    if isinstance(data.get(name), dict):
+                        self._data[name] = data[name]
+            except FileNotFoundError:
+                pass
+            except (OSError, ValueError, AttributeError) as e:
+                logger.warning(f"Could not read the detection cache {self.file_path}: {e}")
+
+        return self._data
+
+    def save(self) -> None:
+        """
+        Write the data, if it changed. It's written to a temporary file first and the cache is replaced,
+        so it's never half written.
+        """
+        if not self.changed:
+            return
+
+        file_path_tmp = self.file_path + ".tmp"
+        try:
+            os.makedirs(os.path.dirname(self.file_path), exist_ok=True)
+            with open(file_path_tmp, "w") as file:
+                json.dump(self._data, file, indent=2, sort_keys=True)
+            os.replace(file_path_tmp, self.file_path)
+            self.changed = False
+        except OSError as e:
+            logger.warning(f"Could not write the detection cache {self.file_path}: {e}")
+
+    def get_probe_stats(self) -> Dict[str, dict]:
+        """
+        :return: Probe statistics by `ProbePlanner.get_key()`, can be changed in place
+        """
+        return self.load()["probes"]
+
+    def get_candidate(self, port: str, bus_address: Union[str, None], bms_types: List[dict]) -> Union[dict, None]:
+        """
+        Get the BMS type that was found last on the port.
+
+        :param port: Port
+        :param bus_address: Address from the config, None if the default address of the BMS type is used
+        :param bms_types: Entries of `expected_bms_types`, a BMS type that is not expected anymore is not returned
+        :return: Entry of `bms_types` or None
+        """
+        entry = self.load()["batteries"].get(self.get_key(port, bus_address))
+        if entry is None:
+            return None
+
+        for bms_type in bms_types:
+            if (
+                bms_type["bms"].name == entry.get("bms")
+                and bms_type.get("baud") == entry.get("baud")
+                # with an address from the config the default address of the BMS type is not used
+                and (bus_address is not None or (bms_type["address"].hex() if "address" in bms_type else None) == entry.get("address"))
+            ):
+                return bms_type
+
+        return None
+
+    def store(self, port: str, bus_address: Union[str, None], bms_type: dict) -> None:
+        """
+        Remember the BMS type that was found on the port and write the cache, if the entry changed.
+
+        :param port: Port
+        :param bus_address: Address from the config, None if the default address of the BMS type is used
+        :param bms_type: Entry of `expected_bms_types`, that answered
+        """
+        key = self.get_key(port, bus_address)
+        batteries = self.load()["batteries"]
+        entry = {
+            "bms": bms_type["bms"].name,
+            "baud": bms_type.get("baud"),
+            "address": bms_type["address"].hex() if bus_address is None and "address" in bms_type else None,
+        }
+
+        previous = batteries.get(key)
+        if previous is None or any(previous.get(name) != value for name, value in entry.items()):
+            entry["detected"] = int(time())
+            batteries[key] = entry
+            self.changed = True
+            logger.info(f"Remember {entry['bms']} on {port} for the next start")
+
+        self.save()
+
+
+class ProbePlanner:
+    """
+    Plans the order in which the BMS types are tested.
+
+    The BMS types are grouped by baud rate, so the shared serial port is only reconfigured once per group.
+    Within a group, and the groups among each other, the BMS types are ordered by the chance to be found
+    per second of probing: a BMS type that was found often on this system and answers or fails fast is
+    tested before a BMS type that was never found and needs several retries with long timeouts until
+    its test fails. The test stops with the first BMS that answers.
+
+    The statistics are learned from each test and kept in the `DetectionCache`. Without statistics the
+    order of `supported_bms_types` is kept within the baud rate groups.
+    """
+
+    COST_DEFAULT: float = 1.0
+    """
+    Assumed duration of a failed test in seconds, until the BMS type was tested once
+    """
+
+    def __init__(self, cache: Union[DetectionCache, None] = None):
+        """
+        :param cache: Cache to load and store the statistics, if None they are only kept while running
+        """
+        self.cache = cache
+        self.stats: Dict[str, dict] = cache.get_probe_stats() if cache is not None else {}
+        self._planned: List[dict] = []
+        """
+        BMS types of the last plan, to check if a test result changes their order
+        """
+
+    @staticmethod
+    def get_key(bms_type: dict) -> str:
+        address = bms_type["address"].hex() if "address" in bms_type else ""
+        return f"{bms_type['bms'].name}:{bms_type.get('baud') or ''}:{address}"
+
+    def get_probability(self, bms_type: dict) -> float:
+        """
+        Estimate the chance that the BMS type is found, with one assumed hit and miss to start with.
+
+        :param bms_type: Entry of `expected_bms_types`
+        :return: Probability between 0 and 1
+        """
+        stats = self.stats.get(self.get_key(bms_type), {})
+        return (stats.get("hits", 0) + 1) / (stats.get("tests", 0) + 2)
+
+    def get_cost(self, bms_type: dict) -> float:
+        """
+        Get the average duration of a failed test, which is the time lost if it's not this BMS type.
+
+        :param bms_type: Entry of `expected_bms_types`
+        :return: Duration in seconds
+        """
+        stats = self.stats.get(self.get_key(bms_type), {})
+        failures = stats.get("tests", 0) - stats.get("hits", 0)
+        if failures <= 0:
+            return self.COST_DEFAULT
+        # avoid a division by zero for BMS types, which fail instantly
+        return max(stats.get("time_failed", 0.0) / failures, 0.001)
+
+    def order(self, bms_types: List[dict]) -> List[dict]:
+        """
+        Order the BMS types by the current statistics.
+
+        :param bms_types: Entries of `expected_bms_types`
+        :return: Same entries in the order to test them
+        """
+        groups: Dict[Union[int, None], List[dict]] = {}
+        for bms_type in bms_types:
+            groups.setdefault(bms_type.get("baud"), []).append(bms_type)
+
+        def score(group: List[dict]) -> float:
+            return sum(self.get_probability(bms_type) for bms_type in group) / sum(self.get_cost(bms_type) for bms_type in group)
+
+        # sorted() is stable, so without statistics the configured order is kept
+        ordered_groups = sorted(
+            (sorted(group, key=lambda bms_type: score([bms_type]), reverse=True) for group in groups.values()),
+            key=score,
+            reverse=True,
+        )
+        return [bms_type for group in ordered_groups for bms_type in group]
+
+    def plan(self, bms_types: List[dict]) -> List[dict]:
+        """
+        Order the BMS types for testing.
+
+        :param bms_types: Entries of `expected_bms_types`
+        :return: Same entries in the order to test them
+        """
+        plan = self.order(bms_types)
+        self._planned = bms_types
+
+        logger.debug("Probe plan: " + ", ".join(f"{self.get_key(bms_type)} ({self.get_cost(bms_type):.2f} s)" for bms_type in plan))
+        return plan
+
+    def record(self, bms_type: dict, duration: float, found: bool) -> None:
+        """
+        Learn from the result of a test.
+
+        :param bms_type: Entry of `expected_bms_types`, that was tested
+        :param duration: Duration of the test in seconds
+        :param found: True if the BMS answered
+        """
+        order_before = self.order(self._planned)
+        stats = self.stats.setdefault(self.get_key(bms_type), {"tests": 0, "hits": 0, "time_failed": 0.0})
+        stats["tests"] = stats.get("tests", 0) + 1
+        if found:
+            stats["hits"] = stats.get("hits", 0) + 1
+        else:
+            stats["time_failed"] = round(stats.get("time_failed", 0.0) + duration, 3)
+
+        # the statistics are only written, if they change the order of the tests, else each start would write the file
+        if self.cache is not None and self.order(self._planned) != order_before:
+            self.cache.changed = True
+
+    def save(self) -> None:
+        """
+        Write the statistics to the cache.
+        """
+        if self.cache is not None:
+            self.cache.save()
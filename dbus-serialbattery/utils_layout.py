@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+from binascii import unhexlify
+from struct import Struct, calcsize
+from typing import Any, Dict, List, Tuple, Union
+
+
+def hex_to_bytes(data: Union[bytes, bytearray, memoryview, str]) -> bytes:
+    """
+    Convert the ASCII hex payload of a frame (Seplos, Pace, Daren and other Pylontech like protocols)
+    to binary in one step, so the values can be decoded with a `FrameLayout` afterwards.
+    Offsets in the binary data are half of the offsets in the ASCII hex data.
+
+    :param data: ASCII hex characters, as bytes or str
+    :return: Binary data
+    :raises ValueError: if the data contains non hex characters or has an odd length
+    """
+    return unhexlify(data)
+
+
+class LayoutField:
+    """
+    One value of a binary frame.
+    """
+
+    def __init__(self, name: str, offset: int, fmt: str, divisor: Union[float, None] = None, count: Union[int, None] = None):
+        """
+        :param name: Key of the value in the result of `FrameLayout.decode()`
+        :param offset: Position of the value in the frame
+        :param fmt: `struct` format character without byte order, e.g. `H`, `i` or `8s`
+        :param divisor: Divisor the value is scaled with, e.g. 1000 for mV to V
+        :param count: Number of consecutive values, if set the value is returned as list
+        """
+        self.name = name
+        self.offset = offset
+        self.fmt = fmt
+        self.divisor = divisor
+        self.count = count
+
+    def get_size(self, byteorder: str) -> int:
+        return calcsize(byteorder + self.fmt) * (1 if self.count is None else self.count)
+
+
+class FrameLayout:
+    """
+    Declarative layout of a binary frame, which is compiled once into `struct.Struct` objects.
+
+    Instead of one `unpack_from()` per value, which parses the format string each time, the whole frame
+    is decoded with one precompiled `Struct.unpack_from()` call. The bytes between the fields are skipped
+    with pad bytes. Fields that overlap (e.g. the same bytes read as two values) are put into additional
+    structs, so layouts can be copied from the protocol description without changes.
+    """
+
+    def __init__(self, fields: List[LayoutField], byteorder: str = "<"):
+        """
+        :param fields: Fields of the frame
+        :param byteorder: `struct` byte order character for all fields
+        """
+        self.fields = fields
+        self.byteorder = byteorder
+        self.size: int = max(field.offset + field.get_size(byteorder) for field in fields)
+        """
+        Minimum length of the frame
+        """
+
+        # put the fields into as few groups as possible, in which they don't overlap
+        groups: List[List[LayoutField]] = []
+        for field in sorted(fields, key=lambda field: field.offset):
+            for group in groups:
+                last = group[-1]
+                if field.offset >= last.offset + last.get_size(byteorder):
+                    group.append(field)
+                    break
+            else:
+                groups.append([field])
+
+        self._structs: List[Tuple[int, Struct]] = []
+        indexes: Dict[int, int] = {}
+        index = 0
+        for group in groups:
+            start = group[0].offset
+            position = start
+            fmt = byteorder
+            for field in group:
+                if field.offset > position:
+                    fmt += f"{field.offset - position}x"
+                # without a count the format is used as is, so strings like "8s" stay one value
+                fmt += field.fmt if field.count is None else f"{field.count}{field.fmt}"
+                position = field.offset + field.get_size(byteorder)
+                indexes[id(field)] = index
+                index += 1 if field.count is None else field.count
+            self._structs.append((start, Struct(fmt)))
+
+        # keep the order of the declaration in the decoded values
+        self._items: List[Tuple[str, int, int, Union[float, None], bool]] = [
+            (field.name, indexes[id(field)], indexes[id(field)] + (1 if field.count is None else field.count), field.divisor, field.count is not None)
+            for field in fields
+        ]
+
+        if len(self._structs) == 1:
+            # fast path, one call decodes the whole frame
+            start, struct = self._structs[0]
+            self._unpack_single = struct.unpack_from
+            self._start_single = start
+
+    def unpack_from(self, data: Union[bytes, bytearray, memoryview], offset: int = 0) -> tuple:
+        """
+        Unpack all values of the frame without scaling.
+
+        :param data: Frame
+        :param offset: Position of the frame in the data
+        :return: Flat tuple of all values, ordered by the compiled structs and not by the declaration
+        :raises struct.error: if the data is too short
+        """
+        if len(self._structs) == 1:
+            return self._unpack_single(data, offset + self._start_single)
+
+        values = ()
+        for start, struct in self._structs:
+            values += struct.unpack_from(data, offset + start)
+        return values
+
+    def decode(self, data: Union[bytes, bytearray, memoryview], offset: int = 0) -> Dict[str, Any]:
+        """
+        Decode the frame into scaled values.
+
+        :param data: Frame
+        :param offset: Position of the frame in the data
+        :return: Values by field name, fields with a count as list
+        :raises struct.error: if the data is too short
+        """
+        values = self.unpack_from(data, offset)
+        result = {}
+        for name, start, stop, divisor, is_list in self._items:
+            if is_list:
+                result[name] = [value / divisor for value in values[start:stop]] if divisor is not None else list(values[start:stop])
+            else:
+                result[name] = values[start] / divisor if divisor is not None else values[start]
+        return result
@@ -0,0 +1,375 @@
+# -*- coding: utf-8 -*-
+from contextlib import contextmanager
+from struct import pack, unpack
+from time import monotonic
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Tuple, Union
+
+import ext.minimalmodbus as minimalmodbus
+import serial
+
+from utils import logger, serial_port_manager, LinkTiming
+
+
+MODBUS_REGISTERS_MAX: int = 125
+"""
+Maximum number of registers of one function 3/4 request, as defined by the Modbus specification
+"""
+
+
+def registers_to_bytes(registers: List[int]) -> bytes:
+    """
+    Convert registers to bytes, as they were sent on the wire.
+
+    :param registers: Register values
+    :return: Big endian bytes of the registers
+    """
+    return pack(f">{len(registers)}H", *registers)
+
+
+def decode_int(registers: List[int], signed: bool = False) -> int:
+    """
+    Decode a 16 bit integer like `Instrument.read_register()`.
+
+    :param registers: Register values, only the first one is used
+    :param signed: Interpret the value as two's complement
+    :return: Value
+    """
+    value = registers[0]
+    return value - 0x10000 if signed and value & 0x8000 else value
+
+
+def decode_int_swapped(registers: List[int], signed: bool = False) -> int:
+    """
+    Decode a 16 bit integer, which the BMS sends with the low byte first.
+
+    :param registers: Register values, only the first one is used
+    :param signed: Interpret the value as two's complement
+    :return: Value
+    """
+    value = registers[0]
+    return decode_int([((value & 0xFF) << 8) | (value >> 8)], signed)
+
+
+def decode_long(registers: List[int], signed: bool = False, byteorder: int = minimalmodbus.BYTEORDER_BIG) -> int:
+    """
+    Decode a 32 bit integer like `Instrument.read_long()`.
+
+    :param registers: Register values, only the first two are used
+    :param signed: Interpret the value as two's complement
+    :param byteorder: One of the `minimalmodbus.BYTEORDER_*` constants
+    :return: Value
+    """
+    data = registers_to_bytes(registers[:2])
+    if byteorder in (minimalmodbus.BYTEORDER_BIG_SWAP, minimalmodbus.BYTEORDER_LITTLE_SWAP):
+        data = bytes((data[1], data[0], data[3], data[2]))
+    formatcode = ">" if byteorder in (minimalmodbus.BYTEORDER_BIG, minimalmodbus.BYTEORDER_BIG_SWAP) else "<"
+    return unpack(formatcode + ("l" if signed else "L"), data)[0]
+
+
+def decode_string(registers: List[int]) -> str:
+    """
+    Decode a string like `Instrument.read_string()`.
+
+    :param registers: Register values
+    :return: Text with two characters per register
+    """
+    return registers_to_bytes(registers).decode("latin1")
+
+
+class ModbusField:
+    """
+    One value of a register map, which can span several registers.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        address: int,
+        count: int = 1,
+        functioncode: int = 3,
+        decoder: Union[Callable[[List[int]], Any], None] = None,
+        array: bool = False,
+    ):
+        """
+        :param name: Key of the value in the result of `ModbusTransport.read()`
+        :param address: Address of the first register
+        :param count: Number of registers
+        :param functioncode: 3 for holding registers or 4 for input registers
+        :param decoder: Function to convert the registers to the value, if not set the first register
+            is returned for one register and the list of registers else
+        :param array: Always return the list of registers, also for one register, e.g. if the count is configurable
+        """
+        self.name = name
+        self.address = address
+        self.count = count
+        self.functioncode = functioncode
+        self.decoder = decoder
+        self.array = array
+
+    @property
+    def end(self) -> int:
+        return self.address + self.count
+
+    def decode(self, registers: List[int]) -> Any:
+        if self.decoder is not None:
+            return self.decoder(registers)
+        return registers[0] if self.count == 1 and not self.array else registers
+
+
+class ModbusBlock:
+    """
+    One block read request that covers one or more fields.
+    """
+
+    def __init__(self, functioncode: int, address: int, count: int, fields: List[ModbusField]):
+        self.functioncode = functioncode
+        self.address = address
+        self.count = count
+        self.fields = fields
+
+    def __repr__(self) -> str:
+        return f"ModbusBlock(fc={self.functioncode}, address={self.address}, count={self.count}, fields={len(self.fields)})"
+
+
+def plan_blocks(fields: Iterable[ModbusField], gap_max: int = 8, count_max: int = MODBUS_REGISTERS_MAX) -> List[ModbusBlock]:
+    """
+    Plan the minimal set of block reads for the fields.
+
+    Fields with the same function code are merged into one block, if they overlap, are adjacent or the gap
+    between them is not bigger than `gap_max` registers. Reading a few unused registers is much faster than
+    an additional request with its turnaround time.
+
+    :param fields: Fields to read
+    :param gap_max: Maximum number of unused registers between two fields in one block
+    :param count_max: Maximum number of registers per block
+    :return: Block requests, sorted by function code and address
+    """
+    blocks: List[ModbusBlock] = []
+
+    for field in sorted(fields, key=lambda field: (field.functioncode, field.address)):
+        if field.count > count_max:
+            raise ValueError(f"Field {field.name} with {field.count} registers does not fit into one request")
+
+        block = blocks[-1] if blocks else None
+        if (
+            block is not None
+            and block.functioncode == field.functioncode
+            and field.address - (block.address + block.count) <= gap_max
+            and max(field.end, block.address + block.count) - block.address <= count_max
+        ):
+            block.count = max(field.end, block.address + block.count) - block.address
+            block.fields.append(field)
+        else:
+            blocks.append(ModbusBlock(field.functioncode, field.address, field.count, [field]))
+
+    return blocks
+
+
+class ModbusInstrument(minimalmodbus.Instrument):
+    """
+    Instrument with a configurable broadcast address.
+
+    minimalmodbus always handles address 0 as broadcast, so it does not wait for a reply and refuses reads.
+    Some BMS use address 0 as normal slave address. The vendored module is not changed, so it can be updated as is.
+    """
+
+    def __init__(self, port: Any, slaveaddress: int, broadcast_address: Union[int, None] = minimalmodbus._SLAVEADDRESS_BROADCAST, **kwargs):
+        """
+        :param port: Serial port name or opened `serial.Serial`
+        :param slaveaddress: Modbus slave address
+        :param broadcast_address: Address for which no reply is expected, None if the BMS uses address 0
+            as normal slave address
+        """
+        super().__init__(port, slaveaddress, **kwargs)
+        self.broadcast_address = broadcast_address
+        self._unicast_address: Union[int, None] = None
+
+    def _generic_command(self, *args, **kwargs) -> Any:
+        if self.address != minimalmodbus._SLAVEADDRESS_BROADCAST or self.address == self.broadcast_address:
+            return super()._generic_command(*args, **kwargs)
+
+        # hide the address from the broadcast checks of minimalmodbus, `_perform_command()` sends it
+        self._unicast_address, self.address = self.address, None
+        try:
+            return super()._generic_command(*args, **kwargs)
+        finally:
+            self.address, self._unicast_address = self._unicast_address, None
+
+    def _perform_command(self, functioncode: int, payload_to_slave: bytes) -> bytes:
+        if self._unicast_address is None:
+            return super()._perform_command(functioncode, payload_to_slave)
+
+        # like `Instrument._perform_command()`, but the reply of the slave is read
+        request = minimalmodbus._embed_payload(self._unicast_address, self.mode, functioncode, payload_to_slave)
+        number_of_bytes_to_read = 1000
+        if self.precalculate_read_size:
+            try:
+                number_of_bytes_to_read = minimalmodbus._predict_response_size(self.mode, functioncode, payload_to_slave)
+            except Exception:
+                pass
+
+        response = self._communicate(request, number_of_bytes_to_read)
+        return minimalmodbus._extract_payload(response, self._unicast_address, self.mode, functioncode)
+
+
+class ModbusTransport:
+    """
+    Modbus RTU transport for one slave, that keeps the serial port open and reads register maps
+    with as few requests as possible.
+
+    The drivers declare the registers they need as `ModbusField` lists. The first `read()` of a list
+    plans the block requests (see `plan_blocks()`), later reads reuse the plan. If the BMS rejects a
+    block, because it contains registers that are not mapped, the block is split into one request per
+    field and the split plan is kept.
+
+    The serial handle comes from `serial_port_manager`, so it's shared with the other drivers on the
+    port and only reopened after an I/O error. All requests are sent while holding the transaction lock
+    of the port, so transports of several batteries on one bus can be used from different threads.
+    """
+
+    def __init__(
+        self,
+        port: str,
+        slaveaddress: int,
+        baudrate: int,
+        parity: str = serial.PARITY_NONE,
+        timeout: float = 0.4,
+        gap_max: int = 8,
+        link_timing: Union[LinkTiming, None] = None,
+        broadcast_address: Union[int, None] = minimalmodbus._SLAVEADDRESS_BROADCAST,
+    ):
+        """
+        :param port: Serial port
+        :param slaveaddress: Modbus slave address
+        :param baudrate: Baud rate
+        :param parity: Parity, one of the `serial.PARITY_*` constants
+        :param timeout: Reply timeout in seconds
+        :param gap_max: Maximum number of unused registers that are read to merge two fields into one request
+        :param link_timing: If set, the delay between two requests is learned with this timing model
+        :param broadcast_address: Address for which no reply is expected, None if the BMS uses address 0
+            as normal slave address
+        """
+        self.port = port
+        self.slaveaddress = slaveaddress
+        self.baudrate = baudrate
+        self.parity = parity
+        self.timeout = timeout
+        self.gap_max = gap_max
+        self.link_timing = link_timing
+        self.broadcast_address = broadcast_address
+        self.requests: int = 0
+        """
+        Number of requests sent, useful to compare the plans
+        """
+        self._plans: Dict[Tuple[int, ...], List[ModbusBlock]] = {}
+        self._instrument: Union[minimalmodbus.Instrument, None] = None
+
+    @contextmanager
+    def transaction(self) -> Iterator[minimalmodbus.Instrument]:
+        """
+        Get exclusive access to the port. The instrument on the shared serial handle can be used for requests,
+        which are not register reads (e.g. bits or writes).
+        The port settings are restored each time, since other drivers on the port can change them.
+
+        :return: Instrument for the slave
+        """
+        with serial_port_manager.transaction(self.port):
+            try:
+                ser = serial_port_manager.get(self.port, self.baudrate, self.timeout, parity=self.parity)
+
+                if self._instrument is None or self._instrument.serial is not ser:
+                    self._instrument = ModbusInstrument(
+                        ser, self.slaveaddress, self.broadcast_address, mode=minimalmodbus.MODE_RTU, close_port_after_each_call=False
+                    )
+
+                yield self._instrument
+
+            except minimalmodbus.ModbusException:
+                # the port is fine, ModbusException is a subclass of OSError too
+                raise
+
+            except OSError:
+                # serial.SerialException is a subclass of OSError, reopen the port on the next request
+                serial_port_manager.close(self.port)
+                self._instrument = None
+                raise
+
+    def get_plan(self, fields: List[ModbusField]) -> List[ModbusBlock]:
+        """
+        Get the block requests for a register map, plan them on the first call.
+
+        :param fields: Fields to read
+        :return: Block requests
+        """
+        key = tuple(id(field) for field in fields)
+        plan = self._plans.get(key)
+        if plan is None:
+            plan = self._plans[key] = plan_blocks(fields, self.gap_max)
+            logger.debug(f"Modbus plan for {len(fields)} fields on {self.port}({self.slaveaddress}): {plan}")
+        return plan
+
+    def read_block(self, instrument: minimalmodbus.Instrument, block: ModbusBlock) -> List[int]:
+        """
+        Send one block request.
+
+        :param instrument: Instrument of the current transaction
+        :param block: Block to read
+        :return: Register values
+        """
+        if self.link_timing is not None:
+            self.link_timing.wait()
+
+        start = monotonic()
+        try:
+            registers = instrument.read_registers(block.address, block.count, functioncode=block.functioncode)
+        except minimalmodbus.IllegalRequestError:
+            # the BMS replied, so the link is fine
+            if self.link_timing is not None:
+                self.link_timing.record(monotonic() - start)
+            raise
+        except minimalmodbus.ModbusException:
+            if self.link_timing is not None:
+                self.link_timing.record(None)
+            raise
+        finally:
+            self.requests += 1
+
+        if self.link_timing is not None:
+            self.link_timing.record(monotonic() - start)
+
+        return registers
+
+    def read(self, fields: List[ModbusField]) -> Dict[str, Any]:
+        """
+        Read all fields of a register map.
+        Pass the same list object on each call, so the plan is reused.
+
+        :param fields: Fields to read
+        :return: Decoded values by field name
+        :raises minimalmodbus.ModbusException: if a request failed
+        """
+        plan = self.get_plan(fields)
+        values: Dict[str, Any] = {}
+
+        with self.transaction() as instrument:
+            index = 0
+            while index < len(plan):
+                block = plan[index]
+                try:
+                    registers = self.read_block(instrument, block)
+                except minimalmodbus.IllegalRequestError:
+                    if len(block.fields) == 1:
+                        raise
+                    logger.info(
+                        f"Modbus block {block.address}-{block.address + block.count - 1} rejected by {self.port}({self.slaveaddress}), "
+                        + "reading the fields separately"
+                    )
+                    plan[index : index + 1] = [ModbusBlock(field.functioncode, field.address, field.count, [field]) for field in block.fields]
+                    continue
+
+                for field in block.fields:
+                    offset = field.address - block.address
+                    values[field.name] = field.decode(registers[offset : offset + field.count])
+                index += 1
+
+        return values
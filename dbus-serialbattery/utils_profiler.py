@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+import cProfile
+import os
+import sys
+import threading
+from collections import Counter
+from time import strftime
+from typing import Union
+
+from gi.repository import GLib as gobject
+
+from utils import logger, PROFILE_DURATION
+
+
+PROFILE_PATHS = ["/data/log", "/tmp"]
+"""
+Folders for the profiles, the first writable one is used
+"""
+
+
+class Profiler:
+    """
+    Time boxed profiling session of the running driver, started with SIGUSR1 or the dbus path `/Debug/Profile`.
+
+    The main loop is profiled with cProfile and all threads, also the `IoWorker` and the receiver threads,
+    are sampled by a separate thread. At the end a pstats file and the sampled stacks in the collapsed format
+    (for flamegraph.pl, speedscope, ...) are written. Nothing is hooked while no session is running.
+    """
+
+    SAMPLE_INTERVAL: float = 0.01
+    """
+    Interval in seconds, in which the stacks of all threads are sampled
+    """
+
+    def __init__(self):
+        self.running: bool = False
+        self._profile: Union[cProfile.Profile, None] = None
+        self._sampler: Union[threading.Thread, None] = None
+        self._stop_event = threading.Event()
+        self._stacks: Counter = Counter()
+        self._timer: Union[int, None] = None
+
+    def start(self, duration: float = PROFILE_DURATION) -> bool:
+        """
+        Start a session. It has to be called from the main loop thread, which is profiled with cProfile.
+
+        :param duration: Duration of the session in seconds
+        :return: True if the session was started, False if one is already running
+        """
+        if self.running:
+            logger.info("Profiling is already running")
+            return False
+
+        logger.info(f"Start profiling for {duration:.0f} seconds")
+        self.running = True
+        self._stacks = Counter()
+        self._stop_event.clear()
+
+        self._sampler = threading.Thread(target=self._sample, name="Profiler", daemon=True)
+        self._sampler.start()
+
+        self._profile = cProfile.Profile()
+        self._profile.enable()
+
+        self._timer = gobject.timeout_add(int(duration * 1000), self._end)
+        return True
+
+    def stop(self) -> None:
+        """
+        Stop the session and write the profiles.
+
+        :return: None
+        """
+        if not self.running:
+            return
+
+        self._profile.disable()
+        self._stop_event.set()
+        self._sampler.join()
+        if self._timer is not None:
+            gobject.source_remove(self._timer)
+            self._timer = None
+        self.running = False
+
+        self._write()
+        self._profile = None
+        self._sampler = None
+
+    def _end(self) -> bool:
+        self._timer = None
+        self.stop()
+        return False
+
+    def _sample(self) -> None:
+        """
+        Sample the stacks of all other threads until the session is stopped.
+
+        :return: None
+        """
+        own_id = threading.get_ident()
+        while not self._stop_event.wait(self.SAMPLE_INTERVAL):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+
+                self._stacks[";".join([names.get(thread_id, str(thread_id))] + stack[::-1])] += 1
+
+    def _write(self) -> None:
+        """
+        Write the pstats file of the main loop and the collapsed stacks of all threads.
+
+        :return: None
+        """
+        folder = next((path for path in PROFILE_PATHS if os.path.isdir(path) and os.access(path, os.W_OK)), None)
+        if folder is None:
+            logger.error("Could not write the profile, no writable folder found in: " + ", ".join(PROFILE_PATHS))
+            return
+
+        file_path = os.path.join(folder, f"dbus-serialbattery_profile_{strftime('%Y%m%d-%H%M%S')}_{os.getpid()}")
+        try:
+            self._profile.dump_stats(file_path + ".pstats")
+            with open(file_path + ".collapsed", "w") as file:
+                for stack, count in self._stacks.most_common():
+                    file.write(f"{stack} {count}\n")
+        except OSError as e:
+            logger.error(f"Could not write the profile {file_path}: {e}")
+            return
+
+        logger.info(f"Profile written to {file_path}.pstats and {file_path}.collapsed ({sum(self._stacks.values())} samples)")
+
+
+profiler = Profiler()
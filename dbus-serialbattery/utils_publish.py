@@ -0,0 +1,180 @@
+# -*- coding: utf-8 -*-
+from time import monotonic
+from typing import Any, Dict, List, Union
+
+from utils import logger
+
+PUBLISH_IMMEDIATELY = ["/Info/MaxCharge*", "/Info/MaxDischargeCurrent", "/Io/*", "/Alarms/*"]
+"""
+Paths that are always published immediately, also if a rule matches them, since the charge control depends on them.
+A path ending with `*` matches all paths starting with it
+"""
+
+
+class PublishRule:
+    """
+    Deadband and rate limits of the paths matching one pattern.
+    """
+
+    def __init__(self, pattern: str, absolute: float, relative: float, min_interval: float, max_interval: float):
+        """
+        :param pattern: Path or, if it ends with `*`, prefix of the paths
+        :param absolute: Change needed to publish a value, in the unit of the path
+        :param relative: Change needed to publish a value, as fraction of the last published value
+        :param min_interval: Seconds that have to pass, before a value is published again
+        :param max_interval: Seconds after which a value is published, also if it did not change enough, 0 to disable it
+        """
+        self.pattern = pattern
+        self.absolute = absolute
+        self.relative = relative
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+
+    @classmethod
+    def parse(cls, entry: str) -> "PublishRule":
+        """
+        Parse a rule of the config option `PUBLISH_FILTER`.
+
+        :param entry: Rule in the format `<path>:<absolute>:<relative>:<min interval>:<max interval>`
+        :return: The rule
+        :raises ValueError: If the rule is invalid
+        """
+        pattern, *values = [value.strip() for value in entry.split(":")]
+        if not pattern.startswith("/") or len(values) != 4:
+            raise ValueError(f"Invalid publish filter rule '{entry}', expected <path>:<absolute>:<relative>:<min interval>:<max interval>")
+
+        return cls(pattern, *[max(float(value), 0) for value in values])
+
+
+def matches(pattern: str, path: str) -> bool:
+    """
+    Check if a path matches a pattern.
+
+    :param pattern: Path or, if it ends with `*`, prefix of the paths
+    :param path: Path to check
+    :return: True if the path matches
+    """
+    return path.startswith(pattern[:-1]) if pattern.endswith("*") else path == pattern
+
+
+class PublishFilter:
+    """
+    Filters the values published to dbus, so values jittering in the last digit (e.g. the current, the power or
+    the cell voltages) do not send a signal to every subscriber each poll.
+
+    A value is published, if it changed more than the deadband of its rule since it was published last, but not
+    more often than every `min_interval` seconds. After `max_interval` seconds it's published in any case, so slow
+    drifts are shown. Values of paths without a rule, paths in `PUBLISH_IMMEDIATELY` and values that are not
+    numbers are always passed through.
+    """
+
+    def __init__(self, rules: List[PublishRule]):
+        """
+        :param rules: Rules of the paths to filter, the most specific matching rule is used
+        """
+        # an exact path is more specific than a prefix and a longer prefix more than a shorter one
+        self.rules: List[PublishRule] = sorted(rules, key=lambda rule: (not rule.pattern.endswith("*"), len(rule.pattern)), reverse=True)
+        self._rule_by_path: Dict[str, Union[PublishRule, None]] = {}
+        self._last_time: Dict[str, float] = {}
+        """
+        Monotonic time, when the value of each filtered path was published last
+        """
+        self.published: int = 0
+        self.suppressed: int = 0
+
+    def get_rule(self, path: str) -> Union[PublishRule, None]:
+        """
+        Get the rule of a path, the result is cached since the paths do not change.
+
+        :param path: Path to get the rule for
+        :return: The most specific matching rule or None, if the path is not filtered
+        """
+        if path not in self._rule_by_path:
+            if any(matches(pattern, path) for pattern in PUBLISH_IMMEDIATELY):
+                self._rule_by_path[path] = None
+            else:
+                self._rule_by_path[path] = next((rule for rule in self.rules if matches(rule.pattern, path)), None)
+
+        return self._rule_by_path[path]
+
+    def check(self, path: str, value: Any, published_value: Any, now: float) -> bool:
+        """
+        Check if a value should be published.
+
+        :param path: Path of the value
+        :param value: New value
+        :param published_value: Value currently published on the path
+        :param now: Monotonic time of the poll
+        :return: True if the value should be published
+        """
+        rule = self.get_rule(path)
+        if (
+            rule is None
+            or value == published_value
+            or isinstance(value, bool)
+            or not isinstance(value, (int, float))
+            or isinstance(published_value, bool)
+            or not isinstance(published_value, (int, float))
+        ):
+            return True
+
+        elapsed = now - self._last_time.get(path, 0)
+        if elapsed < rule.min_interval or (
+            abs(value - published_value) <= max(rule.absolute, rule.relative * abs(published_value)) and (rule.max_interval == 0 or elapsed < rule.max_interval)
+        ):
+            self.suppressed += 1
+            return False
+
+        self._last_time[path] = now
+        self.published += 1
+        return True
+
+    def get_statistics(self) -> Dict[str, int]:
+        """
+        Get the number of values of the filtered paths, that were published and suppressed.
+
+        :return: Dictionary with the statistics
+        """
+        return {"Published": self.published, "Suppressed": self.suppressed}
+
+
+class FilteredServiceContext:
+    """
+    Wraps the `ServiceContext` of a `VeDbusService` transaction and only sets the values passing the filter.
+    """
+
+    def __init__(self, context: Any, publish_filter: PublishFilter):
+        """
+        :param context: Context returned by `with VeDbusService`
+        :param publish_filter: Filter to apply
+        """
+        self.context = context
+        self.publish_filter = publish_filter
+        self.now: float = monotonic()
+
+    def __contains__(self, path: str) -> bool:
+        return path in self.context
+
+    def __getitem__(self, path: str) -> Any:
+        return self.context[path]
+
+    def __setitem__(self, path: str, value: Any) -> None:
+        if self.publish_filter.check(path, value, self.context[path], self.now):
+            self.context[path] = value
+
+
+def get_publish_filter(entries: List[str]) -> Union[PublishFilter, None]:
+    """
+    Create the publish filter of the config option `PUBLISH_FILTER`.
+
+    :param entries: Rules of the config option
+    :return: The filter or None, if there are no valid rules
+    """
+    rules = []
+    for entry in entries:
+        try:
+            rules.append(PublishRule.parse(entry))
+        except ValueError as e:
+            logger.error(str(e))
+
+    return PublishFilter(rules) if rules else None
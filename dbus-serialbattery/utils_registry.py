@@ -0,0 +1,235 @@
+# -*- coding: utf-8 -*-
+import importlib
+from time import perf_counter
+from typing import Dict, List, Union
+
+from utils import logger
+
+TRANSPORT_SERIAL: str = "serial"
+TRANSPORT_CAN: str = "can"
+TRANSPORT_BLE: str = "ble"
+
+
+def get_rss() -> Union[int, None]:
+    """
+    Get the memory used by the driver process.
+
+    :return: Resident set size in kB, None if it's not available (not Linux)
+    """
+    try:
+        with open("/proc/self/status", "r") as file:
+            for line in file:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])
+    except (OSError, ValueError, IndexError):
+        pass
+
+    return None
+
+
+class BmsDriver:
+    """
+    Entry of the driver registry.
+
+    It holds everything that is needed to plan the detection (baud rate, default addresses, transport and the
+    signature of the frames), so the driver module is only imported, if the BMS type is actually tested or
+    configured. Each driver process on a GX device serves one port, so it only pays the import time and
+    memory of the drivers it needs.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        module: str,
+        transport: str = TRANSPORT_SERIAL,
+        baud: Union[int, None] = None,
+        addresses: Union[List[bytes], None] = None,
+        sniff_pattern: Union[bytes, None] = None,
+        default: bool = True,
+    ):
+        """
+        :param name: Name of the driver class, as used in `BMS_TYPE`
+        :param module: Module of the driver class
+        :param transport: `TRANSPORT_SERIAL`, `TRANSPORT_CAN` or `TRANSPORT_BLE`
+        :param baud: Baud rate of a serial BMS
+        :param addresses: Default addresses, each address is tested, if no address is configured
+        :param sniff_pattern: Regular expression for the requests or replies of this BMS type on a serial bus,
+            so it's recognized by listening on the port before it's tested, see `utils_detection.sniff_serial()`
+        :param default: False if the driver is only tested, if it's set in `BMS_TYPE`
+        """
+        self.name = name
+        self.module = module
+        self.transport = transport
+        self.baud = baud
+        self.addresses = addresses
+        self.sniff_pattern = sniff_pattern
+        self.default = default
+        self._cls: Union[type, None] = None
+
+    @property
+    def loaded(self) -> bool:
+        return self._cls is not None
+
+    def load(self) -> type:
+        """
+        Import the driver module once.
+
+        :return: Driver class, a subclass of `Battery`
+        :raises ImportError: if the module or a module it needs is not available
+        """
+        if self._cls is None:
+            rss_before = get_rss()
+            time_start = perf_counter()
+            self._cls = getattr(importlib.import_module(self.module), self.name)
+            duration = perf_counter() - time_start
+            rss_after = get_rss()
+
+            import_statistics.append((self.name, duration, (rss_after - rss_before) if rss_before is not None and rss_after is not None else None))
+            logger.debug(
+                f"Imported driver {self.name} in {duration * 1000:.1f} ms"
+                + (f", memory +{rss_after - rss_before} kB" if rss_before is not None and rss_after is not None else "")
+            )
+
+        return self._cls
+
+
+DRIVERS: List[BmsDriver] = [
+    # serial
+    BmsDriver(
+        "Daly",
+        "bms.daly",
+        baud=9600,
+        addresses=[b"\x40", b"\x80"],
+        # start byte, address of the host or the BMS, command and data length
+        sniff_pattern=rb"\xa5[\x01\x40\x80][\x50-\x5f\x90-\x98\xd9\xda]\x08",
+    ),
+    BmsDriver(
+        "Daren485",
+        "bms.daren_485",
+        baud=19200,
+        addresses=[b"\x01"],
+        # start of frame, protocol version 2.2, address and CID1
+        sniff_pattern=rb"~22[0-9A-F]{2}4A",
+    ),
+    BmsDriver("Ecs", "bms.ecs", baud=19200),
+    BmsDriver("EG4_Lifepower", "bms.eg4_lifepower", baud=9600, addresses=[b"\x01"]),
+    BmsDriver("EG4_LL", "bms.eg4_ll", baud=9600, addresses=[b"\x01"]),
+    BmsDriver("Felicity", "bms.felicity", baud=9600, addresses=[b"\x01"]),
+    BmsDriver("HeltecModbus", "bms.heltecmodbus", baud=9600, addresses=[b"\x01"]),
+    BmsDriver("HLPdataBMS4S", "bms.hlpdatabms4s", baud=9600),
+    BmsDriver(
+        "Jkbms",
+        "bms.jkbms",
+        baud=115200,
+        # start bytes "NW", length and the terminal number
+        sniff_pattern=rb"NW[\x00\x01].\x00\x00\x00\x00",
+    ),
+    BmsDriver(
+        "Jkbms_pb",
+        "bms.jkbms_pb",
+        baud=115200,
+        addresses=[b"\x01"],
+        # reply frame of a BMS or the request of a master BMS polling its slaves
+        sniff_pattern=rb"\x55\xaa\xeb\x90[\x01-\x03]|[\x00-\x0f]\x10\x16[\x1c\x1e\x20]\x00\x01\x02\x00\x00",
+    ),
+    BmsDriver(
+        "LltJbd",
+        "bms.lltjbd",
+        baud=9600,
+        addresses=[b"\x00"],
+        # start byte with a read request or the reply to it
+        sniff_pattern=rb"\xdd(?:\xa5[\x03-\x05]\x00|[\x03-\x05]\x00)",
+    ),
+    BmsDriver(
+        "Pace",
+        "bms.pace",
+        baud=9600,
+        addresses=[b"\x00"],
+        # start of frame, protocol version 2.5, address and CID1 of a battery
+        sniff_pattern=rb"~25[0-9A-F]{2}46",
+    ),
+    BmsDriver("Renogy", "bms.renogy", baud=9600, addresses=[b"\x30", b"\xf7"]),
+    BmsDriver(
+        "Seplos",
+        "bms.seplos",
+        baud=19200,
+        addresses=[b"\x00"],
+        # start of frame, protocol version 2.0, address and CID1 of a battery
+        sniff_pattern=rb"~20[0-9A-F]{2}46",
+    ),
+    BmsDriver("Seplosv3", "bms.seplosv3", baud=19200),
+    # serial, enabled only if explicitly set in config under "BMS_TYPE"
+    BmsDriver("ANT", "bms.ant", baud=19200, default=False),
+    BmsDriver("MNB", "bms.mnb", baud=9600, default=False),
+    BmsDriver("Sinowealth", "bms.sinowealth", baud=9600, default=False),
+    # CAN
+    BmsDriver("Daly_Can", "bms.daly_can", transport=TRANSPORT_CAN),
+    BmsDriver("Jkbms_Can", "bms.jkbms_can", transport=TRANSPORT_CAN),
+    BmsDriver("Ubms_Can", "bms.ubms_can", transport=TRANSPORT_CAN),
+    # Bluetooth
+    BmsDriver("Jkbms_Ble", "bms.jkbms_ble", transport=TRANSPORT_BLE),
+    BmsDriver("Kilovault_Ble", "bms.kilovault_ble", transport=TRANSPORT_BLE),
+    BmsDriver("LiTime_Ble", "bms.litime_ble", transport=TRANSPORT_BLE),
+    BmsDriver("LltJbd_Ble", "bms.lltjbd_ble", transport=TRANSPORT_BLE),
+]
+"""
+All drivers, the serial drivers are tested in this order, if there are no statistics of the `ProbePlanner`
+"""
+
+DRIVERS_BY_NAME: Dict[str, BmsDriver] = {driver.name: driver for driver in DRIVERS}
+
+import_statistics: List[tuple] = []
+"""
+Name, import time in seconds and memory increase in kB of each imported driver
+"""
+
+
+def get_driver(name: str, transport: Union[str, None] = None) -> Union[BmsDriver, None]:
+    """
+    :param name: Name of the driver class
+    :param transport: Only return the driver, if it uses this transport
+    :return: Registry entry or None, if there is no such driver
+    """
+    driver = DRIVERS_BY_NAME.get(name)
+    if driver is None or (transport is not None and driver.transport != transport):
+        return None
+    return driver
+
+
+def get_bms_types(transport: str, enabled: List[str]) -> List[dict]:
+    """
+    Get the BMS types to test on a port, one entry per default address. Nothing is imported.
+
+    :param transport: `TRANSPORT_SERIAL`, `TRANSPORT_CAN` or `TRANSPORT_BLE`
+    :param enabled: Names from `BMS_TYPE`, drivers which are not tested by default are added, if they are listed
+    :return: Entries with the driver (`bms`), `baud` and `address`, like `supported_bms_types` in `dbus-serialbattery.py`
+    """
+    bms_types = []
+    for driver in DRIVERS:
+        if driver.transport != transport or (not driver.default and driver.name not in enabled):
+            continue
+
+        for address in driver.addresses or [None]:
+            bms_type = {"bms": driver}
+            if driver.baud is not None:
+                bms_type["baud"] = driver.baud
+            if address is not None:
+                bms_type["address"] = address
+            bms_types.append(bms_type)
+
+    return bms_types
+
+
+def log_import_statistics(rss_start: Union[int, None] = None) -> None:
+    """
+    Log how many drivers were imported and how much time and memory it took.
+
+    :param rss_start: Resident set size in kB before the first driver was imported
+    """
+    duration = sum(statistic[1] for statistic in import_statistics)
+    rss = get_rss()
+    logger.info(
+        f"Imported {len(import_statistics)} of {len(DRIVERS)} drivers in {duration * 1000:.0f} ms"
+        + (f": {', '.join(statistic[0] for statistic in import_statistics)}" if import_statistics else "")
+        + (f" | memory {rss_start} kB before, {rss} kB after" if rss_start is not None and rss is not None else "")
+    )
@@ -0,0 +1,109 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""
+BMS driver benchmark
+--------------------
+Runs the real drivers in `bms/*.py` against the simulated BMS of the `bms_simulator` package and measures
+how long `test_connection()` and `refresh_data()` take. No hardware is needed.
+
+Requirements:
+- pyserial
+
+Usage:
+- python benchmark_bms_drivers.py [--cycles 20] [--latency 5] [--noise 0.05] [--drop 0.001] [bms_type ...]
+"""
+import argparse
+import importlib
+import logging
+import os
+import sys
+from time import perf_counter
+
+sys.path.insert(1, os.path.join(os.path.dirname(__file__), "../dbus-serialbattery"))
+
+import utils  # noqa: E402
+from bms_simulator import SIMULATORS, LinkFaults, create_device  # noqa: E402
+
+
+# driver module and class per battery type
+DRIVERS = {
+    "Daly": ("bms.daly", "Daly"),
+    "Daren485": ("bms.daren_485", "Daren485"),
+    "EG4_LL": ("bms.eg4_ll", "EG4_LL"),
+    "Felicity": ("bms.felicity", "Felicity"),
+    "HeltecModbus": ("bms.heltecmodbus", "HeltecModbus"),
+    "Jkbms": ("bms.jkbms", "Jkbms"),
+    "Jkbms_pb": ("bms.jkbms_pb", "Jkbms_pb"),
+    "LltJbd": ("bms.lltjbd", "LltJbd"),
+    "Pace": ("bms.pace", "Pace"),
+    "Renogy": ("bms.renogy", "Renogy"),
+    "Seplos": ("bms.seplos", "Seplos"),
+}
+
+
+def run(bms_type: str, cycles: int, faults: LinkFaults, seed: int) -> None:
+    module, name = DRIVERS[bms_type]
+    driver = getattr(importlib.import_module(module), name)
+    simulator = SIMULATORS[bms_type]
+
+    with create_device(bms_type, faults=faults, seed=seed) as device:
+        battery = driver(device.port, simulator.BAUD, simulator.ADDRESS)
+
+        start = perf_counter()
+        connected = battery.test_connection()
+        connect_time = perf_counter() - start
+
+        failed = 0
+        refresh_time = 0.0
+        if connected:
+            for _ in range(cycles):
+                start = perf_counter()
+                try:
+                    if not battery.refresh_data():
+                        failed += 1
+                except Exception:
+                    # corrupted replies can raise in the drivers, the main loop of the driver handles them the same way
+                    failed += 1
+                refresh_time += perf_counter() - start
+
+        statistics = device.get_statistics()
+
+    if not connected:
+        print(f"{bms_type:<12} connection failed | {statistics}")
+        return
+
+    print(
+        f"{bms_type:<12} connect: {connect_time * 1000:7.1f} ms | refresh: {refresh_time / cycles * 1000:7.1f} ms/cycle"
+        + f" | failed: {failed}/{cycles} | requests: {statistics['requests']} | V: {battery.voltage:.2f} | I: {battery.current:.2f}"
+        + f" | SoC: {battery.soc:.1f} | cells: {battery.cell_count}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the BMS drivers against the simulated BMS.")
+    parser.add_argument("bms_types", nargs="*", help=f"battery types to benchmark: {', '.join(sorted(DRIVERS))} (default: all)")
+    parser.add_argument("--cycles", type=int, default=20, help="number of refresh_data() calls (default: 20)")
+    parser.add_argument("--latency", type=float, default=0.0, help="reply latency in ms (default: 0)")
+    parser.add_argument("--jitter", type=float, default=0.0, help="random additional reply latency in ms (default: 0)")
+    parser.add_argument("--noise", type=float, default=0.0, help="probability of noise bytes before a reply (default: 0)")
+    parser.add_argument("--drop", type=float, default=0.0, help="probability that a reply byte is lost (default: 0)")
+    parser.add_argument("--seed", type=int, default=1, help="seed for the random values (default: 1)")
+    parser.add_argument("--verbose", action="store_true", help="show the log output of the drivers")
+    args = parser.parse_args()
+
+    if not args.verbose:
+        utils.logger.setLevel(logging.CRITICAL)
+
+    faults = LinkFaults(latency=args.latency / 1000, jitter=args.jitter / 1000, noise=args.noise, drop=args.drop)
+
+    unknown = [bms_type for bms_type in args.bms_types if bms_type not in DRIVERS]
+    if unknown:
+        parser.error(f"unknown battery type(s): {', '.join(unknown)}")
+
+    for bms_type in args.bms_types or sorted(DRIVERS):
+        run(bms_type, args.cycles, faults, args.seed)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""
+Checksum benchmark
+------------------
+Compares the table based and cached checksums of `utils_checksum` with the byte by byte implementations,
+which the drivers used before. It also verifies that both return the same values.
+
+Requirements:
+- no additional Python modules
+
+Usage:
+- python benchmark_checksums.py [--number 20000]
+"""
+import argparse
+import os
+import random
+import struct
+import sys
+from timeit import timeit
+
+sys.path.insert(1, os.path.join(os.path.dirname(__file__), "../dbus-serialbattery"))
+
+import utils_checksum  # noqa: E402
+
+
+def legacy_crc16_modbus(data):
+    # previously in Renogy.calc_crc, Felicity.calc_crc and Jkbms_pb.modbusCrc
+    crc = 0xFFFF
+    for pos in data:
+        crc ^= pos
+        for i in range(8):
+            if (crc & 1) != 0:
+                crc >>= 1
+                crc ^= 0xA001
+            else:
+                crc >>= 1
+    return struct.pack("<H", crc)
+
+
+def legacy_generate_command(address, command_read, command):
+    # previously in Renogy.generate_command and Felicity.generate_command
+    buffer = bytearray(address)
+    buffer += command_read
+    buffer += command
+    buffer += legacy_crc16_modbus(buffer)
+    return buffer
+
+
+def legacy_seplos_checksum(frame):
+    # previously in Seplos.get_checksum
+    checksum = 0
+    for b in frame:
+        checksum += b
+    checksum %= 0xFFFF
+    checksum ^= 0xFFFF
+    checksum += 1
+    return checksum
+
+
+def legacy_pace_checksum(data):
+    # previously in Pace.read_serial_data_pace
+    cal_chk = 0
+    for i in range(1, len(data) - 5):
+        cal_chk += data[i]
+    return 0xFFFF - cal_chk % 65536 + 1
+
+
+def legacy_jkbms_ble_crc(arr, length):
+    # previously in Jkbms_Brn.crc
+    crc = 0
+    for a in arr[:length]:
+        crc = crc + a
+    return crc.to_bytes(2, "little")[0]
+
+
+def new_generate_command(address, command_read, command):
+    return utils_checksum.crc16_modbus_frame(bytes(address) + command_read + command)
+
+
+def compare(name, legacy, new, args, number):
+    """
+    Check that both functions return the same value and print the time per call.
+    """
+    expected, result = legacy(*args), new(*args)
+    if expected != result:
+        print(f"{name:<32} MISMATCH: {expected!r} != {result!r}")
+        return
+
+    time_legacy = timeit(lambda: legacy(*args), number=number) / number * 1e6
+    time_new = timeit(lambda: new(*args), number=number) / number * 1e6
+    print(f"{name:<32} legacy: {time_legacy:8.2f} us | new: {time_new:8.2f} us | speedup: {time_legacy / time_new:6.1f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the checksum implementations.")
+    parser.add_argument("--number", type=int, default=20000, help="number of calls per implementation (default: 20000)")
+    args = parser.parse_args()
+
+    rng = random.Random(1)
+    modbus_reply = bytes(rng.randrange(256) for _ in range(5 + 2 * 125))
+    ascii_frame = b"~" + "".join(rng.choice("0123456789ABCDEF") for _ in range(150)).encode() + b"0000\r"
+    ble_frame = bytearray(rng.randrange(256) for _ in range(300))
+
+    compare("CRC16-Modbus 8 bytes", legacy_crc16_modbus, utils_checksum.crc16_modbus_bytes, (modbus_reply[:6],), args.number)
+    compare("CRC16-Modbus 255 bytes", legacy_crc16_modbus, utils_checksum.crc16_modbus_bytes, (modbus_reply,), args.number)
+    compare("Modbus command (cached)", legacy_generate_command, new_generate_command, (b"\x30", b"\x03", b"\x13\x88\x00\x11"), args.number)
+    compare("Seplos checksum 150 chars", legacy_seplos_checksum, utils_checksum.sum16_complement, (ascii_frame[1:-5],), args.number)
+    compare(
+        "Pace checksum 150 chars",
+        legacy_pace_checksum,
+        lambda data: utils_checksum.sum16_complement(memoryview(data)[1:-5]),
+        (ascii_frame,),
+        args.number,
+    )
+    compare("JKBMS BLE sum 300 bytes", legacy_jkbms_ble_crc, lambda arr, length: utils_checksum.sum8(arr[:length]), (ble_frame, 299), args.number)
+
+
+if __name__ == "__main__":
+    main()
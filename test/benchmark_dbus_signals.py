@@ -0,0 +1,100 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""
+D-Bus signal benchmark
+----------------------
+Counts the signals a running driver sends on the system bus and the CPU usage of the `dbus-daemon` meanwhile.
+Run it once with the previous version of the driver and once with the current one to compare them.
+
+Each value sent with `PropertiesChanged` is one signal, which the `dbus-daemon` routes to every subscriber,
+like systemcalc, the GUI and VRM. With `ItemsChanged` all values changed in a cycle are sent in one signal.
+
+Requirements:
+- Venus OS or another Linux with D-Bus, `dbus-monitor` and a running driver
+- root, else `dbus-monitor` is not allowed to watch the system bus
+
+Usage:
+- python benchmark_dbus_signals.py [--service com.victronenergy.battery.ttyUSB0] [--duration 60]
+"""
+
+import argparse
+import os
+import subprocess
+import time
+from collections import Counter
+
+
+def get_cpu_time(pid):
+    """
+    Get the user and system time of a process in seconds.
+    """
+    with open(f"/proc/{pid}/stat", "r") as file:
+        # the process name can contain spaces, the fields after it are separated by spaces
+        fields = file.read().rpartition(")")[2].split()
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+
+def get_dbus_daemon_pids():
+    """
+    Get the process ids of all running `dbus-daemon` processes.
+    """
+    output = subprocess.run(["pidof", "dbus-daemon"], capture_output=True, text=True).stdout
+    return [int(pid) for pid in output.split()]
+
+
+def count_signals(lines):
+    """
+    Count the signals and the changed paths in the output of `dbus-monitor`.
+
+    :return: Number of signals by member and number of changed paths
+    """
+    signals = Counter()
+    paths = 0
+    dict_entry = False
+    for line in lines:
+        if line.startswith("signal "):
+            member = line.rpartition("member=")[2].strip()
+            signals[member] += 1
+            if member == "PropertiesChanged":
+                paths += 1
+        # the paths of an ItemsChanged signal are the keys of the outer dict
+        elif dict_entry and line.strip().startswith('string "/'):
+            paths += 1
+        dict_entry = line.strip() == "dict entry("
+
+    return signals, paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Count the D-Bus signals of the driver and the CPU usage of the dbus-daemon.")
+    parser.add_argument("--service", default="com.victronenergy.battery.ttyUSB0", help="D-Bus service of the driver (default: %(default)s)")
+    parser.add_argument("--duration", type=float, default=60, help="time in s to measure (default: 60)")
+    args = parser.parse_args()
+
+    pids = get_dbus_daemon_pids()
+    monitor = subprocess.Popen(
+        ["dbus-monitor", "--system", f"type='signal',sender='{args.service}'"],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+        text=True,
+    )
+    try:
+        # the first signal is NameAcquired of the monitor itself, wait until it's connected
+        time.sleep(1)
+        cpu_start = sum(get_cpu_time(pid) for pid in pids)
+        time.sleep(args.duration)
+        cpu = sum(get_cpu_time(pid) for pid in pids) - cpu_start
+    finally:
+        monitor.terminate()
+    signals, paths = count_signals(monitor.communicate()[0].splitlines())
+
+    for member, count in signals.most_common():
+        if member != "NameAcquired":
+            print(f"{member:<24} {count:7d} signals | {count / args.duration:7.1f} /s")
+    print(f"{'changed paths':<24} {paths:7d}         | {paths / args.duration:7.1f} /s")
+    print(f"{'dbus-daemon CPU':<24} {cpu / args.duration * 100:7.1f} %")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""
+Driver import benchmark
+-----------------------
+Compares the startup cost of importing all serial drivers, like `dbus-serialbattery.py` did before,
+with the driver registry of `utils_registry`, which only imports the drivers that are tested.
+Each variant runs in a new Python process, so the modules are not cached.
+
+Requirements:
+- Linux, the memory is read from `/proc/self/status`
+- the Python modules the serial drivers need
+
+Usage:
+- python benchmark_driver_imports.py [--driver Daly] [--runs 5]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+DRIVER_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "../dbus-serialbattery")
+
+# runs in a new process, prints the import time in seconds and the memory in kB before and after
+SCRIPT = """
+import json, sys
+from time import perf_counter
+sys.path.insert(1, {folder!r})
+import battery, utils  # shared by all drivers, imported at startup anyway
+from utils_registry import get_bms_types, get_rss, TRANSPORT_SERIAL
+rss_before = get_rss()
+time_start = perf_counter()
+for bms_type in get_bms_types(TRANSPORT_SERIAL, []):
+    if {driver!r} is None or bms_type["bms"].name == {driver!r}:
+        bms_type["bms"].load()
+print(json.dumps([perf_counter() - time_start, rss_before, get_rss()]))
+"""
+
+
+def measure(driver, runs):
+    """
+    Import the drivers in new processes and return the median import time and memory increase.
+    """
+    results = []
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, "-c", SCRIPT.format(folder=DRIVER_FOLDER, driver=driver)],
+            cwd=DRIVER_FOLDER,
+            check=True,
+            capture_output=True,
+            text=True,
+        ).stdout
+        duration, rss_before, rss_after = json.loads(output.strip().splitlines()[-1])
+        results.append((duration, rss_after - rss_before))
+
+    results.sort()
+    return results[len(results) // 2]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the import of the drivers.")
+    parser.add_argument("--driver", default="Daly", help="driver that is imported by the registry (default: Daly)")
+    parser.add_argument("--runs", type=int, default=5, help="number of processes per variant (default: 5)")
+    args = parser.parse_args()
+
+    for name, driver in (("all serial drivers", None), (f"registry, only {args.driver}", args.driver)):
+        duration, rss = measure(driver, args.runs)
+        print(f"{name:<28} import: {duration * 1000:7.1f} ms | memory: +{rss:6d} kB")
+
+
+if __name__ == "__main__":
+    main()
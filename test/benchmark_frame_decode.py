@@ -0,0 +1,237 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""
+Frame decode benchmark
+----------------------
+Compares the precompiled frame layouts of `utils_layout` with the per value decoding, which the drivers
+used before (`unpack_from()` for the binary and `int(..., 16)` for the ASCII hex protocols). It also verifies
+that both return the same values.
+
+Requirements:
+- no additional Python modules
+- bleak, to benchmark the JKBMS BLE layouts
+
+Usage:
+- python benchmark_frame_decode.py [--number 20000]
+"""
+import argparse
+import os
+import random
+import sys
+from struct import calcsize, unpack_from
+from timeit import timeit
+
+sys.path.insert(1, os.path.join(os.path.dirname(__file__), "../dbus-serialbattery"))
+
+from bms.daren_485 import Daren485, REALTIME_DATA_LAYOUT  # noqa: E402
+from bms.jkbms_pb import SETTINGS_LAYOUT, STATUS_LAYOUT  # noqa: E402
+from bms.pace import Pace  # noqa: E402
+from bms.seplos import Seplos, STATUS_LAYOUT as SEPLOS_STATUS_LAYOUT  # noqa: E402
+from bms_simulator.daren_485 import Daren485Simulator  # noqa: E402
+from bms_simulator.jkbms_pb import JkbmsPbSimulator  # noqa: E402
+from bms_simulator.model import BatteryModel  # noqa: E402
+from bms_simulator.pace import PaceSimulator  # noqa: E402
+from bms_simulator.seplos import SeplosSimulator  # noqa: E402
+from utils_layout import hex_to_bytes  # noqa: E402
+
+
+def legacy_jkbms_pb_status(status_data, cell_count):
+    # previously in Jkbms_pb.read_status_data
+    return {
+        "cell_voltages": [unpack_from("<H", status_data, c * 2 + 6)[0] / 1000 for c in range(cell_count)],
+        "temperature_mos": unpack_from("<h", status_data, 144)[0] / 10,
+        "temperature_1": unpack_from("<h", status_data, 162)[0] / 10,
+        "temperature_2": unpack_from("<h", status_data, 164)[0] / 10,
+        "temperature_3": unpack_from("<h", status_data, 256)[0] / 10,
+        "temperature_4": unpack_from("<h", status_data, 258)[0] / 10,
+        "temperature_sensors": unpack_from("<B", status_data, 214)[0],
+        "voltage": unpack_from("<I", status_data, 150)[0] / 1000,
+        "current": unpack_from("<i", status_data, 158)[0] / 1000,
+        "soc": unpack_from("<B", status_data, 173)[0],
+        "charge_cycles": unpack_from("<i", status_data, 182)[0],
+        "capacity_remain": unpack_from("<i", status_data, 174)[0] / 1000,
+        "protection": unpack_from("<I", status_data, 166)[0],
+        "balancing": unpack_from("<B", status_data, 172)[0],
+        "charge": unpack_from("<B", status_data, 198)[0],
+        "discharge": unpack_from("<B", status_data, 199)[0],
+    }
+
+
+def new_jkbms_pb_status(status_data, cell_count):
+    status = STATUS_LAYOUT.decode(status_data)
+    status["cell_voltages"] = status["cell_voltages"][:cell_count]
+    return status
+
+
+def legacy_jkbms_pb_settings(status_data):
+    # previously in Jkbms_pb.get_settings, the same for all fields
+    return {field.name: unpack_from("<" + field.fmt, status_data, field.offset)[0] / (field.divisor or 1) for field in SETTINGS_LAYOUT.fields}
+
+
+def legacy_seplos_status(data):
+    # previously in Seplos.decode_status_data
+    cell_count = Seplos.int_from_1byte_hex_ascii(data=data, offset=4)
+    return {
+        "cell_count": cell_count,
+        "cell_voltages": [Seplos.int_from_2byte_hex_ascii(data, 6 + i * 4) / 1000 for i in range(cell_count)],
+        "temperatures": [Seplos.int_from_2byte_hex_ascii(data, 72 + i * 4) for i in range(6)],
+        "current": Seplos.int_from_2byte_hex_ascii(data, offset=96, signed=True) / 100,
+        "voltage": Seplos.int_from_2byte_hex_ascii(data, offset=100) / 100,
+        "capacity_remain": Seplos.int_from_2byte_hex_ascii(data, offset=104) / 100,
+        "capacity": Seplos.int_from_2byte_hex_ascii(data, offset=110) / 100,
+        "soc": Seplos.int_from_2byte_hex_ascii(data, offset=114) / 10,
+        "charge_cycles": Seplos.int_from_2byte_hex_ascii(data, offset=122),
+    }
+
+
+def new_seplos_status(data):
+    status = SEPLOS_STATUS_LAYOUT.decode(hex_to_bytes(data))
+    status["cell_voltages"] = status["cell_voltages"][: status["cell_count"]]
+    return status
+
+
+def legacy_pace_status(status_data):
+    # previously in Pace.read_status_data
+    cell_count = int(status_data[17:19], 16)
+    temperature_sensor_count = int(status_data[83:85], 16)
+    return {
+        "cell_count": cell_count,
+        "cell_voltages": [int(status_data[19 + i * 4 : 19 + i * 4 + 4], 16) / 1000 for i in range(cell_count)],
+        "temperature_sensor_count": temperature_sensor_count,
+        "temperatures": [int(status_data[85 + i * 4 : 85 + i * 4 + 4], 16) for i in range(temperature_sensor_count)],
+        "voltage": int(status_data[113:117], 16) / 1000,
+        "cycles": int(status_data[127:131], 16),
+        "capacity_remain": int(status_data[117:121], 16) / 100,
+        "capacity": int(status_data[123:127], 16) / 100,
+    }
+
+
+def new_pace_status(status_data):
+    status = Pace.decode_status_data(status_data)
+    status["cell_voltages"] = status["cell_voltages"][: status["cell_count"]]
+    status["temperatures"] = status["temperatures"][: status["temperature_sensor_count"]]
+    return status
+
+
+def legacy_daren_realtime_data(payload):
+    # previously in Daren485.get_realtime_data
+    return {
+        "soc": int(payload[2:6], base=16) / 100,
+        "voltage": int(payload[6:10], base=16) / 100,
+        "current": unpack_from(">h", bytes.fromhex(payload[106:110]))[0] / 100,
+        "temperature_mos": unpack_from(">h", bytes.fromhex(payload[84:88]))[0] / 10,
+        "temperatures": [unpack_from(">h", bytes.fromhex(payload[90 + i * 4 : 94 + i * 4]))[0] / 10 for i in range(4)],
+        "capacity": int(payload[120:124], base=16) / 100,
+        "capacity_remain": int(payload[124:128], base=16) / 100,
+        "charge_cycles": int(payload[128:132], base=16),
+        "fet_status": int(payload[148:152], base=16),
+        "voltage_status": int(payload[132:136], base=16),
+        "current_status": int(payload[136:140], base=16),
+        "temperature_status": int(payload[140:144], base=16),
+        "warning_status": int(payload[144:148], base=16),
+        "cell_voltages": [int(payload[(i - 1) * 4 + 12 : i * 4 + 12], base=16) / 1000 for i in range(1, 17)],
+    }
+
+
+def new_daren_realtime_data(payload):
+    return REALTIME_DATA_LAYOUT.decode(hex_to_bytes(payload[: REALTIME_DATA_LAYOUT.size * 2]))
+
+
+def legacy_translate(fb, translation, o, f32s=False, i=0):
+    # previously in Jkbms_Brn.translate
+    if i == len(translation[0]) - 1:
+        keys = range(0, translation[0][i]) if isinstance(translation[0][i], int) else [translation[0][i]]
+        offset = 0
+        if f32s:
+            if translation[1] >= 112:
+                offset = 32
+            elif translation[1] >= 54:
+                offset = 16
+        i = 0
+        for j in keys:
+            val = unpack_from(translation[2], bytearray(fb), translation[1] + i + offset)[0]
+            i = i + calcsize(translation[2])
+            if isinstance(val, int) and len(translation) == 4:
+                val = val * translation[3]
+            o[j] = val
+    else:
+        if translation[0][i] not in o:
+            if len(translation[0]) == i + 2 and isinstance(translation[0][i + 1], int):
+                o[translation[0][i]] = [None] * translation[0][i + 1]
+            else:
+                o[translation[0][i]] = {}
+        legacy_translate(fb, translation, o[translation[0][i]], f32s=f32s, i=i + 1)
+
+
+def legacy_jkbms_ble_cell_info(fb, cell_count):
+    # previously Jkbms_Brn.decode_cellinfo_jk02 with TRANSLATE_CELL_INFO_24S
+    from bms.jkbms_brn import FIELDS_CELL_INFO
+
+    translations = []
+    for field in FIELDS_CELL_INFO:
+        count = cell_count if field.name == "voltages" else field.count
+        key = ["cell_info", field.name] if count is None else ["cell_info", field.name, count]
+        fmt = field.fmt if field.fmt == "?" else "<" + field.fmt
+        translations.append([key, field.offset, fmt] + ([1 / field.divisor] if field.divisor else []))
+
+    def decode(fb):
+        o = {}
+        for translation in translations:
+            legacy_translate(fb, translation, o)
+        return o["cell_info"]
+
+    return decode
+
+
+def compare(name, legacy, new, args, number):
+    """
+    Check that both functions return the same values and print the time per call.
+    """
+    expected, result = legacy(*args), new(*args)
+    for key, value in expected.items():
+        values, results = (value, result[key]) if isinstance(value, list) else ([value], [result[key]])
+        if len(values) != len(results) or any(abs(a - b) > 1e-9 for a, b in zip(values, results)):
+            print(f"{name:<32} MISMATCH in {key}: {value!r} != {result[key]!r}")
+            return
+
+    time_legacy = timeit(lambda: legacy(*args), number=number) / number * 1e6
+    time_new = timeit(lambda: new(*args), number=number) / number * 1e6
+    print(f"{name:<32} legacy: {time_legacy:8.2f} us | new: {time_new:8.2f} us | speedup: {time_legacy / time_new:6.1f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the frame decoding of the drivers.")
+    parser.add_argument("--number", type=int, default=20000, help="number of calls per implementation (default: 20000)")
+    args = parser.parse_args()
+
+    simulator = JkbmsPbSimulator(BatteryModel(seed=1))
+    status_frame = simulator.status_frame()
+    settings_frame = simulator.settings_frame()
+
+    compare("Jkbms_pb status 16 cells", legacy_jkbms_pb_status, new_jkbms_pb_status, (status_frame, 16), args.number)
+    compare("Jkbms_pb settings", legacy_jkbms_pb_settings, SETTINGS_LAYOUT.decode, (settings_frame,), args.number)
+
+    model = BatteryModel(seed=1)
+    seplos_frame = SeplosSimulator(model).reply(Seplos.encode_cmd(SeplosSimulator.ADDRESS, cid2=Seplos.COMMAND_STATUS, info=b"01"))
+    compare("Seplos status 16 cells", legacy_seplos_status, new_seplos_status, (seplos_frame[13:-5],), args.number)
+    pace_frame = PaceSimulator(model).reply(Pace.command_status.fget(None))
+    compare("Pace status 16 cells", legacy_pace_status, new_pace_status, (pace_frame,), args.number)
+    daren = Daren485.__new__(Daren485)
+    daren.address = Daren485Simulator.ADDRESS
+    daren_frame = Daren485Simulator(model).reply(daren.create_command_get_realtime_data().encode())
+    compare("Daren485 realtime data 16 cells", legacy_daren_realtime_data, new_daren_realtime_data, (daren_frame.decode()[13:-5],), args.number)
+
+    try:
+        from bms.jkbms_brn import get_cell_info_layout
+    except ImportError as e:
+        print(f"{'JKBMS BLE cell info 16 cells':<32} skipped: {e}")
+        return
+
+    ble_frame = bytearray(random.Random(1).randrange(256) for _ in range(300))
+    layout = get_cell_info_layout(24, 16)
+    compare("JKBMS BLE cell info 16 cells", legacy_jkbms_ble_cell_info(ble_frame, 16), layout.decode, (ble_frame,), args.number)
+
+
+if __name__ == "__main__":
+    main()
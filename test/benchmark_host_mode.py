@@ -0,0 +1,102 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""
+Host mode benchmark
+-------------------
+Compares the memory and CPU usage of N batteries served by N driver processes, like the serial starter
+does it, with one driver process in host mode serving all N ports. The batteries are simulated on
+pseudo-terminals by the `bms_simulator`.
+
+The memory is the proportional set size (PSS), so the pages shared between the processes, like the
+Python interpreter, are only counted once. The CPU time is the user and system time of the driver
+processes while measuring, without the detection at the start.
+
+Requirements:
+- Venus OS or another Linux with D-Bus and the Python modules of the driver
+- the `BMS_TYPE` in the config.ini should be set to the simulated BMS type, else the detection takes long
+
+Usage:
+- python benchmark_host_mode.py [--bms-type Daly] [--batteries 6] [--settle 60] [--duration 60]
+"""
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+sys.path.insert(1, os.path.dirname(os.path.abspath(__file__)))
+
+from bms_simulator import create_device, SIMULATORS  # noqa: E402
+
+DRIVER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "../dbus-serialbattery/dbus-serialbattery.py")
+
+
+def get_memory(pid):
+    """
+    Get the proportional set size of a process in kB.
+    """
+    with open(f"/proc/{pid}/smaps_rollup", "r") as file:
+        for line in file:
+            if line.startswith("Pss:"):
+                return int(line.split()[1])
+    return 0
+
+
+def get_cpu_time(pid):
+    """
+    Get the user and system time of a process in seconds.
+    """
+    with open(f"/proc/{pid}/stat", "r") as file:
+        # the process name can contain spaces, the fields after it are separated by spaces
+        fields = file.read().rpartition(")")[2].split()
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+
+def measure(commands, settle, duration):
+    """
+    Start the driver processes, wait until the batteries are detected and measure them.
+
+    :return: Memory in kB and CPU usage in percent of one core, summed over all processes
+    """
+    processes = [subprocess.Popen([sys.executable, DRIVER] + ports, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL) for ports in commands]
+    try:
+        time.sleep(settle)
+        for process in processes:
+            if process.poll() is not None:
+                raise RuntimeError(f"Driver exited with code {process.returncode}, check the log by running it manually")
+
+        cpu_start = sum(get_cpu_time(process.pid) for process in processes)
+        time.sleep(duration)
+        cpu = sum(get_cpu_time(process.pid) for process in processes) - cpu_start
+        memory = sum(get_memory(process.pid) for process in processes)
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.wait()
+
+    return memory, cpu / duration * 100
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark N driver processes against one process in host mode.")
+    parser.add_argument("--bms-type", default="Daly", choices=sorted(SIMULATORS), help="battery type to simulate (default: Daly)")
+    parser.add_argument("--batteries", type=int, default=6, help="number of simulated batteries (default: 6)")
+    parser.add_argument("--settle", type=float, default=60, help="time in s until the batteries are detected (default: 60)")
+    parser.add_argument("--duration", type=float, default=60, help="time in s to measure the CPU usage (default: 60)")
+    args = parser.parse_args()
+
+    devices = [create_device(args.bms_type, seed=index).start() for index in range(args.batteries)]
+    ports = [device.port for device in devices]
+    try:
+        for name, commands in ((f"{args.batteries} processes", [[port] for port in ports]), ("1 process, host mode", [ports])):
+            memory, cpu = measure(commands, args.settle, args.duration)
+            print(f"{name:<24} memory: {memory / 1024:7.1f} MB | CPU: {cpu:5.1f} %")
+    finally:
+        for device in devices:
+            device.stop()
+
+
+if __name__ == "__main__":
+    main()
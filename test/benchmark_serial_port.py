@@ -0,0 +1,130 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""
+Serial port benchmark
+---------------------
+Compares the old behaviour of opening the serial port for every request with the
+persistent handle of `utils.serial_port_manager`.
+
+A pseudo-terminal is used as serial port and a small thread answers every LLT/JBD
+"general data" request, so no hardware is needed. The script counts the calls to
+`os.open`, `os.close`, `termios.tcgetattr` and `termios.tcsetattr` made by pyserial,
+which are the expensive syscalls on a GX device.
+
+Requirements:
+- pyserial
+
+Usage:
+- python benchmark_serial_port.py [cycles]
+
+For a complete syscall count run it with `strace -c -f python benchmark_serial_port.py`.
+"""
+import os
+import pty
+import sys
+import termios
+import threading
+from time import perf_counter
+
+sys.path.insert(1, os.path.join(os.path.dirname(__file__), "../dbus-serialbattery"))
+
+import serial  # noqa: E402
+import utils  # noqa: E402
+
+
+REQUEST = b"\xdd\xa5\x03\x00\xff\xfd\x77"
+PAYLOAD = bytes(range(27))
+RESPONSE = b"\xdd\x03\x00" + bytes([len(PAYLOAD)]) + PAYLOAD + ((0x10000 - sum(PAYLOAD) - len(PAYLOAD)) % 0x10000).to_bytes(2, "big") + b"\x77"
+LENGTH_POS = 3
+LENGTH_CHECK = 6
+
+
+class SyscallCounter:
+    """
+    Wraps the functions pyserial uses to open and configure a port and counts the calls.
+    """
+
+    NAMES = [(os, "open"), (os, "close"), (termios, "tcgetattr"), (termios, "tcsetattr")]
+
+    def __init__(self):
+        self.counts = {}
+        self.originals = {}
+
+    def __enter__(self):
+        for module, name in self.NAMES:
+            original = getattr(module, name)
+            self.originals[(module, name)] = original
+            self.counts[name] = 0
+            setattr(module, name, self.wrap(name, original))
+        return self
+
+    def __exit__(self, *args):
+        for (module, name), original in self.originals.items():
+            setattr(module, name, original)
+
+    def wrap(self, name, original):
+        def counted(*args, **kwargs):
+            self.counts[name] += 1
+            return original(*args, **kwargs)
+
+        return counted
+
+
+def responder(master_fd: int, stop: threading.Event) -> None:
+    buffer = b""
+    while not stop.is_set():
+        try:
+            buffer += os.read(master_fd, 64)
+        except OSError:
+            return
+        while REQUEST in buffer:
+            buffer = buffer[buffer.index(REQUEST) + len(REQUEST) :]
+            os.write(master_fd, RESPONSE)
+
+
+def legacy_read(port: str) -> bytearray:
+    # behaviour before the serial port manager was introduced
+    with serial.Serial(port, baudrate=9600, timeout=0.1) as ser:
+        return utils.read_serialport_data(ser, REQUEST, LENGTH_POS, LENGTH_CHECK)
+
+
+def managed_read(port: str) -> bytearray:
+    return utils.read_serial_data(REQUEST, port, 9600, LENGTH_POS, LENGTH_CHECK)
+
+
+def run(name: str, function, port: str, cycles: int) -> None:
+    with SyscallCounter() as counter:
+        start = perf_counter()
+        failed = 0
+        for _ in range(cycles):
+            if function(port) is False:
+                failed += 1
+        runtime = perf_counter() - start
+
+    per_cycle = ", ".join(f"{key}: {value / cycles:.2f}" for key, value in counter.counts.items())
+    print(f"{name:<8} {runtime / cycles * 1000:7.2f} ms/cycle | failed: {failed} | syscalls per cycle: {per_cycle}")
+
+
+def main():
+    cycles = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+
+    master_fd, slave_fd = pty.openpty()
+    port = os.ttyname(slave_fd)
+    stop = threading.Event()
+    thread = threading.Thread(target=responder, args=(master_fd, stop), daemon=True)
+    thread.start()
+
+    print(f"Running {cycles} request/response cycles on {port}")
+    run("legacy", legacy_read, port, cycles)
+    run("managed", managed_read, port, cycles)
+    print(f"Port (re)opened by serial_port_manager: {utils.serial_port_manager.open_count} time(s)")
+
+    stop.set()
+    utils.serial_port_manager.close_all()
+    os.close(slave_fd)
+    os.close(master_fd)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+
+"""
+BMS simulator
+-------------
+Simulates the serial protocols of several BMS on a pseudo-terminal, so the drivers in `bms/*.py` and
+`dbus-serialbattery.py` can be run and benchmarked without hardware.
+
+All protocols share the same stateful battery model. The link can be configured to add latency,
+random noise bytes and dropped bytes.
+
+Requirements:
+- Linux (pseudo-terminals)
+- no additional Python modules
+
+Usage:
+- python -m bms_simulator --help
+
+Example:
+```
+from bms_simulator import BatteryModel, LinkFaults, create_device
+
+with create_device("Daly", faults=LinkFaults(latency=0.005)) as device:
+    battery = Daly(device.port, 9600, b"\\x40")
+    battery.test_connection()
+```
+"""
+from typing import Union
+
+from .daly import DalySimulator
+from .daren_485 import Daren485Simulator
+from .device import LinkFaults, SimulatedDevice
+from .eg4_ll import Eg4LlSimulator
+from .felicity import FelicitySimulator
+from .heltec_modbus import HeltecModbusSimulator
+from .jkbms import JkbmsSimulator
+from .jkbms_pb import JkbmsPbSimulator
+from .lltjbd import LltJbdSimulator
+from .model import BatteryModel
+from .pace import PaceSimulator
+from .renogy import RenogySimulator
+from .seplos import SeplosSimulator
+
+
+SIMULATORS = {
+    simulator.NAME: simulator
+    for simulator in [
+        DalySimulator,
+        Daren485Simulator,
+        Eg4LlSimulator,
+        FelicitySimulator,
+        HeltecModbusSimulator,
+        JkbmsSimulator,
+        JkbmsPbSimulator,
+        LltJbdSimulator,
+        PaceSimulator,
+        RenogySimulator,
+        SeplosSimulator,
+    ]
+}
+"""
+Simulators by the battery type name used in `BMS_TYPE`
+"""
+
+
+def create_device(
+    bms_type: str,
+    model: Union[BatteryModel, None] = None,
+    faults: Union[LinkFaults, None] = None,
+    address: Union[bytes, None] = None,
+    seed: Union[int, None] = None,
+) -> SimulatedDevice:
+    """
+    Create a simulated BMS on a new pseudo-terminal. The device has to be started with `start()`
+    or used as context manager.
+
+    :param bms_type: Battery type, one of `SIMULATORS`
+    :param model: Battery model, if not set a new one with the default cell count of the BMS is created
+    :param faults: Timing and error behaviour of the link
+    :param address: Address of the BMS, if not set the default address of the BMS is used
+    :param seed: Seed for the random values, to get reproducible runs
+    :return: Simulated device
+    """
+    simulator = SIMULATORS[bms_type]
+
+    if model is None:
+        model = BatteryModel(cell_count=simulator.CELL_COUNT, seed=seed)
+
+    return SimulatedDevice(simulator(model, address), faults, seed)
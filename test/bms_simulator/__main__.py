@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+import argparse
+import signal
+import sys
+import threading
+
+from . import SIMULATORS, BatteryModel, LinkFaults, create_device
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="bms_simulator", description="Simulate a BMS on a pseudo-terminal.")
+    parser.add_argument("bms_type", choices=sorted(SIMULATORS), help="battery type to simulate")
+    parser.add_argument("--address", help="address of the BMS as hex, e.g. 40 (default: address of the BMS type)")
+    parser.add_argument("--cells", type=int, help="number of cells (default: cell count of the BMS type)")
+    parser.add_argument("--capacity", type=float, default=100.0, help="capacity in Ah (default: 100)")
+    parser.add_argument("--soc", type=float, default=60.0, help="initial SoC in %% (default: 60)")
+    parser.add_argument("--current", type=float, default=20.0, help="peak (dis)charge current in A (default: 20)")
+    parser.add_argument("--period", type=float, default=600.0, help="duration of one charge/discharge period in s (default: 600)")
+    parser.add_argument("--latency", type=float, default=0.0, help="reply latency in ms (default: 0)")
+    parser.add_argument("--jitter", type=float, default=0.0, help="random additional reply latency in ms (default: 0)")
+    parser.add_argument("--noise", type=float, default=0.0, help="probability of noise bytes before a reply (default: 0)")
+    parser.add_argument("--drop", type=float, default=0.0, help="probability that a reply byte is lost (default: 0)")
+    parser.add_argument("--no-reply", type=float, default=0.0, help="probability that a request is not answered (default: 0)")
+    parser.add_argument("--baud", type=int, help="send the replies with the speed of this baud rate (default: at once)")
+    parser.add_argument("--seed", type=int, help="seed for the random values")
+    args = parser.parse_args()
+
+    simulator = SIMULATORS[args.bms_type]
+    model = BatteryModel(
+        cell_count=args.cells or simulator.CELL_COUNT,
+        capacity=args.capacity,
+        soc=args.soc,
+        current_amplitude=args.current,
+        current_period=args.period,
+        seed=args.seed,
+    )
+    faults = LinkFaults(
+        latency=args.latency / 1000,
+        jitter=args.jitter / 1000,
+        noise=args.noise,
+        drop=args.drop,
+        no_reply=args.no_reply,
+        baud=args.baud,
+    )
+    address = bytes.fromhex(args.address) if args.address else None
+
+    device = create_device(args.bms_type, model, faults, address, args.seed).start()
+
+    print(f"Simulating {args.bms_type} with {model.cell_count} cells on {device.port}")
+    print(f"Set BMS_TYPE = {args.bms_type} in the config.ini and start the driver with: ./dbus-serialbattery.py {device.port}")
+    sys.stdout.flush()
+
+    stop = threading.Event()
+    signal.signal(signal.SIGINT, lambda *args: stop.set())
+    signal.signal(signal.SIGTERM, lambda *args: stop.set())
+
+    while not stop.wait(10):
+        print(", ".join(f"{key}: {value}" for key, value in device.get_statistics().items()))
+        sys.stdout.flush()
+
+    device.stop()
+    print(", ".join(f"{key}: {value}" for key, value in device.get_statistics().items()))
+
+
+if __name__ == "__main__":
+    main()
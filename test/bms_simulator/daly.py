@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+from struct import pack
+from typing import Union
+
+from .protocol import Protocol
+
+
+class DalySimulator(Protocol):
+    """
+    Daly Smart BMS (UART/RS485).
+
+    Every request and reply is a 13 byte sentence: `A5 address command 08 data[8] checksum`.
+    The cell voltages and the battery code are sent in several sentences.
+    """
+
+    NAME = "Daly"
+    BAUD = 9600
+    ADDRESS = b"\x40"
+    START = b"\xa5"
+
+    def request_length(self, buffer: bytearray) -> Union[int, None]:
+        return 13
+
+    def is_valid(self, request: bytes) -> bool:
+        return request[1] == self.address[0] and request[3] == 8 and sum(request[:12]) & 0xFF == request[12]
+
+    def sentence(self, command: int, data: bytes) -> bytes:
+        # the reply contains the board number instead of the address, 0x40 is board 1
+        frame = bytes([0xA5, self.address[0] - 63, command, 8]) + data.ljust(8, b"\x00")
+        return frame + bytes([sum(frame) & 0xFF])
+
+    def reply(self, request: bytes) -> Union[bytes, None]:
+        model = self.model
+        command = request[2]
+
+        if command == 0x90:
+            data = pack(">HhHH", round(model.voltage * 10), 0, 30000 - round(model.current * 10), round(model.soc * 10))
+        elif command == 0x91:
+            data = pack(
+                ">HBHB",
+                round(model.cell_voltages[model.cell_max] * 1000),
+                model.cell_max + 1,
+                round(model.cell_voltages[model.cell_min] * 1000),
+                model.cell_min + 1,
+            )
+        elif command == 0x92:
+            data = pack(">BBBB", round(max(model.temperatures)) + 40, 1, round(min(model.temperatures)) + 40, 2)
+        elif command == 0x93:
+            state = 1 if model.current > 0 else 2 if model.current < 0 else 0
+            data = pack(">B??BL", state, model.charge_fet, model.discharge_fet, 0, round(model.capacity_remain * 1000))
+        elif command == 0x94:
+            data = pack(">BB??BH", model.cell_count, len(model.temperatures), model.current > 0, model.current < 0, 0, model.cycles)
+        elif command == 0x95:
+            frames = bytearray()
+            for frame in range((model.cell_count + 2) // 3):
+                voltages = [round(voltage * 1000) for voltage in model.cell_voltages[frame * 3 : frame * 3 + 3]]
+                frames += self.sentence(command, pack(">B" + "H" * len(voltages), frame + 1, *voltages))
+            return bytes(frames)
+        elif command == 0x97:
+            bits = 0
+            for index, balancing in enumerate(model.balancing):
+                if balancing:
+                    bits |= 1 << (48 - index)
+            data = pack(">Q", bits)
+        elif command == 0x98:
+            data = b""
+        elif command == 0x50:
+            data = pack(">LL", round(model.capacity * 1000), 3200)
+        elif command == 0x53:
+            data = pack(">BBBBB", 0, 0, 24, 5, 17)
+        elif command == 0x57:
+            code = model.serial_number.encode("ascii").ljust(35, b" ")
+            return b"".join(self.sentence(command, bytes([index + 1]) + code[index * 7 : index * 7 + 7]) for index in range(5))
+        elif command == 0x21:
+            model.soc = int.from_bytes(request[10:12], "big") / 10
+            data = b"\x01"
+        elif command == 0xD9:
+            model.discharge_fet = request[4] == 1
+            data = request[4:5]
+        elif command == 0xDA:
+            model.charge_fet = request[4] == 1
+            data = request[4:5]
+        else:
+            return None
+
+        return self.sentence(command, data)
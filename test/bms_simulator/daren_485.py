@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+from typing import Union
+
+from .protocol import AsciiHexProtocol
+
+
+def hex_string(value: str, length: int) -> str:
+    # text padded with null bytes, as hex characters
+    return value[:length].encode("ascii").ljust(length, b"\x00").hex().upper()
+
+
+class Daren485Simulator(AsciiHexProtocol):
+    """
+    Daren BMS (RS485), protocol version 2.2 with CID1 0x4A.
+    """
+
+    NAME = "Daren485"
+    BAUD = 19200
+    ADDRESS = b"\x01"
+    VERSION = "22"
+    CID1 = "4A"
+
+    def reply(self, request: bytes) -> Union[bytes, None]:
+        model = self.model
+        cid2 = request[7:9]
+
+        if cid2 == b"42":
+            info = f"00{round(model.soc * 100):04X}{round(model.voltage * 100):04X}{model.cell_count:02X}"
+            info += "".join(f"{round(voltage * 1000):04X}" for voltage in model.cell_voltages)
+            info = info.ljust(84, "0")
+            info += f"{round(model.temperature_mos * 10) & 0xFFFF:04X}" + "00"
+            info += "".join(f"{round(temperature * 10) & 0xFFFF:04X}" for temperature in model.temperatures)
+            info += f"{round(model.current * 100) & 0xFFFF:04X}"
+            info = info.ljust(120, "0")
+            info += f"{round(model.capacity * 100):04X}{round(model.capacity_remain * 100):04X}{model.cycles:04X}"
+            # voltage, current, temperature and warning status without alarms
+            info += "0000" * 4
+            # bit 0 charge FET, bit 1 discharge FET
+            info += f"{(1 if model.charge_fet else 0) | (2 if model.discharge_fet else 0):04X}"
+            info = info.ljust(156, "0")
+        elif cid2 == b"47":
+            info = "00" + f"{3650:04X}{2700:04X}{55:04X}{0:04X}{10000:04X}{58400:04X}{43200:04X}"
+            info += f"{model.cell_count:04X}{10000:04X}{round(model.capacity * 100):04X}"
+            info = info.ljust(130, "0")
+        elif cid2 == b"B0":
+            # echo command group, operation and module
+            module = request[17:19]
+            if module == b"03":
+                payload = hex_string(model.serial_number, 15)
+            elif module == b"04":
+                payload = f"{round(model.capacity_remain * 100):04X}{round(model.capacity * 100):04X}{round(model.capacity * 100):04X}"
+                payload += f"{round(model.cycles * model.capacity * 100):08X}{round(model.cycles * model.capacity):08X}"
+                payload += f"{round(model.cycles * model.capacity * 5.1):04X}{round(model.cycles * model.capacity * 5):04X}"
+            else:
+                return self.build_frame("", "06")
+            info = request[13:21].decode("ascii") + f"{len(payload) // 2:04X}" + payload
+        elif cid2 == b"51":
+            info = hex_string("DR-SIM", 10) + hex_string("P16S100A", 10) + hex_string("PRJ-SIM", 10) + "010203"
+            info = info.ljust(70, "0")
+        else:
+            return self.build_frame("", "04")
+
+        return self.build_frame(info)
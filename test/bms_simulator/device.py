@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+import os
+import pty
+import random
+import select
+import threading
+import tty
+from time import sleep
+from typing import Union
+
+from .protocol import Protocol
+
+
+class LinkFaults:
+    """
+    Timing and error behaviour of the simulated serial link.
+    """
+
+    def __init__(
+        self,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        noise: float = 0.0,
+        drop: float = 0.0,
+        no_reply: float = 0.0,
+        baud: Union[int, None] = None,
+    ):
+        """
+        :param latency: Time in seconds between the end of the request and the start of the reply
+        :param jitter: Random additional latency in seconds, between 0 and this value
+        :param noise: Probability that random bytes are sent before a reply
+        :param drop: Probability that a single byte of a reply is lost
+        :param no_reply: Probability that a request is not answered at all
+        :param baud: If set, the reply is sent with the speed of this baud rate instead of at once
+        """
+        self.latency = latency
+        self.jitter = jitter
+        self.noise = noise
+        self.drop = drop
+        self.no_reply = no_reply
+        self.baud = baud
+
+
+class SimulatedDevice:
+    """
+    Serves a simulated BMS on a pseudo-terminal.
+
+    The slave side of the pseudo-terminal can be used like a real serial port, e.g. `/dev/pts/3`.
+    """
+
+    def __init__(self, protocol: Protocol, faults: Union[LinkFaults, None] = None, seed: Union[int, None] = None):
+        """
+        :param protocol: Protocol to simulate
+        :param faults: Timing and error behaviour of the link
+        :param seed: Seed for the random faults, to get reproducible runs
+        """
+        self.protocol = protocol
+        self.faults = faults if faults is not None else LinkFaults()
+        self.random = random.Random(seed)
+
+        self.master_fd, self.slave_fd = pty.openpty()
+        # no echo and no line processing, like a real serial port
+        tty.setraw(self.slave_fd)
+        self.port = os.ttyname(self.slave_fd)
+
+        self.replies: int = 0
+        self.dropped_bytes: int = 0
+        self.noise_bytes: int = 0
+        self.unanswered: int = 0
+
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"{protocol.NAME} simulator", daemon=True)
+
+    def start(self) -> "SimulatedDevice":
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join(1)
+        os.close(self.slave_fd)
+        os.close(self.master_fd)
+
+    def __enter__(self) -> "SimulatedDevice":
+        return self.start()
+
+    def __exit__(self, *args) -> None:
+        self.stop()
+
+    def get_statistics(self) -> dict:
+        return {
+            "requests": self.protocol.requests,
+            "replies": self.replies,
+            "unanswered": self.unanswered,
+            "skipped_bytes": self.protocol.skipped_bytes,
+            "noise_bytes": self.noise_bytes,
+            "dropped_bytes": self.dropped_bytes,
+        }
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            readable, _, _ = select.select([self.master_fd], [], [], 0.1)
+            if not readable:
+                continue
+
+            try:
+                data = os.read(self.master_fd, 1024)
+            except OSError:
+                return
+
+            reply = self.protocol.feed(data)
+            if reply:
+                self._send(reply)
+
+    def _send(self, reply: bytes) -> None:
+        faults = self.faults
+
+        if faults.no_reply > 0 and self.random.random() < faults.no_reply:
+            self.unanswered += 1
+            return
+
+        delay = faults.latency + (self.random.uniform(0, faults.jitter) if faults.jitter > 0 else 0)
+        if delay > 0:
+            sleep(delay)
+
+        if faults.drop > 0:
+            kept = bytes(byte for byte in reply if self.random.random() >= faults.drop)
+            self.dropped_bytes += len(reply) - len(kept)
+            reply = kept
+
+        if faults.noise > 0 and self.random.random() < faults.noise:
+            noise = bytes(self.random.randrange(256) for _ in range(self.random.randint(1, 8)))
+            self.noise_bytes += len(noise)
+            reply = noise + reply
+
+        self.replies += 1
+
+        if faults.baud:
+            # 10 bits per byte (start, 8 data, stop), send in small chunks like a real UART would deliver them
+            chunk_size = 16
+            for index in range(0, len(reply), chunk_size):
+                chunk = reply[index : index + chunk_size]
+                os.write(self.master_fd, chunk)
+                sleep(len(chunk) * 10 / faults.baud)
+        else:
+            os.write(self.master_fd, reply)
@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+from .protocol import ModbusProtocol, string_to_registers, to_registers
+
+
+class Eg4LlSimulator(ModbusProtocol):
+    """
+    EG4 LL battery (RS485 Modbus).
+
+    The driver sends fixed requests for the statistics (registers 0-38), the configuration (45-135)
+    and the version (105-139).
+    """
+
+    NAME = "EG4_LL"
+    BAUD = 9600
+    ADDRESS = b"\x01"
+
+    def registers(self) -> dict:
+        model = self.model
+        registers = {}
+
+        registers[0] = round(model.voltage * 100)
+        registers[1] = to_registers(round(model.current * 100))[0]
+        for index, voltage in enumerate(model.cell_voltages[:16]):
+            registers[2 + index] = round(voltage * 1000)
+
+        registers[18] = to_registers(round(model.temperatures[0]))[0]
+        registers[19] = to_registers(round(sum(model.temperatures) / len(model.temperatures)))[0]
+        registers[20] = to_registers(round(max(model.temperatures)))[0]
+        registers[21] = round(model.capacity_remain)
+        registers[22] = 100
+        registers[23] = 100
+        registers[24] = round(model.soc)
+        # heater status (high byte) and state (low byte): 0 standby, 1 charging, 2 discharging
+        registers[25] = 1 if model.current > 0 else 2 if model.current < 0 else 0
+        registers[26] = registers[27] = registers[28] = 0
+        registers[29], registers[30] = to_registers(model.cycles, 2)
+        # capacity in mAs
+        registers[31], registers[32] = to_registers(round(model.capacity * 3600 * 1000), 2)
+        # temperature 2 (high byte) and MOS temperature (low byte)
+        registers[33] = (round(model.temperatures[1]) & 0xFF) << 8 | (round(model.temperature_mos) & 0xFF)
+        registers[36] = model.cell_count
+
+        # configuration: balancer voltage and difference, cell under and over voltage warning
+        registers[56] = 3400
+        registers[57] = 30
+        registers[61] = 2900
+        registers[67] = 3600
+
+        # version: the driver reads the text after the byte count
+        version = ("EG4-LL-SIM".ljust(24) + "HW1.00" + model.serial_number.ljust(16)).ljust(70)
+        for index, word in enumerate(string_to_registers(version, 35)):
+            registers[105 + index] = word
+
+        return registers
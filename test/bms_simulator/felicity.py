@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+from .protocol import ModbusProtocol, to_registers
+
+
+class FelicitySimulator(ModbusProtocol):
+    """
+    Felicity battery (RS485 Modbus).
+    """
+
+    NAME = "Felicity"
+    BAUD = 9600
+    ADDRESS = b"\x01"
+
+    def registers(self) -> dict:
+        model = self.model
+        registers = {}
+
+        # bit 0 charge enabled, bit 2 discharge enabled
+        registers[4866] = (1 if model.charge_fet else 0) | (4 if model.discharge_fet else 0)
+        registers[4868] = 0
+        registers[4870] = round(model.voltage * 100)
+        # the current is positive while discharging
+        registers[4871] = to_registers(round(model.current * -10))[0]
+        registers[4874] = round(model.temperature_mos)
+        registers[4875] = round(model.soc)
+
+        # maximum charge voltage, minimum discharge voltage, maximum charge and discharge current
+        for index, value in enumerate([round(model.cell_count * 3.5 * 100), round(model.cell_count * 2.9 * 100), 1000, 1500]):
+            registers[4892 + index] = value
+
+        for index, voltage in enumerate(model.cell_voltages):
+            registers[4906 + index] = round(voltage * 1000)
+
+        for index, temperature in enumerate([model.temperature_mos] + model.temperatures[:3]):
+            registers[4929 + index] = to_registers(round(temperature))[0]
+
+        registers[63499] = 0x0203
+        for index in range(5):
+            registers[63492 + index] = int(model.serial_number[3 + index * 2 : 5 + index * 2] or 0)
+
+        return registers
@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+from .protocol import ModbusProtocol, string_to_registers
+
+
+def swapped(value: int) -> int:
+    """
+    Register value with the low byte first, like the Heltec BMS sends most of the 16 bit values.
+    """
+    value &= 0xFFFF
+    return ((value & 0xFF) << 8) | (value >> 8)
+
+
+def little(value: int) -> list:
+    """
+    Registers of a 32 bit value with all bytes reversed (`minimalmodbus.BYTEORDER_LITTLE`).
+    """
+    data = (value & 0xFFFFFFFF).to_bytes(4, "little")
+    return [int.from_bytes(data[0:2], "big"), int.from_bytes(data[2:4], "big")]
+
+
+class HeltecModbusSimulator(ModbusProtocol):
+    """
+    Heltec smart BMS (RS485 Modbus).
+
+    The driver reads the static values once and the measurements, cell voltages and states with a few block requests.
+    """
+
+    NAME = "HeltecModbus"
+    BAUD = 9600
+    ADDRESS = b"\x01"
+
+    def registers(self) -> dict:
+        model = self.model
+        registers = {}
+
+        for index, word in enumerate([0x5349, 0x4D00, 0x0001, 0x2345]):
+            registers[2 + index] = word
+        for index, word in enumerate(string_to_registers("HELTEC-SIM".ljust(26), 13)):
+            registers[7 + index] = word
+        registers[38] = 3 << 8
+        # production date: year in the low word, day and month in the high word
+        registers[39], registers[40] = little(2024 | 15 << 16 | 6 << 24)
+        for index, word in enumerate(string_to_registers("HT-SIM".ljust(12), 6)):
+            registers[41 + index] = word
+        for index, word in enumerate(string_to_registers("1234", 2)):
+            registers[47 + index] = word
+        # cell count (high byte) and cell type (low byte), 1 is LiFePo4
+        registers[75] = model.cell_count << 8 | 1
+
+        registers[76], registers[77] = little(round(model.voltage * 1000))
+        # the driver inverts the sign of the current
+        registers[78], registers[79] = little(round(-model.current * 100))
+        for index, voltage in enumerate(model.cell_voltages):
+            registers[81 + index] = swapped(round(voltage * 1000))
+
+        # temperatures with an offset of 40 °C: MOS (low byte) and balancer (high byte), sensor 1 and 2
+        registers[112] = (round(model.temperature_mos) + 40) & 0xFF | ((round(model.temperatures[0]) + 40) & 0xFF) << 8
+        registers[113] = (round(model.temperatures[0]) + 40) & 0xFF | ((round(model.temperatures[1]) + 40) & 0xFF) << 8
+        registers[118] = swapped(round(model.capacity * 10))
+        registers[119] = swapped(round(model.capacity * 10))
+        registers[120] = round(model.soc) << 8 | 100
+        registers[126] = swapped(round(model.capacity * 10))
+
+        registers[139], registers[140] = little(sum(1 << index for index, balancing in enumerate(model.balancing) if balancing))
+        # run state: bit 29 discharge and bit 28 charge protection
+        registers[152], registers[153] = little((0 if model.discharge_fet else 1 << 29) | (0 if model.charge_fet else 1 << 28))
+        registers[156], registers[157] = little(0)
+
+        registers[169] = swapped(3650)
+        registers[172] = swapped(2500)
+        registers[191] = swapped(100 * 100)
+        registers[194] = swapped(150 * 100)
+
+        return registers
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+from struct import pack
+from typing import Union
+
+from .protocol import Protocol
+
+
+# items after the cell voltages (id, size in bytes) in the order the BMS sends them
+ITEMS = (
+    [(0x80, 2), (0x81, 2), (0x82, 2), (0x83, 2), (0x84, 2), (0x85, 1), (0x86, 1), (0x87, 2), (0x89, 4), (0x8A, 2), (0x8B, 2), (0x8C, 2)]
+    + [(item, 2) for item in range(0x8E, 0x9D)]
+    + [(0x9D, 1)]
+    + [(item, 2) for item in range(0x9E, 0xA9)]
+    + [(0xA9, 1), (0xAA, 4), (0xAB, 1), (0xAC, 1), (0xAD, 2), (0xAE, 1), (0xAF, 1), (0xB0, 2), (0xB1, 1), (0xB2, 10), (0xB3, 1)]
+    + [(0xB4, 8), (0xB5, 4), (0xB6, 4), (0xB7, 15), (0xB8, 1), (0xB9, 4), (0xBA, 24)]
+)
+
+
+def temperature(value: float) -> int:
+    # negative temperatures are sent as 100 + |value|
+    return round(value) if value >= 0 else 100 + round(-value)
+
+
+class JkbmsSimulator(Protocol):
+    """
+    JKBMS RS485 protocol (V11 and older hardware).
+
+    The request `4E 57 ...` is answered with one frame, which contains all values as id/value items.
+    """
+
+    NAME = "Jkbms"
+    BAUD = 115200
+    START = b"\x4e\x57"
+
+    def request_length(self, buffer: bytearray) -> Union[int, None]:
+        if len(buffer) < 4:
+            return None
+        return int.from_bytes(buffer[2:4], "big") + 2
+
+    def is_valid(self, request: bytes) -> bool:
+        return len(request) >= 21 and sum(request[:-4]) & 0xFFFF == int.from_bytes(request[-2:], "big")
+
+    def item_value(self, item: int, size: int) -> bytes:
+        model = self.model
+
+        values = {
+            0x80: temperature(model.temperature_mos),
+            0x81: temperature(model.temperatures[0]),
+            0x82: temperature(model.temperatures[1]),
+            0x83: round(model.voltage * 100),
+            # charging currents have bit 15 set
+            0x84: 0x8000 + round(model.current * 100) if model.current >= 0 else round(-model.current * 100),
+            0x85: round(model.soc),
+            0x86: 2,
+            0x87: model.cycles,
+            0x89: round(model.cycles * model.capacity),
+            0x8A: model.cell_count,
+            0x8C: (1 if model.charge_fet else 0) | (2 if model.discharge_fet else 0) | (4 if any(model.balancing) else 0),
+            0x97: 150,
+            0x99: 100,
+            0x9D: 1,
+            0xAA: round(model.capacity),
+            0xB4: b"Sim User",
+            0xB5: b"2405",
+            0xB7: b"11.XW_S11.26___",
+            0xBA: ("Sim JK " + model.serial_number).encode("ascii"),
+        }
+
+        value = values.get(item, 0)
+        if isinstance(value, bytes):
+            return value[:size].ljust(size, b"\x00")
+        return value.to_bytes(size, "big")
+
+    def reply(self, request: bytes) -> Union[bytes, None]:
+        model = self.model
+
+        cells = b"".join(pack(">BH", index + 1, round(voltage * 1000)) for index, voltage in enumerate(model.cell_voltages))
+        items = pack(">BB", 0x79, len(cells)) + cells
+        items += b"".join(bytes([item]) + self.item_value(item, size) for item, size in ITEMS)
+
+        # terminal id, command 0x06 (read all), source 0x00 (BMS), transport type 0x01 (reply)
+        body = b"\x00\x00\x00\x00" + b"\x06\x00\x01" + items + b"\x00\x00\x00\x00" + b"\x68"
+        frame = b"\x4e\x57" + (len(body) + 2 + 4).to_bytes(2, "big") + body
+        return frame + b"\x00\x00" + (sum(frame) & 0xFFFF).to_bytes(2, "big")
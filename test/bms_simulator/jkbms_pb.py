@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+from struct import pack_into
+from typing import Union
+
+from .protocol import ModbusProtocol, modbus_crc
+
+
+class JkbmsPbSimulator(ModbusProtocol):
+    """
+    JKBMS PB series (RS485 Modbus).
+
+    The BMS is triggered by writing to a register with function 0x10. It replies with a 300 byte frame
+    starting with `55 AA EB 90`, followed by the Modbus acknowledge of the write.
+    """
+
+    NAME = "Jkbms_pb"
+    BAUD = 115200
+    ADDRESS = b"\x01"
+
+    FRAME_STATUS = 0x02
+    FRAME_SETTINGS = 0x01
+    FRAME_ABOUT = 0x03
+
+    def __init__(self, model, address=None):
+        super().__init__(model, address)
+        self.frame_counter = 0
+
+    def reply(self, request: bytes) -> Union[bytes, None]:
+        if request[1] != 0x10:
+            return super().reply(request)
+
+        register = int.from_bytes(request[2:4], "big")
+
+        if register == 0x1620:
+            frame = self.status_frame()
+        elif register == 0x161E:
+            frame = self.settings_frame()
+        elif register == 0x161C:
+            frame = self.about_frame()
+        else:
+            frame = b""
+
+        acknowledge = request[:6]
+        return frame + acknowledge + modbus_crc(acknowledge)
+
+    def frame(self, frame_type: int) -> bytearray:
+        self.frame_counter = (self.frame_counter + 1) & 0xFF
+        frame = bytearray(300)
+        frame[0:6] = bytes([0x55, 0xAA, 0xEB, 0x90, frame_type, self.frame_counter])
+        return frame
+
+    @staticmethod
+    def finish(frame: bytearray) -> bytes:
+        frame[299] = sum(frame[:299]) & 0xFF
+        return bytes(frame)
+
+    def status_frame(self) -> bytes:
+        model = self.model
+        frame = self.frame(self.FRAME_STATUS)
+
+        for index, voltage in enumerate(model.cell_voltages):
+            pack_into("<H", frame, 6 + index * 2, round(voltage * 1000))
+
+        pack_into("<h", frame, 144, round(model.temperature_mos * 10))
+        pack_into("<I", frame, 150, round(model.voltage * 1000))
+        pack_into("<i", frame, 158, round(model.current * 1000))
+        pack_into("<hh", frame, 162, round(model.temperatures[0] * 10), round(model.temperatures[1] * 10))
+        pack_into("<B", frame, 172, 1 if any(model.balancing) else 0)
+        pack_into("<B", frame, 173, round(model.soc))
+        pack_into("<i", frame, 174, round(model.capacity_remain * 1000))
+        pack_into("<i", frame, 182, model.cycles)
+        pack_into("<BB", frame, 198, model.charge_fet, model.discharge_fet)
+        # all four temperature sensors are connected
+        pack_into("<B", frame, 214, 0x02 | 0x04 | 0x10 | 0x20)
+        pack_into("<hh", frame, 256, round(model.temperatures[2] * 10), round(model.temperatures[3] * 10))
+
+        return self.finish(frame)
+
+    def settings_frame(self) -> bytes:
+        model = self.model
+        frame = self.frame(self.FRAME_SETTINGS)
+
+        # cell voltage limits in mV
+        pack_into("<iiiiiiii", frame, 6, 2900, 2600, 2800, 3650, 3550, 3400, 3500, 2900)
+        pack_into("<i", frame, 46, 2500)
+        # charge and discharge over current in mA with delays
+        pack_into("<iiiiiiii", frame, 50, 100000, 30, 60, 150000, 300, 60, 5, 2000)
+        # temperature limits in 0.1 °C
+        pack_into("<IIIIIIII", frame, 82, 700, 600, 700, 600, 0, 50, 1000, 800)
+        pack_into("<iiiiii", frame, 114, model.cell_count, 1, 1, 1, round(model.capacity * 1000), 1500)
+
+        return self.finish(frame)
+
+    def about_frame(self) -> bytes:
+        model = self.model
+        frame = self.frame(self.FRAME_ABOUT)
+
+        frame[6:18] = b"JK_PB2A16S20"
+        frame[22:26] = b"15A "
+        frame[30:34] = b"15.4"
+        frame[86:96] = model.serial_number[:10].encode("ascii").ljust(10, b" ")
+
+        return self.finish(frame)
@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+from struct import pack
+from typing import Union
+
+from .protocol import Protocol
+
+
+def checksum(payload: bytes) -> int:
+    return (0x10000 - sum(payload)) % 0x10000
+
+
+class LltJbdSimulator(Protocol):
+    """
+    LLT/JBD BMS (UART/RS485).
+
+    Request: `DD A5|5A register length data checksum[2] 77`
+    Reply: `DD register status length data checksum[2] 77`
+    """
+
+    NAME = "LltJbd"
+    BAUD = 9600
+    ADDRESS = b"\x00"
+    START = b"\xdd"
+
+    def __init__(self, model, address=None):
+        super().__init__(model, address)
+        # EEPROM registers: cycle capacity, charge and discharge over current (10 mA), function configuration
+        self.eeprom = {
+            0x11: pack(">H", round(model.capacity * 80)),
+            0x28: pack(">h", 10000),
+            0x29: pack(">h", -15000),
+            0x2D: pack(">H", 0x0004 | 0x0040),
+        }
+
+    def request_length(self, buffer: bytearray) -> Union[int, None]:
+        if len(buffer) < 4:
+            return None
+        return buffer[3] + 7
+
+    def is_valid(self, request: bytes) -> bool:
+        return request[1] in (0xA5, 0x5A) and request[-1] == 0x77 and checksum(request[2:-3]) == int.from_bytes(request[-3:-1], "big")
+
+    @staticmethod
+    def frame(register: int, payload: bytes, status: int = 0) -> bytes:
+        body = bytes([status, len(payload)]) + payload
+        return bytes([0xDD, register]) + body + checksum(body).to_bytes(2, "big") + b"\x77"
+
+    def reply(self, request: bytes) -> Union[bytes, None]:
+        model = self.model
+        register = request[2]
+
+        if request[1] == 0x5A:
+            if register == 0xE1:
+                # bit 0 disables charging, bit 1 disables discharging
+                model.charge_fet = not request[5] & 0x01
+                model.discharge_fet = not request[5] & 0x02
+            elif register in self.eeprom and request[3] == 2:
+                self.eeprom[register] = request[4:6]
+            return self.frame(register, b"")
+
+        if register == 0x03:
+            balance = sum(1 << index for index, balancing in enumerate(model.balancing) if balancing)
+            payload = pack(
+                ">HhHHHHHHHBBBBB",
+                round(model.voltage * 100),
+                round(model.current * 100),
+                round(model.capacity_remain * 100),
+                round(model.capacity * 100),
+                model.cycles,
+                # production date: ((year - 2000) << 9) | (month << 5) | day
+                (24 << 9) | (5 << 5) | 17,
+                balance & 0xFFFF,
+                balance >> 16,
+                0,
+                0x21,
+                round(model.soc),
+                (1 if model.charge_fet else 0) | (2 if model.discharge_fet else 0),
+                model.cell_count,
+                3,
+            )
+            # MOS temperature and 2 cell temperatures in 0.1 K
+            temperatures = [model.temperature_mos] + model.temperatures[:2]
+            payload += b"".join(pack(">H", round(temperature * 10 + 2731)) for temperature in temperatures)
+        elif register == 0x04:
+            payload = b"".join(pack(">H", round(voltage * 1000)) for voltage in model.cell_voltages)
+        elif register == 0x05:
+            payload = ("SIM-" + model.serial_number).encode("ascii")
+        elif register in self.eeprom:
+            payload = self.eeprom[register]
+        else:
+            return self.frame(register, b"", 0x80)
+
+        return self.frame(register, payload)
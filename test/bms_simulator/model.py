@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+import math
+import random
+import threading
+from time import monotonic
+from typing import List
+
+
+# open circuit voltage of a LiFePo4 cell in V depending on the SoC in %
+OCV_LFP = [
+    (0, 2.80),
+    (5, 3.10),
+    (10, 3.20),
+    (20, 3.25),
+    (40, 3.28),
+    (60, 3.30),
+    (80, 3.33),
+    (95, 3.38),
+    (100, 3.50),
+]
+
+
+def ocv_lfp(soc: float) -> float:
+    """
+    Interpolate the open circuit voltage of a LiFePo4 cell.
+
+    :param soc: State of charge in %
+    :return: Cell voltage in V
+    """
+    for (soc_low, voltage_low), (soc_high, voltage_high) in zip(OCV_LFP, OCV_LFP[1:]):
+        if soc <= soc_high:
+            return voltage_low + (voltage_high - voltage_low) * (max(soc, soc_low) - soc_low) / (soc_high - soc_low)
+
+    return OCV_LFP[-1][1]
+
+
+class BatteryModel:
+    """
+    Stateful model of a LiFePo4 battery, which is shared by all protocol simulators.
+
+    The current follows a cosine wave starting with discharging, so the battery is charged and discharged
+    periodically. SoC, cell voltages and temperatures are calculated from the current each time the model
+    is updated. Positive currents are charging the battery.
+    """
+
+    def __init__(
+        self,
+        cell_count: int = 16,
+        capacity: float = 100.0,
+        soc: float = 60.0,
+        current_amplitude: float = 20.0,
+        current_period: float = 600.0,
+        seed: int = None,
+    ):
+        """
+        :param cell_count: Number of cells in series
+        :param capacity: Capacity in Ah
+        :param soc: Initial state of charge in %
+        :param current_amplitude: Peak current in A
+        :param current_period: Duration of one charge/discharge period in seconds
+        :param seed: Seed for the random cell deviations, to get reproducible values
+        """
+        self.lock = threading.Lock()
+        self.random = random.Random(seed)
+
+        self.cell_count = cell_count
+        self.capacity = capacity
+        self.soc = soc
+        self.current_amplitude = current_amplitude
+        self.current_period = current_period
+
+        self.current: float = 0.0
+        self.cell_voltages: List[float] = []
+        self.temperatures: List[float] = [25.0] * 4
+        self.temperature_mos: float = 25.0
+        self.cycles: int = 12
+        self.charge_fet: bool = True
+        self.discharge_fet: bool = True
+        self.balancing: List[bool] = [False] * cell_count
+
+        self.serial_number = "SIM" + "".join(self.random.choice("0123456789") for _ in range(9))
+        self.hardware_version = "SIM-HW-1.0"
+        self.software_version = "1.2.3"
+
+        # individual offset and internal resistance per cell, to get realistic min/max values
+        self.cell_offsets = [self.random.uniform(-0.008, 0.008) for _ in range(cell_count)]
+        self.cell_resistances = [self.random.uniform(0.0008, 0.0015) for _ in range(cell_count)]
+
+        self.time_start = monotonic()
+        self.time_update = self.time_start
+        self.update()
+
+    @property
+    def voltage(self) -> float:
+        return sum(self.cell_voltages)
+
+    @property
+    def capacity_remain(self) -> float:
+        return self.capacity * self.soc / 100
+
+    @property
+    def power(self) -> float:
+        return self.voltage * self.current
+
+    @property
+    def cell_min(self) -> int:
+        return self.cell_voltages.index(min(self.cell_voltages))
+
+    @property
+    def cell_max(self) -> int:
+        return self.cell_voltages.index(max(self.cell_voltages))
+
+    def update(self) -> None:
+        """
+        Advance the model to the current time.
+
+        :return: None
+        """
+        with self.lock:
+            now = monotonic()
+            elapsed = now - self.time_update
+            self.time_update = now
+
+            current = -self.current_amplitude * math.cos(2 * math.pi * (now - self.time_start) / self.current_period)
+
+            # the BMS opens the FETs at the limits
+            if (current > 0 and (not self.charge_fet or self.soc >= 100)) or (current < 0 and (not self.discharge_fet or self.soc <= 0)):
+                current = 0.0
+
+            self.current = round(current, 2)
+            self.soc = min(100.0, max(0.0, self.soc + self.current * elapsed / 36 / self.capacity))
+
+            self.cell_voltages = [
+                round(ocv_lfp(self.soc) + offset + self.current * resistance, 3) for offset, resistance in zip(self.cell_offsets, self.cell_resistances)
+            ]
+
+            # balance the highest cells while charging
+            spread = max(self.cell_voltages) - min(self.cell_voltages)
+            self.balancing = [self.current > 0 and spread > 0.010 and voltage > min(self.cell_voltages) + 0.010 for voltage in self.cell_voltages]
+
+            heat = abs(self.current) * 0.05
+            self.temperatures = [round(24.0 + heat + index * 0.5, 1) for index in range(len(self.temperatures))]
+            self.temperature_mos = round(26.0 + heat * 2, 1)
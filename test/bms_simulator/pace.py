@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+from typing import Union
+
+from .protocol import AsciiHexProtocol
+
+
+def hex_string(value: str, length: int) -> str:
+    # text padded with spaces, as hex characters
+    return value[:length].ljust(length).encode("ascii").hex().upper()
+
+
+class PaceSimulator(AsciiHexProtocol):
+    """
+    Pace BMS (RS232), protocol version 2.5.
+
+    The driver reads the replies with a fixed length, so the info has to have exactly the length of the
+    original BMS.
+    """
+
+    NAME = "Pace"
+    BAUD = 9600
+    ADDRESS = b"\x00"
+    VERSION = "25"
+
+    def reply(self, request: bytes) -> Union[bytes, None]:
+        model = self.model
+        cid2 = request[7:9]
+
+        if cid2 == b"42":
+            info = f"0001{model.cell_count:02X}"
+            info += "".join(f"{round(voltage * 1000):04X}" for voltage in model.cell_voltages)
+            temperatures = model.temperatures + [model.temperature_mos, model.temperatures[0]]
+            info += f"{len(temperatures):02X}" + "".join(f"{round((temperature + 273) * 10):04X}" for temperature in temperatures)
+            info += f"{round(model.current * 100) & 0xFFFF:04X}"
+            info += f"{round(model.voltage * 1000):04X}"
+            info += f"{round(model.capacity_remain * 100):04X}"
+            info += "03"
+            info += f"{round(model.capacity * 100):04X}"
+            info += f"{model.cycles:04X}"
+            info += f"{round(model.capacity * 100):04X}"
+            info = info.ljust(144, "0")
+        elif cid2 == b"44":
+            # no warnings and no protections
+            info = f"0001{model.cell_count:02X}" + "00" * model.cell_count + "06"
+            info = info.ljust(78, "0")
+        elif cid2 == b"C1":
+            info = hex_string("PACE SIM " + model.software_version, 20)
+        elif cid2 == b"C2":
+            info = hex_string(model.serial_number, 40)
+        else:
+            return self.build_frame("", "04")
+
+        return self.build_frame(info)
@@ -0,0 +1,260 @@
+# -*- coding: utf-8 -*-
+from typing import Union
+
+from .model import BatteryModel
+
+
+class Protocol:
+    """
+    Base class of a simulated BMS protocol.
+
+    A protocol splits the received bytes into requests and builds the replies from the battery model.
+    Bytes which do not belong to a valid request (e.g. requests of other drivers while the port is scanned)
+    are skipped, like a real BMS would do.
+    """
+
+    NAME: str = ""
+    """
+    Name of the battery type in `BMS_TYPE`
+    """
+
+    BAUD: int = 9600
+    """
+    Baud rate the driver uses. A pseudo-terminal ignores it, but it is shown to the user
+    """
+
+    ADDRESS: bytes = b""
+    """
+    Default address of the BMS
+    """
+
+    CELL_COUNT: int = 16
+    """
+    Default cell count of the simulated battery
+    """
+
+    START: bytes = b""
+    """
+    Start of a request
+    """
+
+    def __init__(self, model: BatteryModel, address: Union[bytes, None] = None):
+        self.model = model
+        self.address = address if address is not None else self.ADDRESS
+        self.buffer = bytearray()
+
+        self.requests: int = 0
+        self.skipped_bytes: int = 0
+
+    def feed(self, data: bytes) -> bytes:
+        """
+        Add received bytes and return the replies to all complete requests.
+
+        :param data: Received bytes
+        :return: Bytes to send back
+        """
+        self.buffer.extend(data)
+        replies = bytearray()
+
+        while True:
+            start = self.buffer.find(self.START) if self.START else 0
+            if start < 0:
+                # keep a possibly incomplete start sequence
+                keep = len(self.START) - 1
+                self.skipped_bytes += max(0, len(self.buffer) - keep)
+                del self.buffer[: max(0, len(self.buffer) - keep)]
+                break
+
+            self.skipped_bytes += start
+            del self.buffer[:start]
+
+            length = self.request_length(self.buffer)
+            if length is None or length > len(self.buffer):
+                break
+
+            request = bytes(self.buffer[:length])
+
+            if length == 0 or not self.is_valid(request):
+                # no valid request at this start byte, search for the next one
+                self.skipped_bytes += 1
+                del self.buffer[:1]
+                continue
+
+            del self.buffer[:length]
+            self.requests += 1
+
+            self.model.update()
+            reply = self.reply(request)
+            if reply:
+                replies.extend(reply)
+
+        return bytes(replies)
+
+    def request_length(self, buffer: bytearray) -> Union[int, None]:
+        """
+        Get the length of the request at the start of the buffer.
+
+        :param buffer: Received bytes, starting with `START`
+        :return: Length of the request, None if more bytes are needed or 0 if it is not a valid request
+        """
+        raise NotImplementedError
+
+    def is_valid(self, request: bytes) -> bool:
+        """
+        Check the checksum and the address of a complete request.
+
+        :param request: Request
+        :return: True if the request is addressed to this BMS and valid
+        """
+        return True
+
+    def reply(self, request: bytes) -> Union[bytes, None]:
+        """
+        Build the reply to a request.
+
+        :param request: Request
+        :return: Reply or None, if the BMS does not reply
+        """
+        raise NotImplementedError
+
+
+def modbus_crc(data: bytes) -> bytes:
+    """
+    Calculate the Modbus RTU CRC16.
+
+    :param data: Data
+    :return: CRC as little endian bytes
+    """
+    crc = 0xFFFF
+    for byte in data:
+        crc ^= byte
+        for _ in range(8):
+            if crc & 1:
+                crc = (crc >> 1) ^ 0xA001
+            else:
+                crc >>= 1
+    return crc.to_bytes(2, "little")
+
+
+class ModbusProtocol(Protocol):
+    """
+    Modbus RTU protocol which answers "read holding registers" (0x03) from a register map.
+    """
+
+    def __init__(self, model: BatteryModel, address: Union[bytes, None] = None):
+        super().__init__(model, address)
+        self.START = self.address
+
+    def request_length(self, buffer: bytearray) -> Union[int, None]:
+        if len(buffer) < 7:
+            return None
+
+        if buffer[1] == 0x10:
+            # write multiple registers
+            return 9 + buffer[6]
+
+        return 8
+
+    def is_valid(self, request: bytes) -> bool:
+        return modbus_crc(request[:-2]) == request[-2:]
+
+    def reply(self, request: bytes) -> Union[bytes, None]:
+        if request[1] != 0x03:
+            return None
+
+        register = int.from_bytes(request[2:4], "big")
+        count = int.from_bytes(request[4:6], "big")
+
+        registers = self.registers()
+        data = b"".join(registers.get(register + index, 0).to_bytes(2, "big", signed=False) for index in range(count))
+
+        frame = self.address + b"\x03" + bytes([len(data) & 0xFF]) + data
+        return frame + modbus_crc(frame)
+
+    def registers(self) -> dict:
+        """
+        Get the current register values.
+
+        :return: Dictionary with the register number as key and the unsigned 16 bit value as value
+        """
+        raise NotImplementedError
+
+
+def to_registers(value: int, count: int = 1) -> list:
+    """
+    Split a (signed) integer into 16 bit big endian register values.
+
+    :param value: Value
+    :param count: Number of registers
+    :return: List of unsigned register values
+    """
+    value &= (1 << (16 * count)) - 1
+    return [(value >> (16 * (count - 1 - index))) & 0xFFFF for index in range(count)]
+
+
+def string_to_registers(value: str, count: int) -> list:
+    """
+    Convert a string into register values, padded with null bytes.
+
+    :param value: String
+    :param count: Number of registers
+    :return: List of unsigned register values
+    """
+    data = value.encode("ascii")[: count * 2].ljust(count * 2, b"\x00")
+    return [int.from_bytes(data[index : index + 2], "big") for index in range(0, len(data), 2)]
+
+
+class AsciiHexProtocol(Protocol):
+    """
+    Protocol with ASCII hex frames like `~20004642E00201FD35\\r`, which is used by Pace, Seplos and Daren.
+    """
+
+    START = b"~"
+
+    VERSION: str = "20"
+    """
+    Protocol version in the frame header
+    """
+
+    CID1: str = "46"
+
+    def request_length(self, buffer: bytearray) -> Union[int, None]:
+        end = buffer.find(b"\r")
+        if end < 0:
+            # a request is never that long, probably a missing end byte
+            return 0 if len(buffer) > 256 else None
+        return end + 1
+
+    def is_valid(self, request: bytes) -> bool:
+        try:
+            return self.checksum(request[1:-5]) == int(request[-5:-1], 16) and request[3:5].decode() == self.address.hex().upper()
+        except ValueError:
+            return False
+
+    @staticmethod
+    def checksum(frame: bytes) -> int:
+        return (~sum(frame) + 1) & 0xFFFF
+
+    @staticmethod
+    def length_field(length: int) -> int:
+        """
+        Calculate the LENGTH field with the length checksum in the upper 4 bits.
+
+        :param length: Length of the info in characters
+        :return: LENGTH field
+        """
+        if length == 0:
+            return 0
+        lchksum = (~((length & 0xF) + ((length >> 4) & 0xF) + ((length >> 8) & 0xF)) + 1) & 0xF
+        return (lchksum << 12) + length
+
+    def build_frame(self, info: str, rtn: str = "00") -> bytes:
+        """
+        Build a reply frame.
+
+        :param info: Info as hex string
+        :param rtn: Return code
+        :return: Frame
+        """
+        frame = f"{self.VERSION}{self.address.hex().upper()}{self.CID1}{rtn}{self.length_field(len(info)):04X}{info}".encode("ascii")
+        return b"~" + frame + f"{self.checksum(frame):04X}\r".encode("ascii")
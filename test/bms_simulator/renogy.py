@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+from .protocol import ModbusProtocol, string_to_registers, to_registers
+
+
+class RenogySimulator(ModbusProtocol):
+    """
+    Renogy smart battery (RS485 Modbus), 12 V with 4 cells.
+    """
+
+    NAME = "Renogy"
+    BAUD = 9600
+    ADDRESS = b"\x30"
+    CELL_COUNT = 4
+
+    def registers(self) -> dict:
+        model = self.model
+        registers = {5000: model.cell_count}
+
+        for index, voltage in enumerate(model.cell_voltages):
+            registers[5001 + index] = round(voltage * 10)
+            registers[5018 + index] = round(model.temperatures[index % len(model.temperatures)] * 10)
+
+        registers[5037] = round(model.temperature_mos * 10)
+        registers[5040] = round(model.temperatures[0] * 10)
+        values = [
+            (5042, to_registers(round(model.current * 100))),
+            (5043, to_registers(round(model.voltage * 10))),
+            (5044, to_registers(round(model.capacity_remain * 1000), 2)),
+            (5046, to_registers(round(model.capacity * 1000), 2)),
+            (5110, string_to_registers(model.serial_number, 8)),
+            (5122, string_to_registers("RBT100LFP12SH", 8)),
+            (5130, string_to_registers("0102", 2)),
+            (5132, string_to_registers("RENOGY", 8)),
+        ]
+        for register, words in values:
+            for index, word in enumerate(words):
+                registers[register + index] = word
+
+        return registers
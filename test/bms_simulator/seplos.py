@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+from typing import Union
+
+from .protocol import AsciiHexProtocol
+
+
+class SeplosSimulator(AsciiHexProtocol):
+    """
+    Seplos BMS (RS485), protocol version 2.0.
+
+    Only the telemetry (0x42) and the alarm (0x44) commands are answered.
+    """
+
+    NAME = "Seplos"
+    BAUD = 19200
+    ADDRESS = b"\x00"
+    VERSION = "20"
+
+    def reply(self, request: bytes) -> Union[bytes, None]:
+        model = self.model
+        cid2 = request[7:9]
+
+        if cid2 == b"42":
+            info = f"0001{model.cell_count:02X}"
+            info += "".join(f"{round(voltage * 1000):04X}" for voltage in model.cell_voltages)
+            # 4 cell temperatures, environment and power temperature in 0.1 K
+            temperatures = model.temperatures + [model.temperatures[0], model.temperature_mos]
+            info += f"{len(temperatures):02X}" + "".join(f"{round(temperature * 10 + 2731):04X}" for temperature in temperatures)
+            info += f"{round(model.current * 100) & 0xFFFF:04X}"
+            info += f"{round(model.voltage * 100):04X}"
+            info += f"{round(model.capacity_remain * 100):04X}"
+            info += "0A"
+            info += f"{round(model.capacity * 100):04X}"
+            info += f"{round(model.soc * 10):04X}"
+            info += f"{round(model.capacity * 100):04X}"
+            info += f"{model.cycles:04X}"
+            # state of health and port voltage
+            info += f"{1000:04X}" + f"{round(model.voltage * 100):04X}"
+            info = info.ljust(150, "0")
+        elif cid2 == b"44":
+            alarm = bytearray(49)
+            alarm[1] = 1
+            alarm[2] = model.cell_count
+            alarm[19] = 6
+            # bit 0 discharge switch, bit 1 charge switch
+            alarm[35] = (1 if model.discharge_fet else 0) | (2 if model.charge_fet else 0)
+            info = alarm.hex().upper()
+        else:
+            return self.build_frame("", "04")
+
+        return self.build_frame(info)